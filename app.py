@@ -1,11 +1,32 @@
-from fastapi import FastAPI, HTTPException
-from market import MarketAPI
-from trades import TradeStorage
 from dotenv import load_dotenv
-from typing import Optional, Union
+
+# Before the project imports, some of which read their settings at import time
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException, Request, Query
+from market import MarketAPI, AsyncMarketAPI
+from trades import TradeStorage, CursorError, CANDLE_RESOLUTIONS, WALLET_RANKINGS
+from backfill import TradeBackfill
+from cache import TradeCache
+from scheduler import SyncScheduler
+from wallets import WalletProfiler
+from maintenance import StorageMaintenance
+from stream import TradeStream
+from scanner import MarketScanner
+from warmup import Warmup
+from catalog import CatalogIngester, CatalogRefresher, CATALOG_PATH, ingested as catalog_ingested
+from formats import negotiate, arrow_response, sse_event, sse_comment, JSON_MEDIA_TYPE, EVENT_STREAM_MEDIA_TYPE
+from metrics import RequestMetricsMiddleware, RESPONSE_ROWS, stage, latest, watch_event_loop
+from fastapi.responses import Response, JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+import pyarrow as pa
+from typing import Optional, Union, Iterator, Callable
 from contextlib import asynccontextmanager
 import logging
 import polars as pl
+import itertools
+import asyncio
+import json
 import os
 
 logging.basicConfig(
@@ -14,97 +35,388 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 logger = logging.getLogger("polymarket.api")
-load_dotenv()
+
+CATALOG_WARMUP_CAP = int(os.getenv("CATALOG_WARMUP_CAP", "10000"))
+# Served even while warming up: liveness, readiness and metrics
+WARMUP_EXEMPT_ROUTES = {"/", "/ready", "/metrics"}
+WARMUP_WAIT_TIMEOUT = float(os.getenv("WARMUP_WAIT_TIMEOUT", "30"))
+
+async def warm_up() -> None:
+    """
+    Open the trade database, start the background services, then fill the
+    catalog if it is missing and keep it refreshed
+    """
+    global catalog_refresher
+    if not await warmup.step("storage", tstorage.open):
+        return
+    if os.getenv("SCHEDULER_ENABLED", "true").lower() == "true":
+        scheduler.start()
+    if os.getenv("WALLET_PROFILER_ENABLED", "true").lower() == "true":
+        profiler.start()
+    if os.getenv("STORAGE_MAINTENANCE_ENABLED", "true").lower() == "true":
+        maintenance.start()
+    # Open markets first: the scanner works on them, and they resolve into the closed ones.
+    # Either is ingested again if an earlier start was stopped before it finished
+    for closed in (False, True):
+        if catalog_ingested(CATALOG_PATH, closed):
+            continue
+        ingester = CatalogIngester(MarketAPI(), root=CATALOG_PATH)
+        await warmup.step(
+            f"catalog-{'closed' if closed else 'open'}", ingester.ingest, CATALOG_WARMUP_CAP, closed,
+            progress=lambda ingester=ingester: ingester.written, total=CATALOG_WARMUP_CAP,
+            cancel=ingester.cancel,
+        )
+    if os.getenv("CATALOG_REFRESH_ENABLED", "true").lower() == "true":
+        catalog_refresher = CatalogRefresher(
+            CatalogIngester(MarketAPI(), root=CATALOG_PATH),
+            interval=float(os.getenv("CATALOG_REFRESH_INTERVAL", "900")),
+        )
+        catalog_refresher.start()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup: only what is needed to serve; everything slow is in warm_up
     logger.info("FastAPI application starting up...")
-    if not os.path.exists("data.parquet"):
-        write_data(market, out="data.parquet", cap=10_000, closed=True)
+    warmup.start(warm_up)
+    loop_watcher = asyncio.create_task(watch_event_loop())
+    stream.start()
     logger.info("FastAPI application initialized")
     yield
     # Shutdown (if needed)
     logger.info("FastAPI application shutting down...")
+    loop_watcher.cancel()
+    await warmup.stop()
+    await scheduler.stop()
+    await profiler.stop()
+    await maintenance.stop()
+    if catalog_refresher is not None:
+        await catalog_refresher.stop()
+    await stream.stop()
+    await amarket.aclose()
+    tstorage.close()
 
 app = FastAPI(lifespan=lifespan)
-market = MarketAPI()
+warmup = Warmup(required=("storage",))
+amarket = AsyncMarketAPI(rate_limit=float(os.getenv("UPSTREAM_RATE_LIMIT", "20")))
 tstorage = TradeStorage()
+backfill = TradeBackfill(amarket, tstorage)
+cache = TradeCache(backfill, tstorage)
+scheduler = SyncScheduler(amarket, cache, workers=int(os.getenv("SCHEDULER_WORKERS", "4")))
+stream = TradeStream(cache, poll_interval=float(os.getenv("STREAM_POLL_INTERVAL", "5")))
+scanner = MarketScanner(tstorage, catalog_root=CATALOG_PATH)
+profiler = WalletProfiler(cache, catalog_root=CATALOG_PATH, crawl_top=int(os.getenv("WALLET_CRAWL_TOP", "500")))
+# Built by warm_up, so importing the app creates no upstream client or catalog connection
+catalog_refresher: Optional[CatalogRefresher] = None
+maintenance = StorageMaintenance(
+    tstorage, catalog_root=CATALOG_PATH,
+    interval=float(os.getenv("STORAGE_MAINTENANCE_INTERVAL", "21600")),
+    min_age=float(os.getenv("ARCHIVE_MIN_AGE", "86400")),
+)
+
+app.add_middleware(RequestMetricsMiddleware)
+
+@app.middleware("http")
+async def wait_for_warmup(request: Request, call_next):
+    # Hold requests until the database is open rather than block the event loop on it
+    if not warmup.ready and request.url.path not in WARMUP_EXEMPT_ROUTES:
+        try:
+            await asyncio.wait_for(warmup.wait(), WARMUP_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return JSONResponse(status_code=503, content=jsonable_encoder(warmup.status()),
+                                headers={"Retry-After": "5"})
+    return await call_next(request)
 
 @app.get("/")
 async def root():
+    """Liveness: the process is up and serving"""
     logger.debug("Root endpoint accessed")
     return {"message": "Hello World"}
 
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    """Readiness and warmup progress; 503 until the trade database is open"""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=jsonable_encoder(warmup.status()))
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """Prometheus metrics"""
+    content, media_type = latest()
+    return Response(content=content, media_type=media_type)
+
+def json_response(content: Union[list, dict], route: str, rows: int) -> JSONResponse:
+    """Encode `content` as JSON here rather than in FastAPI so encoding time is measured"""
+    RESPONSE_ROWS.labels(route, JSON_MEDIA_TYPE).observe(rows)
+    with stage(route, "serialize"):
+        return JSONResponse(content=jsonable_encoder(content))
+
+def table_response(table: pa.Table, route: str, media_type: str) -> Response:
+    RESPONSE_ROWS.labels(route, media_type).observe(table.num_rows)
+    with stage(route, "serialize"):
+        return arrow_response(table, media_type)
+
+def stream_response(first: pa.RecordBatch, rest: Iterator[pa.RecordBatch],
+                    route: str, media_type: str) -> Response:
+    """Stream record batches as they are read; the rows are counted once the last one is sent"""
+    def batches() -> Iterator[pa.RecordBatch]:
+        rows = 0
+        for batch in itertools.chain([first], rest):
+            rows += batch.num_rows
+            yield batch
+        RESPONSE_ROWS.labels(route, media_type).observe(rows)
+
+    return arrow_response(pa.RecordBatchReader.from_batches(first.schema, batches()), media_type)
+
 @app.get('/markets/{condition_id}')
-async def get_market_trades(condition_id: str) -> Union[list, dict]:
-    logger.info(f"Fetching market trades for condition_id: {condition_id}")
-    trades_df: pl.DataFrame = tstorage.get_trades_df(condition_id)
-    if not trades_df.is_empty():
-        logger.info(f"Returning {trades_df.height} cached trades")
-        return trades_df.to_dicts()
-    
-    logger.info(f"No trades found in storage for condition_id: {condition_id}, fetching from market API")
-    trades: Optional[Union[list, dict]] = market.get_trades_for_market(condition_id, limit=100)
-    if trades is None:
-        logger.warning(f"Failed to fetch trades for condition_id: {condition_id}")
+async def get_market_trades(condition_id: str, request: Request) -> Union[list, dict]:
+    """
+    Trades for a market. JSON by default; send an Accept header of
+    application/vnd.apache.arrow.stream (or .file), application/vnd.apache.parquet
+    or application/x-ndjson to get Arrow IPC, Parquet or NDJSON, streamed as the
+    trades are read.
+    """
+    route = "/markets/{condition_id}"
+    logger.info("Fetching market trades for condition_id: %s", condition_id)
+    media_type = negotiate(request.headers.get("accept"))
+    with stage(route, "sync"):
+        status = await cache.ensure(condition_id)
+    if media_type != JSON_MEDIA_TYPE:
+        batches = tstorage.iter_trades_arrow(condition_id)
+        with stage(route, "storage"):
+            first = await asyncio.to_thread(next, batches, None)
+        if first is None:
+            logger.warning("Failed to fetch trades for condition_id: %s", condition_id)
+            raise HTTPException(status_code=404, detail=f"No trades found for condition_id: {condition_id}")
+        logger.info("Streaming trades as %s (cache %s)", media_type, status)
+        return stream_response(first, batches, route, media_type)
+
+    with stage(route, "storage"):
+        trades_df: pl.DataFrame = await asyncio.to_thread(tstorage.get_trades_df, condition_id)
+    if trades_df.is_empty():
+        logger.warning("Failed to fetch trades for condition_id: %s", condition_id)
         raise HTTPException(status_code=404, detail=f"No trades found for condition_id: {condition_id}")
-    
-    logger.debug(f"Successfully fetched trades for condition_id: {condition_id}")
-    # Save to storage
-    tstorage.insert_trades(trades)
-    
-    # Return as list of dicts
-    if isinstance(trades, dict):
-        return [trades]
-    return trades
+
+    logger.info("Returning %s trades (cache %s)", trades_df.height, status)
+    return json_response(trades_df.to_dicts(), route, trades_df.height)
+
+MAX_PAGE_SIZE = 5_000
+# Latest accepted start/end, in unix seconds (9999-12-31T23:59:59)
+MAX_TIMESTAMP = 253_402_300_799
+# Most buckets returned by one candles or features request
+MAX_BUCKETS = 50_000
+
+def trades_page_response(table: pa.Table, next_cursor: Optional[str], media_type: str,
+                         route: str) -> Union[dict, Response]:
+    """A page of trades in the negotiated format; binary formats carry the cursor in X-Next-Cursor"""
+    if media_type != JSON_MEDIA_TYPE:
+        response = table_response(table, route, media_type)
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+    return json_response(
+        {"trades": pl.from_arrow(table).to_dicts(), "next_cursor": next_cursor}, route, table.num_rows
+    )
+
+async def query_trades_page(**kwargs) -> tuple[pa.Table, Optional[str]]:
+    """`TradeStorage.query_trades` in a worker thread, answering a malformed cursor with a 400"""
+    try:
+        return await asyncio.to_thread(tstorage.query_trades, **kwargs)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/markets/{condition_id}/trades")
+async def get_market_trades_page(condition_id: str, request: Request,
+                                 start: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                                 end: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                                 cursor: Optional[str] = None,
+                                 limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE)) -> dict:
+    """Trades for a market within [start, end) (unix seconds), newest first, paginated by cursor"""
+    route = "/markets/{condition_id}/trades"
+    logger.info("Fetching trades page for condition_id: %s, start: %s, end: %s", condition_id, start, end)
+    with stage(route, "sync"):
+        await cache.ensure(condition_id)
+    with stage(route, "storage"):
+        table, next_cursor = await query_trades_page(condition_id=condition_id, start=start, end=end, cursor=cursor, limit=limit)
+    return trades_page_response(table, next_cursor, negotiate(request.headers.get("accept")), route)
+
+@app.get("/users/{address}/trades")
+async def get_user_trades(address: str, request: Request,
+                          start: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                          end: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                          cursor: Optional[str] = None,
+                          limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE)) -> dict:
+    """Trades made by a wallet across all markets within [start, end), newest first, paginated by cursor"""
+    route = "/users/{address}/trades"
+    logger.info("Fetching trades page for user: %s, start: %s, end: %s", address, start, end)
+    with stage(route, "sync"):
+        await cache.ensure_user(address)
+    with stage(route, "storage"):
+        table, next_cursor = await query_trades_page(wallet=address, start=start, end=end, cursor=cursor, limit=limit)
+    return trades_page_response(table, next_cursor, negotiate(request.headers.get("accept")), route)
+
+@app.get("/users/leaderboard")
+async def get_wallet_leaderboard(order_by: str = "realized_pnl",
+                                 limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                                 min_resolved: int = 0) -> list:
+    """Wallets ranked by realized PnL, win rate, volume, trades, resolved markets or concentration"""
+    logger.info("Fetching wallet leaderboard by %s", order_by)
+    if order_by not in WALLET_RANKINGS:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of {', '.join(WALLET_RANKINGS)}")
+    with stage("/users/leaderboard", "storage"):
+        return await asyncio.to_thread(profiler.leaderboard, order_by=order_by, limit=limit, min_resolved=min_resolved)
+
+@app.get("/users/{address}")
+async def get_wallet_profile(address: str, top_n: int = Query(10, ge=1, le=MAX_PAGE_SIZE)) -> dict:
+    """Realized PnL, win rate, average entry price and concentration for a wallet"""
+    route = "/users/{address}"
+    logger.info("Fetching wallet profile for %s", address)
+    with stage(route, "sync"):
+        await cache.ensure_user(address)
+    with stage(route, "storage"):
+        profile = await asyncio.to_thread(profiler.profile, address, top_n=top_n)
+    if profile is None:
+        logger.warning("No trades found for wallet: %s", address)
+        raise HTTPException(status_code=404, detail=f"No trades found for wallet: {address}")
+    return profile
+
+async def buckets_response(kind: str, fetch: Callable[..., pa.Table], condition_id: str, request: Request,
+                           resolution: str, **kwargs) -> Union[JSONResponse, Response]:
+    """Per-bucket rows of a market (candles or features) from `fetch`, after syncing it, in the negotiated format"""
+    logger.info("Fetching %s %s for condition_id: %s", resolution, kind, condition_id)
+    if resolution not in CANDLE_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(CANDLE_RESOLUTIONS)}")
+    route = f"/markets/{{condition_id}}/{kind}"
+    with stage(route, "sync"):
+        await cache.ensure(condition_id)
+    with stage(route, "storage"):
+        table = await asyncio.to_thread(fetch, condition_id, resolution=resolution, **kwargs)
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type != JSON_MEDIA_TYPE:
+        return table_response(table, route, media_type)
+    return json_response(table.to_pylist(), route, table.num_rows)
+
+@app.get("/markets/{condition_id}/candles")
+async def get_market_candles(condition_id: str, request: Request,
+                             resolution: str = "1h",
+                             start: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                             end: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                             limit: int = Query(5_000, ge=1, le=MAX_BUCKETS)) -> Union[list, dict]:
+    """
+    The latest OHLCV candles (1m, 1h or 1d) for a market, oldest first, priced as
+    the probability of outcome 0
+    """
+    return await buckets_response("candles", tstorage.get_candles, condition_id, request,
+                                  resolution, start=start, end=end, limit=limit)
+
+@app.get("/markets/{condition_id}/features")
+async def get_market_features(condition_id: str, request: Request,
+                              resolution: str = "1h",
+                              start: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                              end: Optional[int] = Query(None, ge=0, le=MAX_TIMESTAMP),
+                              limit: int = Query(5_000, ge=1, le=MAX_BUCKETS)) -> Union[list, dict]:
+    """
+    Order-flow features for the latest 1m, 1h or 1d buckets of a market, oldest
+    first: imbalance, net flow in outcome 0 terms, trade-size distribution,
+    price impact and trade spacing
+    """
+    return await buckets_response("features", tstorage.get_features, condition_id, request,
+                                  resolution, start=start, end=end, limit=limit)
+
+@app.get("/analytics/correlations")
+async def get_correlations(top: int = 50, min_abs: float = 0.0, same_event: bool = False) -> dict:
+    """
+    Market pairs whose price changes were most correlated over the scanner's
+    trailing window, with the correlation over the window before it
+    """
+    logger.info("Fetching correlations, top: %s, min_abs: %s", top, min_abs)
+    with stage("/analytics/correlations", "storage"):
+        result = await scanner.latest()
+    pairs = [
+        p for p in result["correlations"]
+        if abs(p["correlation"]) >= min_abs and (p["same_event"] or not same_event)
+    ]
+    return {
+        "generated_at": result["generated_at"],
+        "resolution": result["resolution"],
+        "window": result["window"],
+        "markets": result["markets"],
+        "pairs": pairs[:top],
+    }
+
+@app.get("/analytics/arbitrage")
+async def get_arbitrage(min_deviation: float = 0.0) -> dict:
+    """
+    negRisk events whose outcome prices do not sum to 1, largest deviation
+    first; a positive deviation means the outcomes are overpriced together
+    """
+    logger.info("Fetching event arbitrage, min_deviation: %s", min_deviation)
+    with stage("/analytics/arbitrage", "storage"):
+        result = await scanner.latest()
+    events = [
+        e for e in result["events"]
+        if e["deviation"] is not None and abs(e["deviation"]) >= min_deviation
+    ]
+    return {"generated_at": result["generated_at"], "resolution": result["resolution"], "events": events}
+
+@app.get("/markets/{condition_id}/stream")
+async def stream_market_trades(condition_id: str,
+                               heartbeat: float = Query(15.0, ge=1, le=300)) -> StreamingResponse:
+    """
+    Server-sent events carrying each batch of new trades for a market as soon as
+    it is stored (`event: trades`, data is a JSON list like /markets/{condition_id}).
+    All subscribers to a market share one upstream poller.
+    """
+    logger.info("Opening trade stream for condition_id: %s", condition_id)
+
+    async def events():
+        yield sse_comment("subscribed")
+        async for table in stream.subscribe(condition_id, heartbeat=heartbeat):
+            if table is None:
+                yield sse_comment("keepalive")
+                continue
+            RESPONSE_ROWS.labels("/markets/{condition_id}/stream", EVENT_STREAM_MEDIA_TYPE).observe(table.num_rows)
+            yield sse_event(json.dumps(jsonable_encoder(table.to_pylist())), event="trades")
+
+    return StreamingResponse(
+        events(),
+        media_type=EVENT_STREAM_MEDIA_TYPE,
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/markets/{condition_id}/user-distribution")
-async def get_user_distribution(condition_id: str) -> Union[list, dict]:
-    logger.info(f"Fetching user distribution for condition_id: {condition_id}")
-    trades = market.get_trades_for_market(condition_id)
-    if trades is None:
-        logger.warning(f"No trades found for condition_id: {condition_id}")
+async def get_user_distribution(condition_id: str, top_n: int = Query(10, ge=1, le=MAX_PAGE_SIZE)) -> dict:
+    route = "/markets/{condition_id}/user-distribution"
+    logger.info("Fetching user distribution for condition_id: %s", condition_id)
+    with stage(route, "sync"):
+        await cache.ensure(condition_id)
+    with stage(route, "storage"):
+        distribution = await asyncio.to_thread(tstorage.get_user_distribution, condition_id, top_n=top_n)
+    if distribution is None:
+        logger.warning("No trades found for condition_id: %s", condition_id)
         raise HTTPException(status_code=404, detail=f"No trades found for condition_id: {condition_id}")
-    logger.debug(f"Successfully fetched user distribution for condition_id: {condition_id}")
-    return trades
+    logger.debug("Successfully computed user distribution for condition_id: %s", condition_id)
+    return distribution
 
 
 @app.get("/markets/{condition_id}/stats")
-async def get_market_stats(condition_id: str) ->Union[list, dict]: 
-    logger.info(f"Fetching market stats for condition_id: {condition_id}")
-    trades = market.get_trades_for_market(condition_id)
-    if trades is None:
-        logger.warning(f"No trades found for stats, condition_id: {condition_id}")
+async def get_market_stats(condition_id: str) -> dict:
+    route = "/markets/{condition_id}/stats"
+    logger.info("Fetching market stats for condition_id: %s", condition_id)
+    with stage(route, "sync"):
+        await cache.ensure(condition_id)
+    with stage(route, "storage"):
+        stats = await asyncio.to_thread(tstorage.get_market_stats, condition_id)
+    if stats is None:
+        logger.warning("No trades found for stats, condition_id: %s", condition_id)
         raise HTTPException(status_code=404, detail=f"No trades found for condition_id: {condition_id}")
-    logger.debug(f"Successfully fetched stats for condition_id: {condition_id}")
-    return trades
+    logger.debug("Successfully computed stats for condition_id: %s", condition_id)
+    return stats
 
     
 def write_data(market: MarketAPI, out: str, cap: int = 10_000, closed: bool = False) -> None:
-    logger.info(f"Starting data write to {out}, cap: {cap}, closed: {closed}")
-    count = 0
-    all_records = []
-    while count < cap:
-        logger.debug(f"Fetching markets batch, offset: {count}")
-        response = market.get_markets(limit=500, offset=count, closed=closed).json()
-        # If the API returns a dict with a key like 'markets', adjust this accordingly
-        if isinstance(response, dict) and 'markets' in response:
-            records = response['markets']
-        else:
-            records = response
-        if not records:
-            break
-        all_records.extend(records)
-        logger.info(f"Appended {len(records)} records at offset {count}")
-        if len(records) < 500:
-            # Last batch, no more data
-            break
-        count += 500
-    if all_records:
-        df = pl.DataFrame(all_records)
-        df.write_parquet(out)
-        logger.info(f"Written {len(all_records)} records to {out} as parquet.")
-    else:
+    """Stream up to `cap` markets into the partitioned catalog dataset at `out`"""
+    logger.info("Starting data write to %s, cap: %s, closed: %s", out, cap, closed)
+    count = CatalogIngester(market, root=out).ingest(cap=cap, closed=closed)
+    if not count:
         logger.warning("No data fetched to write as parquet.")
-    logger.info(f"Completed data write to {out}")
+    logger.info("Completed data write to %s", out)
@@ -0,0 +1,166 @@
+from typing import Optional, Callable, Awaitable
+from market import AsyncMarketAPI
+from trades import TradeStorage, decode_trades
+import polars as pl
+import asyncio
+import logging
+
+logger = logging.getLogger("polymarket.backfill")
+
+
+class TradeBackfill:
+    """
+    Pages a market's full trade history into TradeStorage and keeps it up to date.
+
+    The data API returns trades newest first. The first sync for a market walks
+    every `offset` page until the history is exhausted, saving the next offset
+    after each window of pages so an interrupted walk resumes where it stopped.
+    Once complete, later syncs only read from offset 0 until they reach the
+    stored high-water mark, so closed markets cost a single request to refresh.
+
+    Wallet histories (`sync_user`) work the same way, with their cursor stored
+    under `user_key(address)`.
+
+    Storage calls run in worker threads: an insert also folds the page into the
+    derived tables, which would otherwise stall every other request.
+
+    A sync given a `committed` event sets it once the first window of pages is
+    stored and visible to readers (or, for a complete history, once the sync is
+    done), so a caller can serve the newest trades while the walk continues.
+    """
+    def __init__(self, market: AsyncMarketAPI, storage: TradeStorage,
+                 page_size: int = 500,
+                 concurrency: int = 4):
+        self.market = market
+        self.storage = storage
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.logger = logger
+
+    async def sync(self, condition_id: str, committed: Optional[asyncio.Event] = None) -> int:
+        """
+        Fetch every trade for condition_id that is not stored yet.
+
+        Returns:
+            int: The number of trades fetched from the data API.
+        """
+        return await self._sync(
+            condition_id, committed,
+            lambda offsets: self.market.get_trades_for_market_pages(condition_id, offsets, limit=self.page_size, raw=True),
+            lambda offset: self.market.get_trades_for_market(condition_id, limit=self.page_size, offset=offset, raw=True),
+        )
+
+    async def sync_user(self, address: str, committed: Optional[asyncio.Event] = None) -> int:
+        """
+        Fetch every trade made by the wallet `address` that is not stored yet.
+
+        Returns:
+            int: The number of trades fetched from the data API.
+        """
+        return await self._sync(
+            user_key(address), committed,
+            lambda offsets: self.market.get_trades_for_user_pages(address, offsets, limit=self.page_size, raw=True),
+            lambda offset: self.market.get_trades_for_user(address, limit=self.page_size, offset=offset, raw=True),
+        )
+
+    async def _sync(self, key: str,
+                    committed: Optional[asyncio.Event],
+                    fetch_pages: Callable[[range], Awaitable[list]],
+                    fetch_page: Callable[[int], Awaitable[Optional[list]]]) -> int:
+        state = await asyncio.to_thread(self.storage.get_sync_state, key) or {
+            "backfill_offset": 0,
+            "backfill_complete": False,
+            "high_water": None,
+        }
+        fetched = 0
+        if not state["backfill_complete"]:
+            fetched += await self._backfill(key, state, fetch_pages, committed)
+        if state["backfill_complete"]:
+            fetched += await self._sync_head(key, state, fetch_page)
+        # Make the new trades visible to readers before returning
+        await asyncio.to_thread(self.storage.flush)
+        if committed is not None:
+            committed.set()
+        return fetched
+
+    async def _backfill(self, key: str, state: dict,
+                        fetch_pages: Callable[[range], Awaitable[list]],
+                        committed: Optional[asyncio.Event] = None) -> int:
+        offset = state["backfill_offset"]
+        high_water = state["high_water"]
+        fetched = 0
+        self.logger.info("Backfilling trades for %s from offset %s", key, offset)
+        while not state["backfill_complete"]:
+            offsets = range(offset, offset + self.concurrency * self.page_size, self.page_size)
+            pages = await fetch_pages(offsets)
+            failed = False
+            for page in pages:
+                if page is None:
+                    failed = True
+                    break
+                try:
+                    page = decode_trades(page)
+                except ValueError as e:
+                    self.logger.warning("Unexpected trades page for %s at offset %s: %s", key, offset, e)
+                    failed = True
+                    break
+                if page.height:
+                    await asyncio.to_thread(self.storage.insert_trades, page)
+                    fetched += page.height
+                    high_water = _max_timestamp(page, high_water)
+                offset += self.page_size
+                if page.height < self.page_size:
+                    state["backfill_complete"] = True
+                    break
+            state["backfill_offset"] = offset
+            state["high_water"] = high_water
+            await asyncio.to_thread(self.storage.save_sync_state, key, offset, state["backfill_complete"], high_water)
+            if committed is not None and not committed.is_set():
+                await asyncio.to_thread(self.storage.flush)
+                committed.set()
+            if failed:
+                self.logger.warning("Backfill for %s interrupted at offset %s, will resume", key, offset)
+                break
+        self.logger.info("Backfilled %s trades for %s", fetched, key)
+        return fetched
+
+    async def _sync_head(self, key: str, state: dict,
+                         fetch_page: Callable[[int], Awaitable[Optional[list]]]) -> int:
+        high_water = state["high_water"]
+        newest = high_water
+        offset = 0
+        fetched = 0
+        while True:
+            page = await fetch_page(offset)
+            try:
+                page = None if page is None else decode_trades(page)
+            except ValueError as e:
+                self.logger.warning("Unexpected trades page for %s at offset %s: %s", key, offset, e)
+                page = None
+            if page is None:
+                # Leave the high-water mark alone so the gap is refetched next time
+                self.logger.warning("Incremental sync for %s interrupted at offset %s", key, offset)
+                return fetched
+            # Keep trades sharing the high-water second; duplicates are ignored on insert
+            new = page if high_water is None else page.filter(pl.col("timestamp") >= high_water)
+            if new.height:
+                await asyncio.to_thread(self.storage.insert_trades, new)
+                fetched += new.height
+                newest = _max_timestamp(new, newest)
+            if new.height < page.height or page.height < self.page_size:
+                break
+            offset += self.page_size
+        state["high_water"] = newest
+        await asyncio.to_thread(self.storage.save_sync_state, key, state["backfill_offset"], True, newest)
+        self.logger.info("Fetched %s new trades for %s", fetched, key)
+        return fetched
+
+
+def user_key(address: str) -> str:
+    """sync_state key for a wallet's trade history"""
+    return f"user:{address.lower()}"
+
+
+def _max_timestamp(trades: pl.DataFrame, current: Optional[int]) -> Optional[int]:
+    newest = trades["timestamp"].max()
+    return newest if current is None else max(current, newest)
@@ -0,0 +1,187 @@
+"""
+Local stand-in for the Polymarket gamma and data APIs.
+
+Replays the recorded `/markets` and `/trades` payloads in `bench/fixtures`,
+optionally scaled up: every fixture market is cloned `markets` times under new
+condition ids and each market gets `trades` synthetic trades, generated page by
+page from the recorded ones so millions of trades never sit in memory. Latency
+and 429 responses can be injected to exercise the client's rate limiting and
+backoff.
+
+Point the app at it with GAMMA_API_URL and DATA_API_URL:
+
+    python bench/fake_api.py --trades 1000000 --latency 0.05 --error-rate 0.01
+"""
+from typing import Optional
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+import argparse
+import asyncio
+import hashlib
+import logging
+import random
+import json
+import os
+
+logger = logging.getLogger("polymarket.bench.fake_api")
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Newest synthetic trade, and the spacing between consecutive trades of a market
+NEWEST_TIMESTAMP = 1_760_000_000
+TRADE_INTERVAL = 7
+WALLETS = 5_000
+
+
+class FakePolymarket:
+    """Deterministic synthetic data built from the recorded fixtures"""
+    def __init__(self, fixtures: str = FIXTURES_PATH,
+                 markets: int = 1,
+                 trades: Optional[int] = None,
+                 seed: int = 0):
+        with open(os.path.join(fixtures, "markets.json")) as f:
+            self.templates = json.load(f)
+        with open(os.path.join(fixtures, "trades.json")) as f:
+            self.trade_templates = json.load(f)
+        self.seed = seed
+        self.markets = [
+            self._clone_market(template, copy)
+            for copy in range(markets)
+            for template in self.templates
+        ]
+        self.by_condition_id = {m["conditionId"]: m for m in self.markets}
+        # Without a scale-up each market replays just the recorded trades
+        self.trades_per_market = trades if trades is not None else len(self.trade_templates)
+        self.wallets = [_hex(f"wallet:{seed}:{i}", 40) for i in range(WALLETS)]
+
+    def get_markets(self, limit: int, offset: int, closed: Optional[bool] = None,
+                    order: Optional[str] = None, ascending: bool = True) -> list:
+        markets = self.markets
+        if closed is not None:
+            markets = [m for m in markets if bool(m.get("closed")) == closed]
+        if order is not None:
+            markets = sorted(markets, key=lambda m: _sort_key(m.get(order)), reverse=not ascending)
+        return markets[offset:offset + limit]
+
+    def get_trades(self, limit: int, offset: int,
+                   market: Optional[str] = None, user: Optional[str] = None) -> list:
+        """Trades newest first, like the data API"""
+        if market is not None:
+            if market not in self.by_condition_id:
+                return []
+            keys = (market, None)
+        else:
+            keys = (None, user)
+        end = min(offset + limit, self.trades_per_market)
+        return [self.trade(*keys, i) for i in range(offset, end)]
+
+    def trade(self, condition_id: Optional[str], user: Optional[str], i: int) -> dict:
+        """The i-th newest trade of a market, or of a wallet across all markets"""
+        rng = random.Random(f"{self.seed}:{condition_id or user}:{i}")
+        if condition_id is None:
+            condition_id = self.markets[i % len(self.markets)]["conditionId"]
+        market = self.by_condition_id[condition_id]
+        trade = dict(self.trade_templates[i % len(self.trade_templates)])
+        outcome_index = rng.randrange(2)
+        trade.update({
+            "proxyWallet": user or rng.choice(self.wallets),
+            "side": rng.choice(("BUY", "SELL")),
+            "conditionId": condition_id,
+            "size": round(rng.lognormvariate(3, 1.5), 2),
+            "price": round(rng.uniform(0.01, 0.99), 4),
+            "timestamp": NEWEST_TIMESTAMP - i * TRADE_INTERVAL,
+            "title": market.get("question"),
+            "slug": market.get("slug"),
+            "outcome": ("Yes", "No")[outcome_index],
+            "outcomeIndex": outcome_index,
+            "transactionHash": "0x" + _hex(f"{condition_id}:{user}:{i}", 64),
+        })
+        return trade
+
+    def _clone_market(self, template: dict, copy: int) -> dict:
+        if copy == 0:
+            return template
+        market = dict(template)
+        market["id"] = f"{template['id']}-{copy}"
+        market["conditionId"] = "0x" + _hex(f"{template['conditionId']}:{copy}", 64)
+        market["slug"] = f"{template['slug']}-{copy}"
+        return market
+
+
+def create_app(fake: FakePolymarket, latency: float = 0.0, error_rate: float = 0.0,
+               retry_after: float = 1.0) -> FastAPI:
+    """
+    Serve `fake` with `latency` seconds (+/- 20% jitter) added to every response
+    and a fraction `error_rate` of responses replaced by 429s with Retry-After
+    """
+    app = FastAPI()
+    app.state.stats = {"requests": 0, "throttled": 0}
+
+    async def delay() -> Optional[JSONResponse]:
+        app.state.stats["requests"] += 1
+        if latency:
+            await asyncio.sleep(latency * random.uniform(0.8, 1.2))
+        if error_rate and random.random() < error_rate:
+            app.state.stats["throttled"] += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429,
+                                headers={"Retry-After": str(retry_after)})
+        return None
+
+    @app.get("/markets")
+    async def markets(limit: int = 20, offset: int = 0,
+                      closed: Optional[bool] = None,
+                      order: Optional[str] = None,
+                      ascending: bool = True):
+        return await delay() or fake.get_markets(limit, offset, closed, order, ascending)
+
+    @app.get("/markets/slug/{slug}")
+    async def market_by_slug(slug: str):
+        throttled = await delay()
+        if throttled:
+            return throttled
+        for market in fake.markets:
+            if market.get("slug") == slug:
+                return market
+        return JSONResponse({"error": "not found"}, status_code=404)
+
+    @app.get("/trades")
+    async def trades(limit: int = 100, offset: int = 0,
+                     market: Optional[str] = None,
+                     user: Optional[str] = None,
+                     takerOnly: Optional[bool] = Query(None)):
+        return await delay() or fake.get_trades(limit, offset, market=market, user=user)
+
+    @app.get("/_stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def _hex(key: str, length: int) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()[:length]
+
+
+def _sort_key(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a fake Polymarket gamma/data API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--fixtures", default=FIXTURES_PATH)
+    parser.add_argument("--markets", type=int, default=1, help="copies of each fixture market")
+    parser.add_argument("--trades", type=int, default=None, help="synthetic trades per market")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    fake = FakePolymarket(args.fixtures, markets=args.markets, trades=args.trades, seed=args.seed)
+    uvicorn.run(create_app(fake, latency=args.latency, error_rate=args.error_rate),
+                host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,46 @@
+"""
+Record live gamma `/markets` and data `/trades` payloads as fixtures for the
+fake API:
+
+    python bench/record.py --markets 50 --trades 500
+"""
+import argparse
+import logging
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market import MarketAPI
+from fake_api import FIXTURES_PATH
+
+logger = logging.getLogger("polymarket.bench.record")
+
+
+def record(out: str, markets: int, trades: int) -> None:
+    market = MarketAPI()
+    response = market.get_markets(limit=markets, order="volume24hr", ascending=False)
+    response.raise_for_status()
+    records = response.json()
+    # Trades of the most active market, so every field is populated
+    condition_id = records[0]["conditionId"]
+    payload = market.get_trades_for_market(condition_id, limit=trades)
+    if payload is None:
+        raise RuntimeError(f"Failed to fetch trades for {condition_id}")
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, "markets.json"), "w") as f:
+        json.dump(records, f, indent=1)
+    with open(os.path.join(out, "trades.json"), "w") as f:
+        json.dump(payload, f, indent=1)
+    logger.info("Recorded %s markets and trades for %s into %s", len(records), condition_id, out)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Record live Polymarket payloads as fixtures")
+    parser.add_argument("--out", default=FIXTURES_PATH)
+    parser.add_argument("--markets", type=int, default=50)
+    parser.add_argument("--trades", type=int, default=500)
+    args = parser.parse_args()
+    record(args.out, args.markets, args.trades)
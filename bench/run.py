@@ -0,0 +1,284 @@
+"""
+Benchmarks for trade ingest, backfill and the API endpoints, run against the
+fake Polymarket API in `fake_api.py` so results are repeatable and offline.
+
+    python bench/run.py --trades 1000000 --latency 0.02
+    python bench/run.py --compare bench/results/<previous>.json
+
+Results are written to `bench/results/<timestamp>-<revision>.json`. Memory per
+request is the Python heap peak seen by tracemalloc; allocations made natively
+by DuckDB and Arrow are not included.
+"""
+from typing import Optional, Callable
+import numpy as np
+import argparse
+import tempfile
+import platform
+import subprocess
+import threading
+import tracemalloc
+import asyncio
+import logging
+import socket
+import json
+import time
+import gc
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_api import FakePolymarket, create_app
+import uvicorn
+import httpx
+
+logger = logging.getLogger("polymarket.bench")
+
+RESULTS_PATH = os.path.join(ROOT, "bench", "results")
+
+
+class FakeServer:
+    """Runs the fake API with uvicorn on a background thread"""
+    def __init__(self, fake: FakePolymarket, latency: float = 0.0, error_rate: float = 0.0):
+        self.app = create_app(fake, latency=latency, error_rate=error_rate)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(self.app, port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "FakeServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+    @property
+    def stats(self) -> dict:
+        return dict(self.app.state.stats)
+
+
+def bench_ingest(fake: FakePolymarket, condition_id: str, workdir: str, page_size: int) -> dict:
+    """Raw `/trades` pages through TradeStorage.insert_trades, upstream excluded"""
+    from trades import TradeStorage
+
+    pages = [
+        json.dumps(fake.get_trades(page_size, offset, market=condition_id)).encode()
+        for offset in range(0, fake.trades_per_market, page_size)
+    ]
+    path = os.path.join(workdir, "ingest.duckdb")
+    storage = TradeStorage(path=path, shared=False)
+    start = time.perf_counter()
+    for page in pages:
+        storage.insert_trades(page)
+    storage.flush()
+    elapsed = time.perf_counter() - start
+    storage.close()
+    rows = fake.trades_per_market
+    return {
+        "rows": rows,
+        "pages": len(pages),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed),
+        "db_bytes": os.path.getsize(path),
+    }
+
+
+def bench_backfill(server: FakeServer, condition_id: str, db_path: str, page_size: int) -> dict:
+    """A full TradeBackfill.sync of one market over HTTP from the fake API"""
+    from market import AsyncMarketAPI
+    from trades import TradeStorage
+    from backfill import TradeBackfill
+
+    async def run() -> int:
+        market = AsyncMarketAPI(backoff_base=0.05, backoff_max=1.0)
+        try:
+            return await TradeBackfill(market, storage, page_size=page_size).sync(condition_id)
+        finally:
+            await market.aclose()
+
+    storage = TradeStorage(path=db_path, shared=False)
+    before = server.stats
+    start = time.perf_counter()
+    rows = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    storage.close()
+    after = server.stats
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else None,
+        "upstream_requests": after["requests"] - before["requests"],
+        "upstream_throttled": after["throttled"] - before["throttled"],
+    }
+
+
+def endpoints(condition_id: str) -> dict:
+    """Benchmarked requests by name: (path, Accept header)"""
+    arrow = "application/vnd.apache.arrow.stream"
+    return {
+        "market_json": (f"/markets/{condition_id}", None),
+        "market_arrow": (f"/markets/{condition_id}", arrow),
+        "market_parquet": (f"/markets/{condition_id}", "application/vnd.apache.parquet"),
+        "trades_page_json": (f"/markets/{condition_id}/trades?limit=1000", None),
+        "trades_page_arrow": (f"/markets/{condition_id}/trades?limit=1000", arrow),
+        "candles_1h": (f"/markets/{condition_id}/candles?resolution=1h", None),
+        "candles_1m": (f"/markets/{condition_id}/candles?resolution=1m", None),
+        "stats": (f"/markets/{condition_id}/stats", None),
+        "user_distribution": (f"/markets/{condition_id}/user-distribution", None),
+    }
+
+
+def bench_endpoints(condition_id: str, requests: int, only: Optional[list] = None) -> dict:
+    """
+    p50/p99 latency and peak Python memory per request for each endpoint, called
+    in-process through the ASGI app so the network is not measured
+    """
+    import app as api
+
+    async def run() -> dict:
+        results = {}
+        transport = httpx.ASGITransport(app=api.app)
+        async with api.app.router.lifespan_context(api.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for name, (path, accept) in endpoints(condition_id).items():
+                    if only and name not in only:
+                        continue
+                    headers = {"accept": accept} if accept else {}
+                    request = lambda: client.get(path, headers=headers)
+                    results[name] = await _measure(request, requests)
+                    logger.info("%s: %s", name, results[name])
+        return results
+
+    return asyncio.run(run())
+
+
+async def _measure(request: Callable, requests: int) -> dict:
+    # Warm up caches and the first-call sync before timing anything
+    response = await request()
+    response.raise_for_status()
+    timings = []
+    size = len(response.content)
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await request()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await request()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    ms = np.array(timings) * 1000
+    return {
+        "requests": requests,
+        "response_bytes": size,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "peak_python_bytes": peak,
+    }
+
+
+def revision() -> str:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{rev}-dirty" if dirty else rev
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def versions() -> dict:
+    import duckdb, polars, pyarrow, fastapi
+    return {
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "polars": polars.__version__,
+        "pyarrow": pyarrow.__version__,
+        "fastapi": fastapi.__version__,
+    }
+
+
+def compare(current: dict, previous: dict, path: tuple = ()) -> None:
+    """Print the relative change of every numeric result shared with `previous`"""
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            compare(value, old or {}, path + (key,))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            change = (value - old) / old * 100
+            print(f"{'.'.join(path + (key,)):<50} {old:>14,.3f} -> {value:>14,.3f} ({change:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ingest, backfill and endpoints against the fake API")
+    parser.add_argument("--trades", type=int, default=200_000, help="synthetic trades per market")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake API fraction of 429s")
+    parser.add_argument("--requests", type=int, default=30, help="timed requests per endpoint")
+    parser.add_argument("--only", nargs="*", help="endpoint names to benchmark")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["ingest", "backfill", "endpoints"])
+    parser.add_argument("--out", default=RESULTS_PATH)
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    args = parser.parse_args()
+
+    fake = FakePolymarket(trades=args.trades)
+    condition_id = fake.markets[0]["conditionId"]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, FakeServer(fake, args.latency, args.error_rate) as server:
+        # Configure the app before anything reads these at import or construction time
+        os.environ.update({
+            "GAMMA_API_URL": server.url,
+            "DATA_API_URL": server.url,
+            "TRADES_DB_PATH": os.path.join(workdir, "trades.duckdb"),
+            "TRADES_DB_MODE": "single",
+            "CATALOG_PATH": os.path.join(workdir, "catalog"),
+            # No background syncs, crawls, archiving or catalog refreshes competing with the timed requests
+            "SCHEDULER_ENABLED": "false",
+            "WALLET_PROFILER_ENABLED": "false",
+            "STORAGE_MAINTENANCE_ENABLED": "false",
+            "CATALOG_REFRESH_ENABLED": "false",
+        })
+        if "ingest" not in args.skip:
+            results["ingest"] = bench_ingest(fake, condition_id, workdir, args.page_size)
+            logger.info("ingest: %s", results['ingest'])
+        if "backfill" not in args.skip:
+            results["backfill"] = bench_backfill(server, condition_id, os.environ["TRADES_DB_PATH"], args.page_size)
+            logger.info("backfill: %s", results['backfill'])
+        if "endpoints" not in args.skip:
+            results["endpoints"] = bench_endpoints(condition_id, args.requests, args.only)
+
+    timestamp = time.strftime("%Y%m%dT%H%M%S")
+    report = {
+        "revision": revision(),
+        "timestamp": timestamp,
+        "versions": versions(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": results,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{timestamp}-{report['revision']}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("Wrote %s", path)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    main()
@@ -0,0 +1,117 @@
+from typing import Optional, Callable, Awaitable
+from datetime import datetime
+from backfill import TradeBackfill, user_key
+from trades import TradeStorage
+from metrics import CACHE_REQUESTS
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("polymarket.cache")
+
+
+class TradeCache:
+    """
+    Stale-while-revalidate layer in front of TradeBackfill.
+
+    A market's stored trades are fresh for a TTL measured from its last sync:
+    `hot_ttl` if it traded within `hot_window` seconds, `cold_ttl` otherwise, so
+    open markets are refreshed often and dormant ones almost never. Stale markets
+    are served from storage straight away while a background sync catches up.
+    Only markets that were never synced make the caller wait, and only until the
+    newest window of their history is stored; the rest of the walk continues in
+    the background. Concurrent refreshes of one market share a single in-flight
+    sync.
+    """
+    def __init__(self, backfill: TradeBackfill, storage: TradeStorage,
+                 hot_ttl: float = 30.0,
+                 cold_ttl: float = 3600.0,
+                 hot_window: float = 86400.0):
+        self.backfill = backfill
+        self.storage = storage
+        self.hot_ttl = hot_ttl
+        self.cold_ttl = cold_ttl
+        self.hot_window = hot_window
+        self._inflight: dict[str, asyncio.Task] = {}
+        # Set once the in-flight sync of a key has stored its first window
+        self._committed: dict[str, asyncio.Event] = {}
+        self.logger = logger
+
+    def ttl(self, state: dict) -> float:
+        """Seconds the trades synced under `state` stay fresh"""
+        high_water: Optional[int] = state["high_water"]
+        if high_water is None or time.time() - high_water < self.hot_window:
+            return self.hot_ttl
+        return self.cold_ttl
+
+    def is_fresh(self, state: dict) -> bool:
+        if not state["backfill_complete"] or state["synced_at"] is None:
+            return False
+        age = (datetime.now() - state["synced_at"]).total_seconds()
+        return age < self.ttl(state)
+
+    async def ensure(self, condition_id: str) -> str:
+        """
+        Make stored trades for condition_id servable.
+
+        Returns:
+            str: "hit" if the stored trades are fresh, "stale" if they are served
+            while a background sync runs, or "miss" if the caller waited for the
+            first window of a new sync.
+        """
+        return await self._ensure(condition_id, lambda committed: self.backfill.sync(condition_id, committed))
+
+    async def ensure_user(self, address: str) -> str:
+        """Like `ensure`, for the trade history of the wallet `address`"""
+        return await self._ensure(user_key(address), lambda committed: self.backfill.sync_user(address, committed))
+
+    async def refresh(self, condition_id: str) -> int:
+        """Sync condition_id, joining the in-flight sync if there is one"""
+        # Shield so a disconnecting client doesn't cancel a sync other requests are waiting on
+        return await asyncio.shield(self._start(condition_id, lambda committed: self.backfill.sync(condition_id, committed)))
+
+    async def refresh_user(self, address: str) -> int:
+        """Like `refresh`, for the trade history of the wallet `address`"""
+        return await asyncio.shield(self._start(user_key(address), lambda committed: self.backfill.sync_user(address, committed)))
+
+    async def _ensure(self, key: str, sync: Callable[[asyncio.Event], Awaitable[int]]) -> str:
+        state = await asyncio.to_thread(self.storage.get_sync_state, key)
+        if state is None:
+            CACHE_REQUESTS.labels("miss").inc()
+            self.logger.info("Cache miss for %s, syncing", key)
+            task = self._start(key, sync)
+            committed = self._committed[key]
+            waiter = asyncio.ensure_future(committed.wait())
+            try:
+                # Unlike awaiting it, waiting leaves the sync running if this request is cancelled
+                await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            if not committed.is_set():
+                # The sync failed before storing anything
+                task.result()
+            return "miss"
+        if self.is_fresh(state):
+            CACHE_REQUESTS.labels("hit").inc()
+            return "hit"
+        CACHE_REQUESTS.labels("stale").inc()
+        self.logger.info("Serving stale trades for %s, revalidating in background", key)
+        self._start(key, sync)
+        return "stale"
+
+    def _start(self, key: str, sync: Callable[[asyncio.Event], Awaitable[int]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            committed = asyncio.Event()
+            task = asyncio.create_task(sync(committed))
+            self._inflight[key] = task
+            self._committed[key] = committed
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._committed[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("Error syncing trades for %s: %s", key, task.exception())
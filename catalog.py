@@ -0,0 +1,369 @@
+from typing import Optional
+from datetime import datetime
+from market import MarketAPI
+import polars as pl
+import duckdb
+import threading
+import asyncio
+import logging
+import shutil
+import glob
+import json
+import os
+
+logger = logging.getLogger("polymarket.catalog")
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "catalog")
+
+# Gamma market fields kept in the catalog, with the type each is stored as
+CATALOG_SCHEMA = {
+    "id": pl.Utf8,
+    "conditionId": pl.Utf8,
+    "question": pl.Utf8,
+    "slug": pl.Utf8,
+    "eventId": pl.Utf8,
+    "eventSlug": pl.Utf8,
+    "negRisk": pl.Boolean,
+    "active": pl.Boolean,
+    "closed": pl.Boolean,
+    "startDate": pl.Utf8,
+    "endDate": pl.Utf8,
+    "closedTime": pl.Utf8,
+    "updatedAt": pl.Utf8,
+    "volume": pl.Float64,
+    "volume24hr": pl.Float64,
+    "liquidity": pl.Float64,
+    "outcomes": pl.Utf8,
+    "outcomePrices": pl.Utf8,
+    "clobTokenIds": pl.Utf8,
+}
+DATE_COLUMNS = ["startDate", "endDate", "closedTime", "updatedAt"]
+PARTITION_COLUMNS = ["closed", "end_month"]
+# File under the catalog root naming the directory of the current dataset version
+CURRENT_FILE = "CURRENT"
+
+
+def normalize_markets(records: list) -> pl.DataFrame:
+    """
+    Flatten a page of gamma /markets records into the catalog schema.
+
+    Adds the `end_month` (YYYY-MM of endDate) partition column.
+    """
+    rows = []
+    for record in records:
+        event = (record.get("events") or [{}])[0]
+        row = {}
+        for column, dtype in CATALOG_SCHEMA.items():
+            value = record.get(column)
+            if column == "eventId":
+                value = event.get("id")
+            elif column == "eventSlug":
+                value = event.get("slug")
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value)
+            if value is not None and dtype == pl.Float64:
+                value = float(value)
+            elif value is not None and dtype == pl.Utf8:
+                value = str(value)
+            row[column] = value
+        rows.append(row)
+    df = pl.DataFrame(rows, schema=CATALOG_SCHEMA)
+    return df.with_columns(
+        # Gamma mixes ISO dates ("...Z") and Postgres-style offsets ("...+00")
+        pl.col(column).str.replace(r"\+00$", "+00:00").str.replace(" ", "T")
+          .str.to_datetime(time_zone="UTC", strict=False)
+          .dt.replace_time_zone(None)
+        for column in DATE_COLUMNS
+    ).with_columns(
+        pl.col("closed").fill_null(False),
+        pl.col("endDate").dt.strftime("%Y-%m").fill_null("unknown").alias("end_month"),
+    )
+
+
+def dataset_path(root: str = CATALOG_PATH) -> str:
+    """
+    The directory of the current catalog dataset version under `root`, or `root`
+    itself for a catalog written before datasets were versioned
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        return root
+
+
+def ingested(root: str = CATALOG_PATH, closed: Optional[bool] = None) -> bool:
+    """
+    Whether an initial ingest of the open (closed=False), closed (True) or all
+    (None) markets into the catalog at `root` ran to the end or to its cap
+    """
+    def marker(closed: Optional[bool]) -> bool:
+        return os.path.exists(os.path.join(root, _ingested_marker(closed)))
+
+    if marker(None) or marker(closed):
+        return True
+    return closed is None and marker(False) and marker(True)
+
+
+def _ingested_marker(closed: Optional[bool]) -> str:
+    return f".ingested-{'all' if closed is None else 'closed' if closed else 'open'}"
+
+
+def catalog_sql(root: str = CATALOG_PATH) -> str:
+    """
+    SQL relation over the current catalog dataset with one row per market (the
+    latest `updatedAt` wins when an incremental refresh has not been compacted yet)
+    """
+    return f"""(
+        SELECT * FROM read_parquet(
+            '{dataset_path(root)}/**/*.parquet',
+            hive_partitioning = true,
+            hive_types = {{'closed': BOOLEAN, 'end_month': VARCHAR}},
+            union_by_name = true
+        )
+        QUALIFY row_number() OVER (PARTITION BY id ORDER BY updatedAt DESC NULLS LAST) = 1
+    )"""
+
+
+def resolutions_sql(root: str = CATALOG_PATH) -> str:
+    """
+    SQL relation of resolved markets (`condition_id`, winning `outcome_index`),
+    read from the settled `outcomePrices` of closed markets in the catalog.
+    Empty when the catalog has not been ingested yet.
+    """
+    if not glob.glob(f"{dataset_path(root)}/**/*.parquet", recursive=True):
+        return "(SELECT NULL::VARCHAR AS condition_id, NULL::INTEGER AS outcome_index WHERE false)"
+    return f"""(
+        SELECT condition_id, outcome_index
+        FROM (
+            SELECT
+                conditionId AS condition_id,
+                list_position(
+                    list_transform(from_json(outcomePrices, '["VARCHAR"]'), p -> TRY_CAST(p AS DOUBLE) >= 0.99),
+                    true
+                ) - 1 AS outcome_index
+            FROM {catalog_sql(root)}
+            WHERE closed AND conditionId IS NOT NULL
+        )
+        WHERE outcome_index IS NOT NULL
+    )"""
+
+
+class CatalogIngester:
+    """
+    Streams the gamma market catalog into a Hive-partitioned Parquet dataset
+    (`closed=.../end_month=YYYY-MM/*.parquet`).
+
+    Each `get_markets` page is written as soon as it arrives, so memory use is one
+    page regardless of catalog size, and DuckDB prunes partitions on `closed` and
+    `end_month` filters.
+
+    The dataset lives in a version directory under `root` named by its CURRENT
+    file. Compaction writes a new version and switches CURRENT to it in one
+    rename, so readers always find a complete dataset; the version it replaced is
+    kept until the next compaction for readers still on it. An ingest that runs
+    to the end (or its cap) leaves a marker, see `ingested`, so one that was
+    interrupted is started over rather than taken for a complete catalog.
+
+    `written` counts the markets written by the running `ingest`, and `cancel`
+    stops it after the page in flight, so it can run in a worker thread.
+    """
+    def __init__(self, market: MarketAPI, root: str = CATALOG_PATH, page_size: int = 500):
+        self.market = market
+        self.root = root
+        self.page_size = page_size
+        self.conn = duckdb.connect()
+        self.written = 0
+        self._cancelled = threading.Event()
+        self.logger = logger
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def exists(self) -> bool:
+        """Whether the dataset holds any markets, even from an ingest that did not finish"""
+        dataset = dataset_path(self.root)
+        return os.path.isdir(dataset) and any(
+            name.endswith(".parquet") for _, _, files in os.walk(dataset) for name in files
+        )
+
+    def ingested(self, closed: Optional[bool] = None) -> bool:
+        return ingested(self.root, closed)
+
+    def ingest(self, cap: int = 10_000, closed: Optional[bool] = None, **kwargs) -> int:
+        """
+        Write up to `cap` markets, one page at a time. Unless it is cancelled, a
+        page fails or `kwargs` narrow it further, reaching the end or the cap
+        marks these markets as ingested, see `ingested`.
+
+        Returns:
+            int: The number of markets written.
+        """
+        self.logger.info("Ingesting up to %s markets into %s, closed: %s", cap, self.root, closed)
+        count = self.written = 0
+        complete = True
+        while count < cap:
+            if self._cancelled.is_set():
+                self.logger.info("Ingest cancelled after %s markets", count)
+                complete = False
+                break
+            records = self._fetch_page(offset=count, closed=closed, **kwargs)
+            if records is None:
+                complete = False
+                break
+            if not records:
+                break
+            self._write_df(normalize_markets(records))
+            count += len(records)
+            self.written = count
+            self.logger.info("Wrote %s markets at offset %s", len(records), count - len(records))
+            if len(records) < self.page_size:
+                # Last batch, no more data
+                break
+        if complete and not kwargs:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, _ingested_marker(closed)), "w"):
+                pass
+        self.logger.info("Ingested %s markets into %s", count, self.root)
+        return count
+
+    def refresh(self, closed: Optional[bool] = None) -> int:
+        """
+        Write only markets updated since the newest `updatedAt` in the dataset,
+        then compact so each market appears once. If the initial ingest of these
+        markets did not finish, it is run again instead: the markets it never
+        reached are older than the watermark.
+
+        Returns:
+            int: The number of markets written.
+        """
+        if not self.ingested(closed):
+            count = self.ingest(closed=closed)
+            self.compact()
+            return count
+        watermark = self.watermark()
+        if watermark is None:
+            return 0
+        self.logger.info("Refreshing markets updated after %s", watermark)
+        count = 0
+        offset = 0
+        while True:
+            records = self._fetch_page(offset=offset, closed=closed, order="updatedAt", ascending=False)
+            if not records:
+                break
+            df = normalize_markets(records)
+            updated = df.filter(pl.col("updatedAt") > watermark)
+            if updated.height:
+                self._write_df(updated)
+                count += updated.height
+            if updated.height < df.height or len(records) < self.page_size:
+                break
+            offset += self.page_size
+        if count:
+            self.compact()
+        self.logger.info("Refreshed %s markets in %s", count, self.root)
+        return count
+
+    def watermark(self) -> Optional[datetime]:
+        """The newest `updatedAt` in the dataset, or None if it is empty"""
+        if not self.exists():
+            return None
+        return self.conn.execute(
+            f"SELECT max(updatedAt) FROM read_parquet('{dataset_path(self.root)}/**/*.parquet', union_by_name = true)"
+        ).fetchone()[0]
+
+    def compact(self) -> None:
+        """
+        Rewrite the dataset with one row per market and one file per partition,
+        as a new version
+        """
+        if not self.exists():
+            return
+        replaced = dataset_path(self.root)
+        version = datetime.now().strftime("v%Y%m%dT%H%M%S%f")
+        self.conn.execute(f"""
+            COPY (SELECT * FROM {catalog_sql(self.root)})
+            TO '{os.path.join(self.root, version)}'
+            (FORMAT parquet, PARTITION_BY ({", ".join(PARTITION_COLUMNS)}), COMPRESSION zstd)
+        """)
+        self._set_current(version)
+        # Versions left by an earlier compaction or a crashed one; the one just
+        # replaced may still be read (for an unversioned catalog, its partitions)
+        for name in os.listdir(self.root):
+            if name.startswith(".") or name in (CURRENT_FILE, version):
+                continue
+            if (replaced == self.root and "=" in name) or os.path.join(self.root, name) == replaced:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        # Left behind by compactions that swapped whole directories
+        for stale in (f"{self.root}.compact", f"{self.root}.old"):
+            shutil.rmtree(stale, ignore_errors=True)
+        self.logger.info("Compacted %s into %s", self.root, version)
+
+    def _set_current(self, version: str) -> None:
+        tmp = os.path.join(self.root, f".{CURRENT_FILE}.tmp")
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(self.root, CURRENT_FILE))
+
+    def _fetch_page(self, offset: int, **kwargs) -> Optional[list]:
+        self.logger.debug("Fetching markets batch, offset: %s", offset)
+        response = self.market.get_markets(limit=self.page_size, offset=offset, **kwargs)
+        if response is None or not response.ok:
+            self.logger.warning("Failed to fetch markets at offset %s", offset)
+            return None
+        data = response.json()
+        # If the API returns a dict with a key like 'markets', adjust this accordingly
+        if isinstance(data, dict) and 'markets' in data:
+            return data['markets']
+        return data
+
+    def _write_df(self, df: pl.DataFrame) -> None:
+        if not self.exists() and dataset_path(self.root) == self.root:
+            # A new catalog starts out versioned
+            os.makedirs(self.root, exist_ok=True)
+            self._set_current(datetime.now().strftime("v%Y%m%dT%H%M%S%f"))
+        self.conn.register("catalog_page", df)
+        try:
+            self.conn.execute(f"""
+                COPY catalog_page TO '{dataset_path(self.root)}'
+                (FORMAT parquet, PARTITION_BY ({", ".join(PARTITION_COLUMNS)}), APPEND, COMPRESSION zstd)
+            """)
+        finally:
+            self.conn.unregister("catalog_page")
+
+
+class CatalogRefresher:
+    """
+    Keeps the catalog current: every `interval` seconds the markets updated since
+    the newest `updatedAt` in the dataset (new markets, price moves, closings and
+    resolutions, open or closed) are written and the dataset is compacted, see
+    `CatalogIngester.refresh`.
+    """
+    def __init__(self, ingester: CatalogIngester, interval: float = 900.0):
+        self.ingester = ingester
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.logger = logger
+
+    def start(self) -> None:
+        if self._task is None:
+            self.logger.info("Starting catalog refresh every %ss", self.interval)
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> int:
+        return await asyncio.to_thread(self.ingester.refresh)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.logger.error("Error refreshing catalog: %s", e)
@@ -2,11 +2,16 @@ import streamlit as st
 import requests
 import os
 import pandas as pd
+import pyarrow as pa
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Tuple, Union
 
 load_dotenv()
 
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+TRADES_PAGE_SIZE = 1_000
+MAX_LOADED_TRADES = 50_000
+
 # Page configuration (must be first Streamlit command)
 st.set_page_config(
     page_title="Polymarket Dashboard",
@@ -19,63 +24,83 @@ if "api_url" not in st.session_state:
     st.session_state.api_url = os.getenv("APP_URL", "http://localhost:8000")
 if "condition_id" not in st.session_state:
     st.session_state.condition_id = ""
-if "data_cache" not in st.session_state:
-    st.session_state.data_cache = {}
+if "trades" not in st.session_state:
+    # Raw trades loaded so far for the current market: condition_id, Arrow table, next cursor
+    st.session_state.trades = None
 
-# Cached function for API requests
-@st.cache_data(ttl=60)  # Cache for 60 seconds
-def fetch_endpoint(api_url: str, endpoint: str) -> Optional[dict]:
-    """Fetch data from FastAPI endpoint with caching"""
-    try:
-        url = f"{api_url.rstrip('/')}{endpoint}"
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.ConnectionError:
-        return {"error": f"Could not connect to API at {api_url}"}
-    except requests.exceptions.Timeout:
-        return {"error": "Request timed out. The API may be slow or unresponsive."}
-    except requests.exceptions.HTTPError as e:
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One HTTP session shared by every rerun and browser tab, so connections are reused"""
+    return requests.Session()
+
+def _get(api_url: str, endpoint: str, params: Optional[dict] = None,
+         accept: Optional[str] = None) -> requests.Response:
+    headers = {"Accept": accept} if accept else {}
+    response = get_session().get(f"{api_url.rstrip('/')}{endpoint}", params=params, headers=headers, timeout=30)
+    response.raise_for_status()
+    return response
+
+def _error(e: Exception, api_url: str) -> str:
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return f"Could not connect to API at {api_url}"
+    if isinstance(e, requests.exceptions.Timeout):
+        return "Request timed out. The API may be slow or unresponsive."
+    if isinstance(e, requests.exceptions.HTTPError):
         error_msg = f"HTTP Error: {e}"
-        if hasattr(e.response, 'status_code') and e.response.status_code == 404:
+        if e.response is not None and e.response.status_code == 404:
             error_msg += " - The endpoint may not exist or the condition ID might be invalid."
-        return {"error": error_msg}
+        return error_msg
+    return f"Unexpected error: {e}"
+
+# Cached API requests: only small, pre-aggregated payloads go through JSON
+@st.cache_data(ttl=60)
+def fetch_json(api_url: str, endpoint: str, params: Optional[dict] = None) -> Union[dict, list]:
+    """Fetch a JSON endpoint, returning {"error": ...} on failure"""
+    try:
+        return _get(api_url, endpoint, params).json()
+    except Exception as e:
+        return {"error": _error(e, api_url)}
+
+@st.cache_data(ttl=60)
+def fetch_arrow(api_url: str, endpoint: str,
+                params: Optional[dict] = None) -> Tuple[Optional[pa.Table], Optional[str], Optional[str]]:
+    """
+    Fetch an endpoint as Arrow IPC.
+
+    Returns:
+        (table, next_cursor, error): next_cursor comes from X-Next-Cursor on paginated endpoints.
+    """
+    try:
+        response = _get(api_url, endpoint, params, accept=ARROW_MEDIA_TYPE)
+        table = pa.ipc.open_stream(response.content).read_all()
+        return table, response.headers.get("x-next-cursor"), None
     except Exception as e:
-        return {"error": f"Unexpected error: {e}"}
+        return None, None, _error(e, api_url)
+
+def show_metrics(data: dict, keys: list):
+    """Render selected scalar fields of a summary as metrics"""
+    metrics = [(k, data[k]) for k in keys if data.get(k) is not None]
+    cols = st.columns(min(len(metrics), 4) or 1)
+    for idx, (key, value) in enumerate(metrics):
+        with cols[idx % len(cols)]:
+            if isinstance(value, float):
+                value = f"{value:,.4f}" if value < 1 else f"{value:,.2f}"
+            st.metric(key.replace("_", " ").title(), value)
 
-def display_data(data: dict, title: str = "Response Data"):
-    """Display data in JSON and table formats"""
-    if "error" in data:
-        st.error(f"❌ {data['error']}")
+def load_trades_page(condition_id: str, cursor: Optional[str]):
+    """Append the next page of raw trades for condition_id to the session"""
+    table, next_cursor, error = fetch_arrow(
+        st.session_state.api_url,
+        f"/markets/{condition_id}/trades",
+        {"limit": TRADES_PAGE_SIZE, **({"cursor": cursor} if cursor else {})},
+    )
+    if error:
+        st.error(f"❌ {error}")
         return
-    
-    st.success("✅ Data fetched successfully!")
-    st.subheader(title)
-    st.json(data)
-    
-    # Try to display as table if it's a list
-    if isinstance(data, list) and len(data) > 0:
-        try:
-            df = pd.json_normalize(data)
-            st.subheader("Data Table")
-            st.dataframe(df, use_container_width=True)
-            
-            # Show summary if applicable
-            if len(df) > 0:
-                st.caption(f"Total records: {len(df)}")
-        except Exception:
-            st.info("Could not convert to table format")
-    
-    # Display metrics if it's a dict with simple values
-    elif isinstance(data, dict):
-        metrics = {k: v for k, v in data.items() 
-                   if not isinstance(v, (dict, list))}
-        if metrics:
-            st.subheader("Key Metrics")
-            cols = st.columns(min(len(metrics), 3))
-            for idx, (key, value) in enumerate(metrics.items()):
-                with cols[idx % len(cols)]:
-                    st.metric(key.replace("_", " ").title(), value)
+    loaded = st.session_state.trades
+    if loaded is not None and loaded["condition_id"] == condition_id and cursor:
+        table = pa.concat_tables([loaded["table"], table])
+    st.session_state.trades = {"condition_id": condition_id, "table": table, "next_cursor": next_cursor}
 
 # Main UI
 st.title("📊 Polymarket Dashboard")
@@ -92,47 +117,42 @@ with st.sidebar:
     )
     if api_url != st.session_state.api_url:
         st.session_state.api_url = api_url
+        st.session_state.trades = None
         st.cache_data.clear()  # Clear cache when API URL changes
-    
+
     st.markdown("---")
     st.markdown("### Available Endpoints")
     st.markdown("""
-    - `/markets/{condition_id}` - Get market trades
-    - `/markets/{condition_id}/user-distribution` - Get user distribution
-    - `/markets/{condition_id}/stats` - Get market stats
+    - `/markets/{condition_id}/stats` - Market summary
+    - `/markets/{condition_id}/candles` - OHLCV candles
+    - `/markets/{condition_id}/features` - Order-flow features
+    - `/markets/{condition_id}/user-distribution` - Top traders and concentration
+    - `/markets/{condition_id}/trades` - Raw trades, paginated
     """)
 
 st.markdown("---")
 
-# Input section
-col1, col2 = st.columns([3, 1])
-
-with col1:
-    condition_id = st.text_input(
-        "Market Condition ID",
-        value=st.session_state.condition_id,
-        placeholder="e.g., 0x6674545cedce09e0b416c81e2d6372398213bdb75e68a2a77882863dbd5397dc",
-        help="Enter a valid Polymarket condition ID",
-        key="condition_id_input"
-    )
-    if condition_id != st.session_state.condition_id:
-        st.session_state.condition_id = condition_id
-
-with col2:
-    st.write("")  # Spacing
-    st.write("")  # More spacing
-    fetch_all = st.button("🔍 Fetch All", type="primary", use_container_width=True)
+condition_id = st.text_input(
+    "Market Condition ID",
+    value=st.session_state.condition_id,
+    placeholder="e.g., 0x6674545cedce09e0b416c81e2d6372398213bdb75e68a2a77882863dbd5397dc",
+    help="Enter a valid Polymarket condition ID",
+    key="condition_id_input"
+).strip()
+if condition_id != st.session_state.condition_id:
+    st.session_state.condition_id = condition_id
+    st.session_state.trades = None
 
 # Main content
 if not condition_id:
     st.info("👆 Enter a condition ID above to start exploring market data")
-    
+
     with st.expander("📝 Example Usage"):
         st.code(
             "0x6674545cedce09e0b416c81e2d6372398213bdb75e68a2a77882863dbd5397dc",
             language="text"
         )
-    
+
     with st.expander("🚀 Getting Started"):
         st.markdown("""
         1. Make sure your FastAPI server is running:
@@ -141,84 +161,85 @@ if not condition_id:
            # or
            uvicorn app:app --reload
            ```
-        
+
         2. Enter a valid condition ID in the input field above
-        
+
         3. Use the tabs below to explore different endpoints
         """)
 else:
-    # Tabs for different endpoints
     tab1, tab2, tab3 = st.tabs([
-        "📈 Market Trades",
+        "📊 Overview",
         "👥 User Distribution",
-        "📊 Market Stats"
+        "📈 Raw Trades"
     ])
-    
-    # Tab 1: Market Trades
+
+    # Tab 1: server-side aggregates only
     with tab1:
-        st.subheader("Market Trades")
-        st.markdown(f"**Endpoint:** `GET /markets/{condition_id}`")
-        
-        fetch_trades = st.button("Fetch Market Trades", key="fetch_trades", type="primary")
-        
-        if fetch_trades or fetch_all:
-            with st.spinner("Fetching market trades..."):
-                data = fetch_endpoint(
-                    st.session_state.api_url,
-                    f"/markets/{condition_id}"
-                )
-                display_data(data, "Market Trades Data")
-        elif condition_id in st.session_state.data_cache.get("trades", {}):
-            st.info("💡 Click 'Fetch Market Trades' to load data")
-    
-    # Tab 2: User Distribution
+        with st.spinner("Fetching market statistics..."):
+            stats = fetch_json(st.session_state.api_url, f"/markets/{condition_id}/stats")
+        if "error" in stats:
+            st.error(f"❌ {stats['error']}")
+        else:
+            show_metrics(stats, ["trade_count", "volume", "vwap", "last_price",
+                                 "unique_users", "min_price", "max_price", "last_trade"])
+
+            resolution = st.radio("Candle resolution", ["1m", "1h", "1d"], index=1, horizontal=True)
+            candles, _, error = fetch_arrow(
+                st.session_state.api_url,
+                f"/markets/{condition_id}/candles",
+                {"resolution": resolution},
+            )
+            if error:
+                st.error(f"❌ {error}")
+            elif candles.num_rows == 0:
+                st.info("No candles for this market yet")
+            else:
+                df = candles.to_pandas().set_index("bucket")
+                st.caption("Price as the probability of the first outcome")
+                st.line_chart(df[["close", "high", "low"]])
+                st.bar_chart(df[["buy_volume", "sell_volume"]])
+
+    # Tab 2: top traders, aggregated by the API
     with tab2:
-        st.subheader("User Distribution")
-        st.markdown(f"**Endpoint:** `GET /markets/{condition_id}/user-distribution`")
-        
-        fetch_dist = st.button("Fetch User Distribution", key="fetch_distribution", type="primary")
-        
-        if fetch_dist or fetch_all:
-            with st.spinner("Fetching user distribution..."):
-                data = fetch_endpoint(
-                    st.session_state.api_url,
-                    f"/markets/{condition_id}/user-distribution"
-                )
-                display_data(data, "User Distribution Data")
+        top_n = st.slider("Top traders", min_value=5, max_value=100, value=10, step=5)
+        with st.spinner("Fetching user distribution..."):
+            distribution = fetch_json(
+                st.session_state.api_url,
+                f"/markets/{condition_id}/user-distribution",
+                {"top_n": top_n},
+            )
+        if "error" in distribution:
+            st.error(f"❌ {distribution['error']}")
         else:
-            st.info("💡 Click 'Fetch User Distribution' to load data")
-    
-    # Tab 3: Market Stats
+            show_metrics(distribution, ["unique_users", "total_size", "top_n_share", "hhi"])
+            top_users = pd.DataFrame(distribution["top_users"])
+            if not top_users.empty:
+                st.dataframe(top_users, use_container_width=True, hide_index=True)
+                st.bar_chart(top_users.set_index("wallet")["size"])
+
+    # Tab 3: raw rows, loaded one Arrow page at a time and only on request
     with tab3:
-        st.subheader("Market Statistics")
-        st.markdown(f"**Endpoint:** `GET /markets/{condition_id}/stats`")
-        
-        fetch_stats = st.button("Fetch Market Stats", key="fetch_stats", type="primary")
-        
-        if fetch_stats or fetch_all:
-            with st.spinner("Fetching market statistics..."):
-                data = fetch_endpoint(
-                    st.session_state.api_url,
-                    f"/markets/{condition_id}/stats"
-                )
-                display_data(data, "Market Statistics Data")
+        st.markdown(f"**Endpoint:** `GET /markets/{condition_id}/trades` (Arrow, {TRADES_PAGE_SIZE:,} rows per page)")
+        loaded = st.session_state.trades
+        if loaded is None or loaded["condition_id"] != condition_id:
+            if st.button("Load Trades", key="load_trades", type="primary"):
+                with st.spinner("Fetching trades..."):
+                    load_trades_page(condition_id, None)
+                st.rerun()
+            st.info("💡 Raw trades are only fetched on request")
         else:
-            st.info("💡 Click 'Fetch Market Stats' to load data")
+            table = loaded["table"]
+            st.caption(f"Showing the newest {table.num_rows:,} trades")
+            # Handed to Streamlit as Arrow, without a pandas round trip
+            st.dataframe(table, use_container_width=True, hide_index=True)
+            if loaded["next_cursor"] and table.num_rows < MAX_LOADED_TRADES:
+                if st.button("Load More", key="load_more"):
+                    with st.spinner("Fetching trades..."):
+                        load_trades_page(condition_id, loaded["next_cursor"])
+                    st.rerun()
+            elif loaded["next_cursor"]:
+                st.info(f"Stopped at {MAX_LOADED_TRADES:,} trades; use the API to export more")
 
 # Footer
 st.markdown("---")
-with st.spinner("Fetching all market data..."):
-    data = fetch_endpoint(st.session_state.api_url, "/")
-    if "error" in data:
-        st.error(f"❌ {data['error']}")
-    else:
-        try:
-            df = pd.DataFrame(data)
-            st.subheader("All Markets Data")
-            st.dataframe(df, use_container_width=True)
-            st.caption(f"Total records: {len(df)}")
-        except Exception:
-            st.info("Could not render market data as a table.")
-
-
 st.caption("Polymarket Dashboard | FastAPI Backend")
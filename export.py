@@ -0,0 +1,302 @@
+"""
+Offline bulk export of markets and their trades to Parquet, for research.
+
+    python export.py OUT [--closed | --no-closed] [--min-volume N]
+                         [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--workers N]
+
+writes
+
+    OUT/manifest.json         filters and snapshot time of the export
+    OUT/markets.parquet       the selected markets, in the catalog schema
+    OUT/trades/<id>.parquet   one file per market, oldest trade first
+    OUT/trades.duckdb         the TradeStorage the trades were fetched into
+
+Every trade is cut off at the snapshot time taken when the export starts, so
+the dataset is consistent however long it takes. Each market's file is written
+under a temporary name and renamed into place, so after a crash or Ctrl-C the
+same command resumes with the markets that have no file yet. Markets whose
+history is already complete in the storage are only topped up, so `--db` can
+point at an existing trades.duckdb (with the server stopped, or TRADES_DB_MODE
+set to shared) to avoid refetching it.
+"""
+from typing import Optional
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from market import MarketAPI
+from trades import TradeStorage, decode_trades
+from catalog import CatalogIngester, catalog_sql
+from dotenv import load_dotenv
+import polars as pl
+import duckdb
+import argparse
+import threading
+import logging
+import json
+import time
+import sys
+import os
+
+logger = logging.getLogger("polymarket.export")
+
+
+class ExportError(Exception):
+    """Raised when a market's trades cannot be fetched"""
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class TradeExporter:
+    """
+    Fetches the full trade history of many markets into TradeStorage with a pool
+    of `workers` threads, each paging one market at a time through its own
+    MarketAPI, and writes every market to its own Parquet file.
+
+    Threads rather than processes: the work is waiting on the data API, and
+    DuckDB and Polars release the GIL for the rest, while a process pool would
+    need a database file per process.
+    """
+    def __init__(self, out: str, storage: TradeStorage,
+                 snapshot_at: int,
+                 start: Optional[int] = None,
+                 end: Optional[int] = None,
+                 workers: int = 8,
+                 page_size: int = 500,
+                 batch_rows: int = 50_000,
+                 retries: int = 3):
+        self.out = out
+        self.trades_dir = os.path.join(out, "trades")
+        self.storage = storage
+        self.start = start
+        # Nothing after the snapshot, so every market is cut at the same instant
+        self.end = snapshot_at if end is None else min(end, snapshot_at)
+        self.workers = workers
+        self.page_size = page_size
+        self.batch_rows = batch_rows
+        self.retries = retries
+        self._local = threading.local()
+        self.logger = logger
+
+    @property
+    def market(self) -> MarketAPI:
+        # requests sessions are not thread-safe, so one client per worker
+        if not hasattr(self._local, "market"):
+            self._local.market = MarketAPI()
+        return self._local.market
+
+    def path(self, condition_id: str) -> str:
+        return os.path.join(self.trades_dir, f"{condition_id}.parquet")
+
+    def run(self, condition_ids: list) -> dict:
+        """
+        Export every market in `condition_ids` that has no file yet.
+
+        Returns:
+            dict: Counts of markets exported, skipped and failed, and trades written.
+        """
+        os.makedirs(self.trades_dir, exist_ok=True)
+        pending = [cid for cid in condition_ids if not os.path.exists(self.path(cid))]
+        summary = {"markets": len(condition_ids), "exported": 0,
+                   "skipped": len(condition_ids) - len(pending), "failed": 0, "trades": 0}
+        if summary["skipped"]:
+            self.logger.info("Resuming: %s of %s markets already exported", summary["skipped"], len(condition_ids))
+        started = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+        try:
+            futures = {pool.submit(self.export_market, cid): cid for cid in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    summary["trades"] += future.result()
+                    summary["exported"] += 1
+                except Exception as e:
+                    summary["failed"] += 1
+                    self.logger.error("Failed to export %s: %s", futures[future], e)
+                if done % 100 == 0 or done == len(pending):
+                    self.logger.info("Exported %s/%s markets, %s trades, %.1f markets/s",
+                                     done, len(pending), summary["trades"], done / (time.perf_counter() - started))
+        finally:
+            # On Ctrl-C, drop the queued markets rather than wait for them
+            pool.shutdown(cancel_futures=True)
+        return summary
+
+    def export_market(self, condition_id: str) -> int:
+        """Fetch a market's trades into storage and write its Parquet file, returning the trade count"""
+        self.fetch(condition_id)
+        path = self.path(condition_id)
+        tmp = f"{path}.tmp"
+        count = self.storage.export_trades(tmp, condition_id, start=self.start, end=self.end)
+        os.replace(tmp, path)
+        return count
+
+    def fetch(self, condition_id: str) -> int:
+        """
+        Page a market's trades, newest first, into storage. A market whose stored
+        history is complete is only fetched back to its high-water mark; otherwise
+        paging stops at the end of the history or at `start`.
+
+        Returns:
+            int: The number of trades fetched.
+        """
+        state = self.storage.get_sync_state(condition_id)
+        high_water = state["high_water"] if state and state["backfill_complete"] else None
+        stop_before = max(filter(None, (self.start, high_water)), default=None)
+        newest = high_water
+        offset = fetched = 0
+        # Pages are inserted in batches: one insert costs about as much as a page
+        batch = []
+        while True:
+            page = decode_trades(self._page(condition_id, offset))
+            if page.height:
+                batch.append(page)
+                fetched += page.height
+                newest = max(filter(None, (newest, page["timestamp"].max())))
+                if sum(p.height for p in batch) >= self.batch_rows:
+                    self.storage.insert_trades(pl.concat(batch))
+                    batch = []
+            if page.height < self.page_size:
+                complete = True
+                break
+            if stop_before is not None and page["timestamp"].min() < stop_before:
+                # Either caught up with stored history, or past the requested window
+                complete = high_water is not None and page["timestamp"].min() < high_water
+                break
+            offset += self.page_size
+        if batch:
+            self.storage.insert_trades(pl.concat(batch))
+        if complete:
+            backfill_offset = state["backfill_offset"] if high_water is not None else offset + page.height
+            self.storage.save_sync_state(condition_id, backfill_offset, True, newest)
+        self.storage.flush()
+        return fetched
+
+    def _page(self, condition_id: str, offset: int) -> list:
+        for attempt in range(self.retries):
+            page = self.market.get_trades_for_market(condition_id, limit=self.page_size, offset=offset)
+            if page is not None:
+                return page
+            time.sleep(2 ** attempt)
+        raise ExportError(f"Could not fetch trades for {condition_id} at offset {offset}")
+
+
+def select_markets(catalog_root: str,
+                   closed: Optional[bool] = None,
+                   min_volume: Optional[float] = None,
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   limit: Optional[int] = None) -> pl.DataFrame:
+    """Catalog markets matching the filters, largest volume first; the date range keeps markets open at any point in it"""
+    clauses, params = ["conditionId IS NOT NULL"], []
+    if closed is not None:
+        clauses.append("closed = ?")
+        params.append(closed)
+    if min_volume is not None:
+        clauses.append("volume >= ?")
+        params.append(min_volume)
+    if start is not None:
+        clauses.append("(coalesce(closedTime, endDate) >= ? OR coalesce(closedTime, endDate) IS NULL)")
+        params.append(start)
+    if end is not None:
+        clauses.append("(startDate < ? OR startDate IS NULL)")
+        params.append(end)
+    return duckdb.connect().execute(f"""
+        SELECT * EXCLUDE (end_month) FROM {catalog_sql(catalog_root)}
+        WHERE {" AND ".join(clauses)}
+        ORDER BY volume DESC NULLS LAST, conditionId
+        {"LIMIT " + str(int(limit)) if limit else ""}
+    """, params).pl()
+
+
+def load_manifest(out: str, filters: dict) -> Optional[dict]:
+    """The manifest of an earlier run into `out`, which must have used the same filters"""
+    path = os.path.join(out, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest["filters"] != filters:
+        raise SystemExit(f"{out} holds an export with different filters {manifest['filters']}; "
+                         "use a new output directory")
+    return manifest
+
+
+def write_manifest(out: str, manifest: dict) -> None:
+    path = os.path.join(out, "manifest.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(f"{path}.tmp", path)
+
+
+def _date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _epoch(value: Optional[datetime]) -> Optional[int]:
+    # Naive datetimes are UTC, like the stored timestamps
+    return None if value is None else int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export markets and their trades to Parquet")
+    parser.add_argument("out", help="output directory; rerun with the same arguments to resume")
+    parser.add_argument("--closed", action=argparse.BooleanOptionalAction, default=None,
+                        help="only closed (--closed) or open (--no-closed) markets; both by default")
+    parser.add_argument("--min-volume", type=float, help="minimum market volume in USDC")
+    parser.add_argument("--start", type=_date, help="first day of trades to export (UTC, YYYY-MM-DD)")
+    parser.add_argument("--end", type=_date, help="day after the last day of trades to export (UTC)")
+    parser.add_argument("--limit", type=int, help="at most this many markets, by volume")
+    parser.add_argument("--catalog", help="existing market catalog to select from, instead of fetching one")
+    parser.add_argument("--db", help="TradeStorage database to fetch into (default OUT/trades.duckdb)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=500)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list] = None) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    # Per-request logs would drown the progress lines
+    logging.getLogger("polymarket.market").setLevel(logging.WARNING)
+    load_dotenv()
+    args = parse_args(argv)
+    filters = {"closed": args.closed, "min_volume": args.min_volume, "limit": args.limit,
+               "start": args.start and args.start.isoformat(), "end": args.end and args.end.isoformat()}
+    os.makedirs(args.out, exist_ok=True)
+    manifest = load_manifest(args.out, filters)
+    markets_path = os.path.join(args.out, "markets.parquet")
+
+    if manifest is None:
+        catalog_root = args.catalog or os.path.join(args.out, "catalog")
+        ingester = CatalogIngester(MarketAPI(), root=catalog_root)
+        if not ingester.ingested(args.closed):
+            ingester.ingest(cap=sys.maxsize, closed=args.closed)
+        markets = select_markets(catalog_root, args.closed, args.min_volume, args.start, args.end, args.limit)
+        markets.write_parquet(markets_path, compression="zstd")
+        manifest = {"filters": filters, "snapshot_at": int(time.time()), "markets": markets.height}
+        write_manifest(args.out, manifest)
+    markets = pl.read_parquet(markets_path)
+    logger.info("Exporting %s markets as of %s", markets.height,
+                datetime.fromtimestamp(manifest["snapshot_at"], timezone.utc))
+
+    storage = TradeStorage(args.db or os.path.join(args.out, "trades.duckdb"))
+    try:
+        exporter = TradeExporter(
+            args.out, storage, manifest["snapshot_at"],
+            start=_epoch(args.start), end=_epoch(args.end),
+            workers=args.workers, page_size=args.page_size,
+        )
+        started = time.perf_counter()
+        summary = exporter.run(markets["conditionId"].to_list())
+    finally:
+        storage.close()
+    logger.info("Done in %.0fs: %s", time.perf_counter() - started, summary)
+    if summary["failed"]:
+        logger.warning("%s markets failed; rerun the same command to retry them", summary["failed"])
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
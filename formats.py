@@ -0,0 +1,139 @@
+from typing import Optional, Iterator, Iterable, Union
+from fastapi.responses import Response, StreamingResponse
+import pyarrow as pa
+import pyarrow.parquet as pq
+import polars as pl
+import io
+
+JSON_MEDIA_TYPE = "application/json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+# Media types clients may ask for, including common aliases
+MEDIA_TYPES = {
+    JSON_MEDIA_TYPE: JSON_MEDIA_TYPE,
+    ARROW_MEDIA_TYPE: ARROW_MEDIA_TYPE,
+    ARROW_FILE_MEDIA_TYPE: ARROW_FILE_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE: PARQUET_MEDIA_TYPE,
+    "application/x-parquet": PARQUET_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE: NDJSON_MEDIA_TYPE,
+    "application/jsonl": NDJSON_MEDIA_TYPE,
+}
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Pick the response media type for an Accept header.
+
+    Returns the supported type with the highest q-value, falling back to JSON
+    for missing headers, wildcards and unsupported types.
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    best, best_q = JSON_MEDIA_TYPE, 0.0
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        media_type = MEDIA_TYPES.get(media_type.lower())
+        if media_type is not None and q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def arrow_response(data: Union[pa.Table, pa.RecordBatchReader], media_type: str,
+                   batch_size: int = 65_536) -> Response:
+    """
+    Serialize an Arrow table, or a reader of record batches, as Arrow IPC (stream
+    or file format), Parquet or NDJSON.
+
+    Every format is streamed a batch at a time, so large markets never sit in
+    memory as Python objects or as one encoded blob; a reader is only consumed
+    as the response is sent.
+    """
+    batches: Iterable[pa.RecordBatch] = (
+        data.to_batches(max_chunksize=batch_size) if isinstance(data, pa.Table) else data
+    )
+    if media_type == ARROW_MEDIA_TYPE:
+        body = _iter_ipc(data.schema, batches, pa.ipc.new_stream)
+    elif media_type == ARROW_FILE_MEDIA_TYPE:
+        body = _iter_ipc(data.schema, batches, pa.ipc.new_file)
+    elif media_type == PARQUET_MEDIA_TYPE:
+        body = _iter_parquet(data.schema, batches)
+    elif media_type == NDJSON_MEDIA_TYPE:
+        body = _iter_ndjson(batches)
+    else:
+        raise ValueError(f"Unsupported media type: {media_type}")
+    return StreamingResponse(body, media_type=media_type)
+
+
+def _iter_ipc(schema: pa.Schema, batches: Iterable[pa.RecordBatch], new_writer) -> Iterator[bytes]:
+    buffer = io.BytesIO()
+    with new_writer(buffer, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield _drain(buffer)
+    # Closing the writer appends the end-of-stream marker, or the file footer
+    yield _drain(buffer)
+
+
+def _iter_parquet(schema: pa.Schema, batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    buffer = io.BytesIO()
+    with pq.ParquetWriter(buffer, schema, compression="zstd") as writer:
+        for batch in batches:
+            # One row group per batch
+            writer.write_batch(batch)
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def _iter_ndjson(batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    for batch in batches:
+        yield json_compatible(pl.from_arrow(batch)).write_ndjson().encode()
+
+
+def json_compatible(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Render decimals as floats and datetimes in ISO 8601, with microseconds only
+    when there are some, so rows read the same as in the JSON responses
+    """
+    columns = []
+    for name, dtype in df.schema.items():
+        if isinstance(dtype, pl.Decimal):
+            columns.append(pl.col(name).cast(pl.Float64))
+        elif isinstance(dtype, pl.Datetime):
+            column = pl.col(name)
+            columns.append(
+                pl.when(column.dt.microsecond() == 0)
+                .then(column.dt.strftime("%Y-%m-%dT%H:%M:%S"))
+                .otherwise(column.dt.strftime("%Y-%m-%dT%H:%M:%S%.6f"))
+                .alias(name)
+            )
+    return df.with_columns(columns) if columns else df
+
+
+def sse_event(data: str, event: Optional[str] = None) -> bytes:
+    """Encode one server-sent event; `data` must not contain newlines"""
+    if event is None:
+        return f"data: {data}\n\n".encode()
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+
+def sse_comment(text: str) -> bytes:
+    """An SSE comment line, ignored by clients; used as a keepalive"""
+    return f": {text}\n\n".encode()
@@ -0,0 +1,60 @@
+from typing import Optional
+from trades import TradeStorage
+from catalog import resolutions_sql, CATALOG_PATH
+import asyncio
+import logging
+
+logger = logging.getLogger("polymarket.maintenance")
+
+
+class StorageMaintenance:
+    """
+    Storage lifecycle for the trade database. Every `interval` seconds the trades
+    of resolved markets idle for `min_age` seconds are moved to the Parquet
+    archive, small archive files are merged, the remaining trades are clustered
+    by market once enough new ones have arrived, and the database is
+    checkpointed, so the hot DuckDB file only holds the markets still trading,
+    stored market by market.
+    """
+    def __init__(self, storage: TradeStorage,
+                 catalog_root: str = CATALOG_PATH,
+                 interval: float = 6 * 3600.0,
+                 min_age: float = 86400.0):
+        self.storage = storage
+        self.catalog_root = catalog_root
+        self.interval = interval
+        self.min_age = min_age
+        self._task: Optional[asyncio.Task] = None
+        self.logger = logger
+
+    def start(self) -> None:
+        if self._task is None:
+            self.logger.info("Starting storage maintenance every %ss", self.interval)
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> dict:
+        # Queued writes first, so the archived markets are complete
+        await asyncio.to_thread(self.storage.flush)
+        archived = await asyncio.to_thread(
+            self.storage.archive_resolved, resolutions_sql(self.catalog_root), self.min_age
+        )
+        merged = await asyncio.to_thread(self.storage.compact_archive)
+        clustered = await asyncio.to_thread(self.storage.cluster)
+        await asyncio.to_thread(self.storage.checkpoint)
+        self.logger.info("Storage maintenance archived %s trades, merged %s files and clustered %s trades",
+                         archived, merged, clustered)
+        return {"archived": archived, "merged": merged, "clustered": clustered}
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.logger.error("Error maintaining storage: %s", e)
+            await asyncio.sleep(self.interval)
@@ -1,17 +1,31 @@
 import requests
+import httpx
+import asyncio
 import logging
-from typing import Optional, Union
+import random
+import time
+import os
+from typing import Optional, Union, Iterable
+from urllib.parse import urlsplit
+from metrics import UPSTREAM_SECONDS, upstream_endpoint
 
 # Configure logger for market API
 logger = logging.getLogger("polymarket.market")
 
+GAMMA_API_URL = "https://gamma-api.polymarket.com"
+DATA_API_URL = "https://data-api.polymarket.com"
+
 class MarketAPI():
     '''
     Wrapper around the polymarket gamma and data api endpoints 
     '''
     def __init__(self):
-        self.gamma_api_url ="https://gamma-api.polymarket.com"
-        self.data_api_url ="https://data-api.polymarket.com"
+        # Overridable so benchmarks can point at a local stand-in server
+        self.gamma_api_url = os.getenv("GAMMA_API_URL", GAMMA_API_URL)
+        self.data_api_url = os.getenv("DATA_API_URL", DATA_API_URL)
+        # Reuse TCP/TLS connections across calls instead of reconnecting every time
+        self.session = requests.Session()
+        self.session.hooks["response"].append(_observe_response)
         self.logger = logger
         logger.info("MarketAPI initialized")
 
@@ -51,27 +65,27 @@ class MarketAPI():
             query["closed"] = closed
         # Add any additional query parameters
         query.update(kwargs)
-        self.logger.debug(f"Fetching markets with params: {query}")
+        self.logger.debug("Fetching markets with params: %s", query)
         try:
-            response = requests.get(f"{self.gamma_api_url}/markets", params=query)
+            response = self.session.get(f"{self.gamma_api_url}/markets", params=query)
             if response.ok:
-                self.logger.debug(f"Successfully fetched markets (status: {response.status_code})")
+                self.logger.debug("Successfully fetched markets (status: %s)", response.status_code)
             else:
-                self.logger.warning(f"Failed to fetch markets (status: {response.status_code})")
+                self.logger.warning("Failed to fetch markets (status: %s)", response.status_code)
             return response
         except Exception as e:
-            self.logger.error(f"Error getting markets: {e}")
+            self.logger.error("Error getting markets: %s", e)
             return None
 
     def get_market_by_slug(self, slug: str) -> Optional[dict]: 
-        self.logger.info(f"Fetching market by slug: {slug}")
+        self.logger.info("Fetching market by slug: %s", slug)
         try:
-            response = requests.get(f"{self.gamma_api_url}/markets/slug/{slug}")
+            response = self.session.get(f"{self.gamma_api_url}/markets/slug/{slug}")
             if response.ok:
-                self.logger.debug(f"Successfully fetched market for slug: {slug}")
+                self.logger.debug("Successfully fetched market for slug: %s", slug)
             return response
         except Exception as e:
-            self.logger.error(f"Error getting market by slug {slug}: {e}")
+            self.logger.error("Error getting market by slug %s: %s", slug, e)
             return None
 
     def get_trades_for_market(self, market: str, 
@@ -89,9 +103,9 @@ class MarketAPI():
             query["takerOnly"] = "true"
         if side is not None:
             query["side"] = side
-        self.logger.debug(f"Fetching trades for market {market} with params: {query}")
+        self.logger.debug("Fetching trades for market %s with params: %s", market, query)
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.data_api_url}/trades", 
                 params=query,
                 timeout=30  # 30 second timeout
@@ -99,34 +113,309 @@ class MarketAPI():
             response.raise_for_status()  # Raise exception for bad status codes
             data = response.json()
             trade_count = len(data) if isinstance(data, list) else 1
-            self.logger.info(f"Successfully fetched {trade_count} trades for market {market}")
+            self.logger.info("Successfully fetched %s trades for market %s", trade_count, market)
             return data
         except requests.exceptions.Timeout:
-            self.logger.error(f"Timeout getting trades for market {market}")
+            self.logger.error("Timeout getting trades for market %s", market)
             return None
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"Error getting trades for market {market}: {e}")
+            self.logger.error("Error getting trades for market %s: %s", market, e)
             return None
         except Exception as e:
-            self.logger.error(f"Unexpected error getting trades for market {market}: {e}")
+            self.logger.error("Unexpected error getting trades for market %s: %s", market, e)
             return None
 
     def get_trades_for_user(self, user: str, limit: int = 500, offset: int = 0, takerOnly:bool = False) -> Optional[dict]:
-        self.logger.info(f"Fetching trades for user: {user}")
+        self.logger.info("Fetching trades for user: %s", user)
         query = {
             "user": user,
             "limit": limit,
             "offset": offset,
             "takerOnly": takerOnly
         }
-        self.logger.debug(f"Fetching trades with params: {query}")
+        self.logger.debug("Fetching trades with params: %s", query)
         try:
-            response = requests.get(f"{self.data_api_url}/trades", params=query)
+            response = self.session.get(f"{self.data_api_url}/trades", params=query)
             response.raise_for_status()
             data = response.json()
             trade_count = len(data) if isinstance(data, list) else 1
-            self.logger.info(f"Successfully fetched {trade_count} trades for user {user}")
+            self.logger.info("Successfully fetched %s trades for user %s", trade_count, user)
             return data
         except Exception as e:
-            self.logger.error(f"Error getting trades for user {user}: {e}")
-            return None
\ No newline at end of file
+            self.logger.error("Error getting trades for user %s: %s", user, e)
+            return None
+
+
+class TokenBucket():
+    '''
+    Async token bucket: allows `rate` acquisitions per second on average with
+    bursts of up to `capacity`.
+    '''
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class AsyncMarketAPI():
+    '''
+    Async wrapper around the polymarket gamma and data api endpoints.
+
+    All calls share one keep-alive connection pool and each upstream host is
+    capped at `per_host_limit` in-flight requests, so a slow host can't starve
+    the event loop or the other host of connections. With `rate_limit` set,
+    requests also draw from a token bucket of that many requests per second.
+    429 and 5xx responses are retried with exponential backoff (honouring
+    Retry-After) up to `max_retries` times.
+    '''
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 per_host_limit: int = 10,
+                 timeout: float = 30.0,
+                 rate_limit: Optional[float] = None,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 30.0):
+        # Overridable so benchmarks can point at a local stand-in server
+        self.gamma_api_url = os.getenv("GAMMA_API_URL", GAMMA_API_URL)
+        self.data_api_url = os.getenv("DATA_API_URL", DATA_API_URL)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(timeout),
+        )
+        self.per_host_limit = per_host_limit
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.logger = logger
+        logger.info("AsyncMarketAPI initialized")
+
+    async def __aenter__(self) -> "AsyncMarketAPI":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def _get(self, url: str, params: Optional[dict] = None) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                async with self._semaphore(url):
+                    response = await self.client.get(url, params=params)
+            except httpx.TransportError as e:
+                UPSTREAM_SECONDS.labels(upstream_endpoint(url), "error").observe(time.perf_counter() - start)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                self.logger.warning("Error requesting %s (%s), retrying in %.2fs", url, e, delay)
+            else:
+                UPSTREAM_SECONDS.labels(upstream_endpoint(url), str(response.status_code)).observe(
+                    time.perf_counter() - start
+                )
+                if not _retryable(response.status_code) or attempt == self.max_retries:
+                    return response
+                delay = self._backoff(attempt, response.headers.get("retry-after"))
+                self.logger.warning("Got %s from %s, retrying in %.2fs", response.status_code, url, delay)
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter so workers that were throttled together don't retry together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def get_markets(self, limit: int = 20,
+                          offset: Optional[int] = None,
+                          order: Optional[str] = None,
+                          ascending: Optional[bool] = None,
+                          closed: Optional[bool] = None,
+                          **kwargs) -> Optional[httpx.Response]:
+        """
+        Async version of `MarketAPI.get_markets`.
+
+        Returns:
+            httpx.Response: The HTTP response object containing the list of markets.
+        """
+        query = {"limit": limit}
+        if offset is not None:
+            query["offset"] = offset
+        if order is not None:
+            query["order"] = order
+        if ascending is not None:
+            query["ascending"] = ascending
+        if closed is not None:
+            query["closed"] = closed
+        query.update(kwargs)
+        self.logger.debug("Fetching markets with params: %s", query)
+        try:
+            response = await self._get(f"{self.gamma_api_url}/markets", params=query)
+            if response.is_success:
+                self.logger.debug("Successfully fetched markets (status: %s)", response.status_code)
+            else:
+                self.logger.warning("Failed to fetch markets (status: %s)", response.status_code)
+            return response
+        except Exception as e:
+            self.logger.error("Error getting markets: %s", e)
+            return None
+
+    async def get_market_by_slug(self, slug: str) -> Optional[httpx.Response]:
+        self.logger.info("Fetching market by slug: %s", slug)
+        try:
+            response = await self._get(f"{self.gamma_api_url}/markets/slug/{slug}")
+            if response.is_success:
+                self.logger.debug("Successfully fetched market for slug: %s", slug)
+            return response
+        except Exception as e:
+            self.logger.error("Error getting market by slug %s: %s", slug, e)
+            return None
+
+    async def get_trades_for_market(self, market: str,
+                                    limit: int = 100,
+                                    offset: int = 0,
+                                    takerOnly: bool = False,
+                                    side: Optional[str] = None,
+                                    raw: bool = False) -> Optional[Union[list, dict, bytes]]:
+        """
+        Async version of `MarketAPI.get_trades_for_market`. With `raw=True` the
+        undecoded response body is returned, for `trades.decode_trades`.
+        """
+        # API expects string values for parameters
+        query = {
+            "market": market,
+            "limit": str(limit),
+            "offset": str(offset)
+        }
+        if takerOnly:
+            query["takerOnly"] = "true"
+        if side is not None:
+            query["side"] = side
+        self.logger.debug("Fetching trades for market %s with params: %s", market, query)
+        try:
+            response = await self._get(f"{self.data_api_url}/trades", params=query)
+            response.raise_for_status()
+            if raw:
+                self.logger.info("Successfully fetched %s bytes of trades for market %s", len(response.content), market)
+                return response.content
+            data = response.json()
+            trade_count = len(data) if isinstance(data, list) else 1
+            self.logger.info("Successfully fetched %s trades for market %s", trade_count, market)
+            return data
+        except httpx.TimeoutException:
+            self.logger.error("Timeout getting trades for market %s", market)
+            return None
+        except httpx.HTTPError as e:
+            self.logger.error("Error getting trades for market %s: %s", market, e)
+            return None
+        except Exception as e:
+            self.logger.error("Unexpected error getting trades for market %s: %s", market, e)
+            return None
+
+    async def get_trades_for_user(self, user: str, limit: int = 500, offset: int = 0, takerOnly: bool = False, raw: bool = False) -> Optional[Union[list, dict, bytes]]:
+        self.logger.info("Fetching trades for user: %s", user)
+        query = {
+            "user": user,
+            "limit": limit,
+            "offset": offset,
+            "takerOnly": takerOnly
+        }
+        self.logger.debug("Fetching trades with params: %s", query)
+        try:
+            response = await self._get(f"{self.data_api_url}/trades", params=query)
+            response.raise_for_status()
+            if raw:
+                return response.content
+            data = response.json()
+            trade_count = len(data) if isinstance(data, list) else 1
+            self.logger.info("Successfully fetched %s trades for user %s", trade_count, user)
+            return data
+        except Exception as e:
+            self.logger.error("Error getting trades for user %s: %s", user, e)
+            return None
+
+    async def get_markets_pages(self, offsets: Iterable[int], limit: int = 500, **kwargs) -> list[Optional[list]]:
+        """
+        Fetch several `offset` pages of `get_markets` concurrently.
+
+        Returns one entry per offset, in the same order; failed pages are None.
+        """
+        async def fetch(offset: int) -> Optional[list]:
+            response = await self.get_markets(limit=limit, offset=offset, **kwargs)
+            if response is None or not response.is_success:
+                return None
+            data = response.json()
+            if isinstance(data, dict) and 'markets' in data:
+                return data['markets']
+            return data
+        return await asyncio.gather(*(fetch(offset) for offset in offsets))
+
+    async def get_trades_for_market_pages(self, market: str, offsets: Iterable[int], limit: int = 100, **kwargs) -> list[Optional[list]]:
+        """
+        Fetch several `offset` pages of `get_trades_for_market` concurrently.
+
+        Returns one entry per offset, in the same order; failed pages are None.
+        Pass `raw=True` to get undecoded response bodies.
+        """
+        async def fetch(offset: int) -> Optional[list]:
+            data = await self.get_trades_for_market(market, limit=limit, offset=offset, **kwargs)
+            if isinstance(data, dict):
+                return [data]
+            return data
+        return await asyncio.gather(*(fetch(offset) for offset in offsets))
+
+    async def get_trades_for_user_pages(self, user: str, offsets: Iterable[int], limit: int = 500, **kwargs) -> list[Optional[list]]:
+        """
+        Fetch several `offset` pages of `get_trades_for_user` concurrently.
+
+        Returns one entry per offset, in the same order; failed pages are None.
+        Pass `raw=True` to get undecoded response bodies.
+        """
+        async def fetch(offset: int) -> Optional[list]:
+            data = await self.get_trades_for_user(user, limit=limit, offset=offset, **kwargs)
+            if isinstance(data, dict):
+                return [data]
+            return data
+        return await asyncio.gather(*(fetch(offset) for offset in offsets))
+
+
+def _retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def _observe_response(response: requests.Response, *args, **kwargs) -> None:
+    """requests response hook recording MarketAPI call latency"""
+    UPSTREAM_SECONDS.labels(upstream_endpoint(response.url), str(response.status_code)).observe(
+        response.elapsed.total_seconds()
+    )
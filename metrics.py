@@ -0,0 +1,128 @@
+from prometheus_client import (
+    Counter, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, REGISTRY,
+)
+from prometheus_client import multiprocess
+from typing import Callable, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import time
+import os
+
+logger = logging.getLogger("polymarket.metrics")
+
+ROW_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+UPSTREAM_SECONDS = Histogram(
+    "polymarket_upstream_request_seconds",
+    "Latency of gamma and data API calls, per attempt",
+    ["endpoint", "status"],
+)
+STORAGE_SECONDS = Histogram(
+    "polymarket_storage_seconds",
+    "Time spent in TradeStorage queries and inserts",
+    ["operation"],
+)
+REQUEST_SECONDS = Histogram(
+    "polymarket_request_seconds",
+    "End-to-end API request latency",
+    ["route", "method", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "polymarket_request_stage_seconds",
+    "Time spent per stage of an API request: sync, storage or serialize",
+    ["route", "stage"],
+)
+RESPONSE_ROWS = Histogram(
+    "polymarket_response_rows",
+    "Rows serialized per API response",
+    ["route", "format"],
+    buckets=ROW_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "polymarket_cache_requests",
+    "TradeCache lookups by result: hit, stale or miss",
+    ["result"],
+)
+EVENT_LOOP_LAG = Histogram(
+    "polymarket_event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task",
+    buckets=LAG_BUCKETS,
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording REQUEST_SECONDS per matched route, method and
+    status. The clock stops when the last body chunk is sent (or the request
+    ends without one), so a streamed response is timed until it is complete
+    rather than until its headers.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = "500"
+        observed = False
+
+        def observe() -> None:
+            nonlocal observed
+            observed = True
+            # The matched route template, so condition ids don't each get their own series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(route, scope["method"], status).observe(time.perf_counter() - start)
+
+        async def timed_send(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                observe()
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                observe()
+
+
+def timed(operation: str) -> Callable:
+    """Decorator recording a TradeStorage method's duration under `operation`"""
+    return STORAGE_SECONDS.labels(operation=operation).time()
+
+
+def stage(route: str, name: str):
+    """Context manager timing one stage of a request to `route`"""
+    return STAGE_SECONDS.labels(route=route, stage=name).time()
+
+
+def upstream_endpoint(url: str) -> str:
+    """Low-cardinality endpoint label for an upstream URL (`/markets/slug/<slug>` -> `/markets/slug`)"""
+    return "/".join(urlsplit(url).path.split("/")[:3])
+
+
+async def watch_event_loop(interval: float = 0.5) -> None:
+    """Record event-loop lag as the overshoot of a fixed sleep, until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+def latest() -> Tuple[bytes, str]:
+    """
+    The exposition payload and its content type. With PROMETHEUS_MULTIPROC_DIR
+    set, samples from every worker process are aggregated.
+    """
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
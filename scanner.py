@@ -0,0 +1,215 @@
+from typing import Optional
+from datetime import datetime
+from trades import TradeStorage, CANDLE_RESOLUTIONS
+from catalog import catalog_sql, CATALOG_PATH
+import numpy as np
+import polars as pl
+import duckdb
+import asyncio
+import logging
+import glob
+import time
+
+logger = logging.getLogger("polymarket.scanner")
+
+# Polars interval of each candle resolution
+GRID_INTERVALS = {"1m": "1m", "1h": "1h", "1d": "1d"}
+
+
+class MarketScanner:
+    """
+    Cross-market analytics over stored candles and the market catalog.
+
+    Closes of every market with candles in the last `lookback` seconds, except
+    the ones the catalog lists as closed, are aligned on one `resolution` grid
+    (forward-filled between trades) as a buckets x markets matrix, and scanned
+    in bulk with NumPy:
+
+    - correlations: the correlation matrix of price changes over the trailing
+      `window` buckets, and over the `window` before it, so pairs that move
+      together, or stopped doing so, stand out
+    - event sums: for negRisk events, whose outcomes are mutually exclusive, the
+      sum of outcome prices should be 1; the deviation is the arbitrage margin
+
+    Scans are cached for `ttl` seconds and run off the event loop.
+    """
+    def __init__(self, storage: TradeStorage,
+                 catalog_root: str = CATALOG_PATH,
+                 resolution: str = "1h",
+                 lookback: float = 30 * 86400,
+                 window: int = 24,
+                 min_observations: int = 12,
+                 ttl: float = 300.0):
+        if resolution not in CANDLE_RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution: {resolution}")
+        self.storage = storage
+        self.catalog_root = catalog_root
+        self.resolution = resolution
+        self.lookback = lookback
+        self.window = window
+        self.min_observations = min_observations
+        self.ttl = ttl
+        self._result: Optional[dict] = None
+        self._scanned_at = 0.0
+        self._lock = asyncio.Lock()
+        self.logger = logger
+
+    async def latest(self) -> dict:
+        """The most recent scan, rescanning if it is older than `ttl`"""
+        async with self._lock:
+            if self._result is None or time.monotonic() - self._scanned_at > self.ttl:
+                self._result = await asyncio.to_thread(self.scan)
+                self._scanned_at = time.monotonic()
+        return self._result
+
+    def scan(self) -> dict:
+        start = time.perf_counter()
+        markets = self._markets()
+        ids, buckets, prices = self._price_matrix()
+        # Closed markets are settled: neither their moves nor their prices are signals any more
+        closed = set(markets.filter(pl.col("closed"))["condition_id"].to_list())
+        keep = [n for n, condition_id in enumerate(ids) if condition_id not in closed]
+        ids, prices = [ids[n] for n in keep], prices[:, keep]
+        markets = markets.filter(~pl.col("closed"))
+        result = {
+            "generated_at": datetime.now(),
+            "resolution": self.resolution,
+            "window": self.window,
+            "markets": len(ids),
+            "buckets": len(buckets),
+            "correlations": self._correlations(ids, prices, markets),
+            "events": self._event_sums(ids, prices, markets),
+        }
+        self.logger.info("Scanned %s markets over %s buckets in %.2fs",
+                         len(ids), len(buckets), time.perf_counter() - start)
+        return result
+
+    def _markets(self) -> pl.DataFrame:
+        """condition_id, question, event_id, neg_risk and closed for every catalogued market"""
+        if not glob.glob(f"{self.catalog_root}/**/*.parquet", recursive=True):
+            return pl.DataFrame(schema={"condition_id": pl.Utf8, "question": pl.Utf8, "event_id": pl.Utf8,
+                                        "neg_risk": pl.Boolean, "closed": pl.Boolean})
+        return duckdb.connect().execute(f"""
+            SELECT conditionId AS condition_id, question, eventId AS event_id,
+                   coalesce(negRisk, false) AS neg_risk, closed
+            FROM {catalog_sql(self.catalog_root)}
+            WHERE conditionId IS NOT NULL
+        """).pl()
+
+    def _price_matrix(self) -> tuple:
+        """(condition_ids, buckets, buckets x markets array of forward-filled closes, NaN before the first trade)"""
+        history = pl.from_arrow(self.storage.get_price_history(
+            self.resolution, start=int(time.time() - self.lookback)
+        ))
+        if history.is_empty():
+            return [], [], np.empty((0, 0))
+        grid = pl.DataFrame({"bucket": pl.datetime_range(
+            history["bucket"].min(), history["bucket"].max(), GRID_INTERVALS[self.resolution],
+            eager=True, time_unit="us",
+        )})
+        wide = history.pivot(on="condition_id", index="bucket", values="close", aggregate_function="last")
+        wide = grid.join(wide, on="bucket", how="left").sort("bucket").fill_null(strategy="forward")
+        ids = wide.columns[1:]
+        return ids, wide["bucket"].to_list(), wide.select(ids).to_numpy().astype(np.float64)
+
+    def _window_correlation(self, changes: np.ndarray) -> tuple:
+        """Correlation matrix of the columns of `changes` with enough observations, and which columns those are"""
+        valid = ~np.isnan(changes)
+        changes = np.where(valid, changes, 0.0)
+        std = changes.std(axis=0)
+        usable = (valid.sum(axis=0) >= self.min_observations) & (std > 0)
+        z = (changes[:, usable] - changes[:, usable].mean(axis=0)) / std[usable]
+        return z.T @ z / len(z), np.flatnonzero(usable)
+
+    def _correlations(self, ids: list, prices: np.ndarray, markets: pl.DataFrame, top: int = 500) -> list:
+        """The `top` market pairs by absolute correlation of price changes over the trailing window"""
+        if len(ids) < 2 or len(prices) < self.window + 1:
+            return []
+        changes = np.diff(prices, axis=0)
+        current, columns = self._window_correlation(changes[-self.window:])
+        if len(columns) < 2:
+            return []
+        previous = None
+        if len(changes) >= 2 * self.window:
+            prev_corr, prev_columns = self._window_correlation(changes[-2 * self.window:-self.window])
+            # Re-index onto the current window's columns, NaN where a market was not usable before
+            position = np.full(len(ids), -1)
+            position[prev_columns] = np.arange(len(prev_columns))
+            p = position[columns]
+            previous = np.where((p[:, None] >= 0) & (p[None, :] >= 0), prev_corr[p][:, p], np.nan)
+        info = _market_info(markets)
+        events = np.array([info.get(ids[c], {}).get("event_id") or "" for c in columns])
+        i, j = np.triu_indices(len(columns), k=1)
+        strength = np.abs(current[i, j])
+        same_event = (events[i] == events[j]) & (events[i] != "")
+        # The strongest pairs overall, plus every pair of related markets
+        order = np.argsort(-strength, kind="stable")
+        order = np.concatenate([order[:top], order[top:][same_event[order[top:]]]])
+        pairs = []
+        for k in order:
+            a, b = ids[columns[i[k]]], ids[columns[j[k]]]
+            corr = float(current[i[k], j[k]])
+            prev = None if previous is None or np.isnan(previous[i[k], j[k]]) else float(previous[i[k], j[k]])
+            pairs.append({
+                "condition_id_a": a,
+                "condition_id_b": b,
+                "question_a": info.get(a, {}).get("question"),
+                "question_b": info.get(b, {}).get("question"),
+                "same_event": bool(same_event[k]),
+                "correlation": corr,
+                "previous_correlation": prev,
+                "change": None if prev is None else corr - prev,
+            })
+        return pairs
+
+    def _event_sums(self, ids: list, prices: np.ndarray, markets: pl.DataFrame) -> list:
+        """Sum of outcome prices per negRisk event, now and at its worst over the lookback"""
+        if not ids or markets.is_empty():
+            return []
+        events = (
+            markets.filter(pl.col("neg_risk") & pl.col("event_id").is_not_null())
+            .group_by("event_id")
+            .agg(pl.col("condition_id"), pl.col("question"))
+            .filter(pl.col("condition_id").list.len() >= 2)
+        )
+        if events.is_empty():
+            return []
+        column = {cid: n for n, cid in enumerate(ids)}
+        # events x markets membership matrix, so every event is summed in one matmul
+        membership = np.zeros((events.height, len(ids)))
+        for e, members in enumerate(events["condition_id"].to_list()):
+            membership[e, [column[c] for c in members if c in column]] = 1.0
+        priced = np.where(np.isnan(prices), 0.0, 1.0) @ membership.T
+        sums = np.where(np.isnan(prices), 0.0, prices) @ membership.T
+        sizes = membership.sum(axis=1)
+        # Only a sum over every outcome of the event means anything
+        complete = priced == events["condition_id"].list.len().to_numpy()
+        deviation = np.where(complete, sums - 1.0, np.nan)
+        latest = prices[-1] if len(prices) else np.array([])
+        results = []
+        for e, row in enumerate(events.iter_rows(named=True)):
+            if sizes[e] == 0:
+                continue
+            history = deviation[:, e][~np.isnan(deviation[:, e])]
+            results.append({
+                "event_id": row["event_id"],
+                "markets": len(row["condition_id"]),
+                "priced_markets": int(sizes[e]),
+                "price_sum": float(sums[-1, e]) if complete[-1, e] else None,
+                "deviation": float(deviation[-1, e]) if complete[-1, e] else None,
+                "max_abs_deviation": float(np.abs(history).max()) if len(history) else None,
+                "outcomes": [
+                    {
+                        "condition_id": cid,
+                        "question": question,
+                        "price": float(latest[column[cid]]) if cid in column and not np.isnan(latest[column[cid]]) else None,
+                    }
+                    for cid, question in zip(row["condition_id"], row["question"])
+                ],
+            })
+        results.sort(key=lambda r: -abs(r["deviation"]) if r["deviation"] is not None else 0.0)
+        return results
+
+
+def _market_info(markets: pl.DataFrame) -> dict:
+    return {row["condition_id"]: row for row in markets.iter_rows(named=True)}
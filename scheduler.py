@@ -0,0 +1,111 @@
+from typing import Optional
+from market import AsyncMarketAPI
+from cache import TradeCache
+import itertools
+import asyncio
+import logging
+
+logger = logging.getLogger("polymarket.scheduler")
+
+
+class SyncScheduler:
+    """
+    Keeps the most active open markets warm in TradeStorage.
+
+    Every `interval` seconds the top `top_markets` open markets by 24h volume are
+    pulled from the gamma API and queued by priority. A pool of `workers` tasks
+    syncs them through the TradeCache, hottest first, skipping markets whose
+    stored trades are still fresh, so a market that is also being requested is
+    synced once. Upstream rate limiting and 429/5xx backoff are handled by the
+    AsyncMarketAPI shared with the request path.
+    """
+    def __init__(self, market: AsyncMarketAPI, cache: TradeCache,
+                 workers: int = 4,
+                 interval: float = 60.0,
+                 top_markets: int = 200):
+        self.market = market
+        self.cache = cache
+        self.workers = workers
+        self.interval = interval
+        self.top_markets = top_markets
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._queued: set[str] = set()
+        self._counter = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        self.logger = logger
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self.logger.info("Starting sync scheduler with %s workers", self.workers)
+        self._tasks.append(asyncio.create_task(self._plan_loop()))
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.logger.info("Sync scheduler stopped")
+
+    async def plan(self) -> int:
+        """
+        Queue the current top markets for a sync.
+
+        Returns:
+            int: The number of markets newly queued.
+        """
+        page_size = min(500, self.top_markets)
+        pages = await self.market.get_markets_pages(
+            range(0, self.top_markets, page_size),
+            limit=page_size,
+            closed=False,
+            order="volume24hr",
+            ascending=False,
+        )
+        queued = 0
+        for market in (m for page in pages if page for m in page):
+            condition_id = market.get("conditionId")
+            if not condition_id or condition_id in self._queued:
+                continue
+            self._queued.add(condition_id)
+            self._queue.put_nowait((-priority(market), next(self._counter), condition_id))
+            queued += 1
+        self.logger.info("Queued %s markets for sync", queued)
+        return queued
+
+    async def _plan_loop(self) -> None:
+        while True:
+            try:
+                await self.plan()
+            except Exception as e:
+                self.logger.error("Error planning market syncs: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, condition_id = await self._queue.get()
+            try:
+                state = await asyncio.to_thread(self.cache.storage.get_sync_state, condition_id)
+                if state is None or not self.cache.is_fresh(state):
+                    await self.cache.refresh(condition_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("Error syncing %s: %s", condition_id, e)
+            finally:
+                self._queued.discard(condition_id)
+                self._queue.task_done()
+
+
+def priority(market: dict) -> float:
+    """Sync priority for a gamma market: recent activity first, then lifetime volume"""
+    return _float(market.get("volume24hr")) + 0.01 * _float(market.get("volume"))
+
+
+def _float(value: Optional[object]) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,156 @@
+from typing import AsyncIterator, Optional
+from datetime import datetime, timezone
+from cache import TradeCache
+import pyarrow as pa
+import asyncio
+import logging
+
+logger = logging.getLogger("polymarket.stream")
+
+
+class TradeStream:
+    """
+    Pushes newly stored trades to subscribers, per market.
+
+    The first subscriber to a market starts one poller that syncs it through the
+    TradeCache every `poll_interval` seconds; the last one to leave stops it, so
+    upstream load is per market, not per viewer. Subscribers are fed from a
+    TradeStorage listener, so they see every trade this process stores for the
+    market, whoever triggered the sync, from the second of the market's newest
+    stored trade when they subscribed (or of the time they subscribed, for a
+    market not stored yet) on, so a backfill is not replayed to them. The listener
+    is only registered while there are subscribers. A subscriber that falls more
+    than `queue_size` batches behind is dropped rather than buffered without bound.
+    """
+    def __init__(self, cache: TradeCache,
+                 poll_interval: float = 5.0,
+                 queue_size: int = 256):
+        self.cache = cache
+        self.storage = cache.storage
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        # Each subscriber's queue, and the timestamp its trades must be at or after
+        self._subscribers: dict[str, dict[asyncio.Queue, Optional[datetime]]] = {}
+        self._pollers: dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listening = False
+        self.logger = logger
+
+    def start(self) -> None:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+
+    async def stop(self) -> None:
+        self._stop_listening()
+        self._loop = None
+        for task in self._pollers.values():
+            task.cancel()
+        await asyncio.gather(*self._pollers.values(), return_exceptions=True)
+        self._pollers = {}
+        for queues in self._subscribers.values():
+            for q in queues:
+                _close(q)
+
+    async def subscribe(self, condition_id: str,
+                        heartbeat: Optional[float] = None) -> AsyncIterator[Optional[pa.Table]]:
+        """
+        Yield each batch of new trades for condition_id until the caller stops
+        iterating. With `heartbeat`, None is yielded after that many idle seconds
+        so the caller can keep its connection alive.
+        """
+        self.start()
+        q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        queues = self._subscribers.setdefault(condition_id, {})
+        # Registered before the high-water mark is read, so trades stored meanwhile are not missed
+        queues[q] = None
+        self._start_listening()
+        try:
+            since = await asyncio.to_thread(self.storage.get_last_trade_time, condition_id)
+            # Trade timestamps are whole seconds
+            queues[q] = since or datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+            if condition_id not in self._pollers:
+                self._pollers[condition_id] = asyncio.create_task(self._poll(condition_id))
+            self.logger.info("New subscriber for %s (%s total)", condition_id, len(queues))
+            while True:
+                try:
+                    table = await asyncio.wait_for(q.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if table is None:
+                    return
+                yield table
+        finally:
+            self._unsubscribe(condition_id, q)
+
+    def subscriber_count(self, condition_id: str) -> int:
+        return len(self._subscribers.get(condition_id, ()))
+
+    def _unsubscribe(self, condition_id: str, q: asyncio.Queue) -> None:
+        queues = self._subscribers.get(condition_id)
+        if queues is None:
+            return
+        queues.pop(q, None)
+        if not queues:
+            del self._subscribers[condition_id]
+            poller = self._pollers.pop(condition_id, None)
+            if poller is not None:
+                poller.cancel()
+            self.logger.info("Last subscriber for %s left, stopped polling", condition_id)
+        if not self._subscribers:
+            self._stop_listening()
+
+    def _start_listening(self) -> None:
+        if not self._listening:
+            self.storage.add_listener(self._on_insert)
+            self._listening = True
+
+    def _stop_listening(self) -> None:
+        # Without a listener, inserts skip rendering the new trades altogether
+        if self._listening:
+            self.storage.remove_listener(self._on_insert)
+            self._listening = False
+
+    async def _poll(self, condition_id: str) -> None:
+        while True:
+            try:
+                await self.cache.refresh(condition_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("Error polling %s: %s", condition_id, e)
+            await asyncio.sleep(self.poll_interval)
+
+    def _on_insert(self, table: pa.Table) -> None:
+        # Storage listener: may run on the writer thread, so hop onto the event loop
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._publish, table)
+
+    def _publish(self, table: pa.Table) -> None:
+        # Deferred: only needed once someone subscribes
+        import pyarrow.compute as pc
+        for condition_id in pc.unique(table["condition_id"]).to_pylist():
+            queues = self._subscribers.get(condition_id)
+            if not queues:
+                continue
+            trades = table.filter(pc.equal(table["condition_id"], condition_id))
+            for q, since in list(queues.items()):
+                new = trades if since is None else trades.filter(
+                    pc.greater_equal(trades["timestamp"], pa.scalar(since, trades.schema.field("timestamp").type))
+                )
+                if new.num_rows == 0:
+                    continue
+                try:
+                    q.put_nowait(new)
+                except asyncio.QueueFull:
+                    self.logger.warning("Dropping slow subscriber for %s", condition_id)
+                    queues.pop(q, None)
+                    _close(q)
+
+
+def _close(q: asyncio.Queue) -> None:
+    """End a subscriber's stream, discarding whatever it had not consumed yet"""
+    while not q.empty():
+        q.get_nowait()
+    q.put_nowait(None)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+from typing import Optional
+from trades import TradeStorage
+import hashlib
+import pytest
+
+T0 = 1_700_000_000
+
+
+def condition_id(n: int) -> str:
+    return "0x" + hashlib.sha256(f"market-{n}".encode()).hexdigest()
+
+
+def trade(n: int, market: int = 0,
+          timestamp: Optional[int] = None,
+          size: float = 10.0,
+          price: float = 0.5,
+          side: str = "BUY",
+          outcome_index: int = 0,
+          wallet: Optional[str] = None,
+          name: str = "trader") -> dict:
+    """A /trades payload row with a unique hash per `n`"""
+    return {
+        "transactionHash": "0x" + hashlib.sha256(f"trade-{n}".encode()).hexdigest(),
+        "conditionId": condition_id(market),
+        "name": name,
+        "proxyWallet": wallet or f"0x{n % 5:040x}",
+        "size": size,
+        "price": price,
+        "side": side,
+        "outcomeIndex": outcome_index,
+        "timestamp": T0 + n if timestamp is None else timestamp,
+    }
+
+
+def gamma_market(n: int, updated: str = "2024-01-01T00:00:00Z",
+                 closed: bool = False,
+                 prices: str = '["0.5", "0.5"]',
+                 event: str = "1",
+                 neg_risk: bool = False) -> dict:
+    """A gamma /markets record for the market of `condition_id(n)`"""
+    return {
+        "id": str(n),
+        "conditionId": condition_id(n),
+        "question": f"Market {n}?",
+        "negRisk": neg_risk,
+        "closed": closed,
+        "endDate": "2024-06-30T00:00:00Z",
+        "updatedAt": updated,
+        "volume": "100",
+        "outcomes": '["Yes", "No"]',
+        "outcomePrices": prices,
+        "events": [{"id": event, "slug": f"event-{event}"}],
+    }
+
+
+class FakeGamma:
+    """Serves `markets` like gamma /markets, filtered on `closed` and ordered by `order`"""
+    def __init__(self, markets: list):
+        self.markets = markets
+
+    def get_markets(self, limit: int, offset: int = 0, order: Optional[str] = None,
+                    ascending: Optional[bool] = None, closed: Optional[bool] = None, **kwargs):
+        rows = [m for m in self.markets if closed is None or m["closed"] == closed]
+        if order:
+            rows = sorted(rows, key=lambda m: m[order], reverse=not ascending)
+        page = rows[offset:offset + limit]
+        return SimpleNamespace(ok=True, json=lambda: page)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = TradeStorage(str(tmp_path / "trades.duckdb"), shared=False)
+    yield storage
+    storage.close()
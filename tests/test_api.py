@@ -0,0 +1,96 @@
+from fastapi.testclient import TestClient
+from conftest import trade, condition_id
+import pytest
+import os
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """The app on a temporary database, with the background services and upstream syncs off"""
+    root = tmp_path_factory.mktemp("api")
+    os.environ.update(
+        TRADES_DB_PATH=str(root / "trades.duckdb"),
+        CATALOG_PATH=str(root / "catalog"),
+        CATALOG_WARMUP_CAP="0",
+        SCHEDULER_ENABLED="false",
+        WALLET_PROFILER_ENABLED="false",
+        STORAGE_MAINTENANCE_ENABLED="false",
+        CATALOG_REFRESH_ENABLED="false",
+    )
+    import app as api
+    api.tstorage.insert_trades([trade(n) for n in range(20)])
+
+    async def synced(*args, **kwargs):
+        return None
+
+    api.cache.ensure = api.cache.ensure_user = synced
+    return api
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_trade_pages_follow_the_cursor(client):
+    hashes, cursor = [], None
+    while True:
+        params = {"limit": 6, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/markets/{condition_id(0)}/trades", params=params).json()
+        hashes += [t["hash"] for t in page["trades"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert hashes == [trade(n)["transactionHash"] for n in reversed(range(20))]
+
+
+@pytest.mark.parametrize("path, params", [
+    (f"/markets/{condition_id(0)}/trades", {"limit": 0}),
+    (f"/markets/{condition_id(0)}/trades", {"limit": -1}),
+    (f"/markets/{condition_id(0)}/trades", {"limit": 5_001}),
+    ("/users/0x0/trades", {"limit": 0}),
+    ("/users/leaderboard", {"limit": 0}),
+    ("/users/leaderboard", {"limit": 5_001}),
+    (f"/markets/{condition_id(0)}/user-distribution", {"top_n": 0}),
+    ("/users/0x0", {"top_n": 0}),
+    ("/users/0x0", {"top_n": -1}),
+    ("/users/0x0", {"top_n": 5_001}),
+])
+def test_out_of_range_limits_are_rejected(client, path, params):
+    assert client.get(path, params=params).status_code == 422
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "1:2", "12:0xzz", ":0xab", "9999999999999999999:0xab"])
+def test_malformed_cursors_are_rejected(client, cursor):
+    for path in (f"/markets/{condition_id(0)}/trades", "/users/0x0/trades"):
+        response = client.get(path, params={"cursor": cursor})
+        assert response.status_code == 400
+        assert "Invalid cursor" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("limit", [0, -1, 50_001])
+def test_out_of_range_candle_limits_are_rejected(client, limit):
+    assert client.get(f"/markets/{condition_id(0)}/candles", params={"limit": limit}).status_code == 422
+
+
+@pytest.mark.parametrize("limit", [0, -1, 50_001])
+def test_out_of_range_feature_limits_are_rejected(client, limit):
+    assert client.get(f"/markets/{condition_id(0)}/features", params={"limit": limit}).status_code == 422
+
+
+@pytest.mark.parametrize("heartbeat", [0, -1, 0.5, 301])
+def test_out_of_range_heartbeats_are_rejected(client, heartbeat):
+    assert client.get(f"/markets/{condition_id(0)}/stream", params={"heartbeat": heartbeat}).status_code == 422
+
+
+@pytest.mark.parametrize("path", [
+    f"/markets/{condition_id(0)}/trades",
+    "/users/0x0/trades",
+    f"/markets/{condition_id(0)}/candles",
+    f"/markets/{condition_id(0)}/features",
+])
+def test_out_of_range_windows_are_rejected(client, path):
+    for params in ({"start": 10_000_000_000_000_000}, {"end": 10_000_000_000_000_000}, {"start": -1}):
+        assert client.get(path, params=params).status_code == 422
+    assert client.get(path, params={"start": 0, "end": 253_402_300_799}).status_code == 200
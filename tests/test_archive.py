@@ -0,0 +1,88 @@
+from collections import Counter
+from conftest import trade, condition_id
+import threading
+import fcntl
+import glob
+import os
+
+
+def resolutions(*markets: int) -> str:
+    """A resolutions relation in which `markets` resolved to outcome 0"""
+    rows = ", ".join(f"('{condition_id(m)}', 0)" for m in markets)
+    return f"(SELECT * FROM (VALUES {rows}) v(condition_id, outcome_index))"
+
+
+def store(storage, markets: range, per_market: int = 20) -> dict:
+    """Stored, fully backfilled markets, with their trades by market"""
+    trades = {m: [trade(m * 1_000 + n, market=m) for n in range(per_market)] for m in markets}
+    for m, rows in trades.items():
+        storage.insert_trades(rows)
+        storage.save_sync_state(condition_id(m), per_market, True, rows[-1]["timestamp"])
+    return trades
+
+
+def hot(storage, market: int) -> int:
+    return storage.conn.execute("SELECT count(*) FROM trades WHERE condition_id = ?", [condition_id(market)]).fetchone()[0]
+
+
+def test_archived_trades_are_read_through_the_union(storage):
+    trades = store(storage, range(3))
+    before = {m: storage.get_trades_df(condition_id(m)).sort("hash") for m in range(3)}
+    assert storage.archive_resolved(resolutions(0, 1), min_age=0) == 40
+    assert (hot(storage, 0), hot(storage, 1), hot(storage, 2)) == (0, 0, 20)
+    for m in range(3):
+        assert storage.get_trades_df(condition_id(m)).sort("hash").equals(before[m])
+    page, _ = storage.query_trades(condition_id=condition_id(0), limit=100)
+    assert page.column("hash").to_pylist() == [t["transactionHash"] for t in reversed(trades[0])]
+    # Refetched archived trades stay out of the hot table
+    storage.insert_trades(trades[0])
+    assert hot(storage, 0) == 0 and storage.get_trades_df(condition_id(0)).height == 20
+    assert storage.archive_resolved(resolutions(0, 1), min_age=0) == 0
+
+
+def test_compaction_merges_small_files(storage):
+    store(storage, range(6))
+    for m in range(6):
+        storage.archive_resolved(resolutions(m), min_age=0)
+    files = Counter(os.path.dirname(f) for f in glob.glob(os.path.join(storage.archive_path, "bucket=*", "*.parquet")))
+    # Two of these markets share a bucket
+    shared = sum(n for n in files.values() if n > 1)
+    assert shared >= 2
+    assert storage.compact_archive() == shared
+    assert len(glob.glob(os.path.join(storage.archive_path, "bucket=*", "*.parquet"))) == len(files)
+    for m in range(6):
+        assert storage.get_trades_df(condition_id(m)).height == 20
+
+
+def test_archive_stages_while_readers_hold_the_archive(storage):
+    store(storage, range(2))
+    archived = []
+    # A reader of the cold tier, in the middle of a query
+    with storage._archive_lock(fcntl.LOCK_SH):
+        archiving = threading.Thread(target=lambda: archived.append(storage.archive_resolved(resolutions(0), min_age=0)))
+        archiving.start()
+        archiving.join(timeout=2)
+        # Staged and deleted, but not committed until the files can be swapped in
+        assert archiving.is_alive() and not archived
+        assert hot(storage, 0) == 20
+    archiving.join()
+    assert archived == [20] and hot(storage, 0) == 0
+
+
+def test_wallet_reads_only_open_their_buckets(storage):
+    # Wallet 0xaa only traded market 0, 0xbb markets 0, 2 and 3; 0 and 2 (in other buckets) are archived
+    storage.insert_trades([trade(n, market=0, wallet="0xAA", price=0.2) for n in range(10)])
+    storage.insert_trades([trade(100 + n, market=m, wallet="0xBB") for m in (0, 2, 3) for n in range(m * 10, m * 10 + 5)])
+    for m in (0, 2, 3):
+        storage.save_sync_state(condition_id(m), 0, True, None)
+    assert storage.archive_resolved(resolutions(0, 2), min_age=0) == 20
+    with storage._reader() as conn:
+        assert f"bucket={condition_id(0)[2:4]}" in storage._trades_sql(conn, wallets=["0xaa"])
+        assert f"bucket={condition_id(2)[2:4]}" not in storage._trades_sql(conn, wallets=["0xaa"])
+        assert f"bucket={condition_id(2)[2:4]}" in storage._trades_sql(conn, wallets=["0xbb"])
+        assert storage._trades_sql(conn, wallets=["0xcc"]) == "trades"
+    assert storage.query_trades(wallet="0xAA")[0].num_rows == 10
+    assert storage.query_trades(wallet="0xbb")[0].num_rows == 15
+    # Notional 10 * 10 * 0.2 = 20 against 15 * 10 * 0.5 = 75, mostly archived
+    assert storage.get_top_wallets(2) == ["0xbb", "0xaa"]
+    assert storage.get_wallet_profile("0xbb", resolutions(0, 2))["trades"] == 15
@@ -0,0 +1,73 @@
+from typing import Optional
+from backfill import TradeBackfill
+from conftest import trade, condition_id
+import asyncio
+
+PAGE = 10
+
+
+class FakeMarket:
+    """Serves `trades` newest first like the data API, failing the pages in `fail`"""
+    def __init__(self, trades: list):
+        self.trades = sorted(trades, key=lambda t: -t["timestamp"])
+        self.fail: set = set()
+        self.errors: set = set()
+        self.requests = 0
+
+    async def get_trades_for_market(self, market: str, limit: int, offset: int, raw: bool = False) -> Optional[list]:
+        self.requests += 1
+        if offset in self.fail:
+            return None
+        if offset in self.errors:
+            return b'{"error": "upstream unavailable"}'
+        return self.trades[offset:offset + limit]
+
+    async def get_trades_for_market_pages(self, market: str, offsets, limit: int, raw: bool = False) -> list:
+        return [await self.get_trades_for_market(market, limit, offset) for offset in offsets]
+
+
+def test_backfill_stores_full_history(storage):
+    market = FakeMarket([trade(n) for n in range(95)])
+    asyncio.run(TradeBackfill(market, storage, page_size=PAGE).sync(condition_id(0)))
+    assert storage.get_trades_df(condition_id(0)).height == 95
+    state = storage.get_sync_state(condition_id(0))
+    assert state["backfill_complete"] and state["high_water"] == trade(94)["timestamp"]
+
+
+def test_interrupted_backfill_resumes(storage):
+    market = FakeMarket([trade(n) for n in range(95)])
+    market.fail = {50}
+    backfill = TradeBackfill(market, storage, page_size=PAGE, concurrency=2)
+    asyncio.run(backfill.sync(condition_id(0)))
+    state = storage.get_sync_state(condition_id(0))
+    assert not state["backfill_complete"] and state["backfill_offset"] == 50
+
+    market.fail = set()
+    asyncio.run(backfill.sync(condition_id(0)))
+    assert storage.get_trades_df(condition_id(0)).height == 95
+    assert storage.get_sync_state(condition_id(0))["backfill_complete"]
+
+
+def test_error_page_interrupts_backfill(storage):
+    market = FakeMarket([trade(n) for n in range(95)])
+    market.errors = {30}
+    backfill = TradeBackfill(market, storage, page_size=PAGE, concurrency=2)
+    asyncio.run(backfill.sync(condition_id(0)))
+    state = storage.get_sync_state(condition_id(0))
+    assert not state["backfill_complete"] and state["backfill_offset"] == 30
+    assert storage.get_trades_df(condition_id(0)).height == 30
+
+    market.errors = set()
+    asyncio.run(backfill.sync(condition_id(0)))
+    assert storage.get_trades_df(condition_id(0)).height == 95
+
+
+def test_head_sync_stops_at_high_water(storage):
+    market = FakeMarket([trade(n) for n in range(95)])
+    backfill = TradeBackfill(market, storage, page_size=PAGE)
+    asyncio.run(backfill.sync(condition_id(0)))
+    market.trades = sorted([trade(n) for n in range(98)], key=lambda t: -t["timestamp"])
+    market.requests = 0
+    asyncio.run(backfill.sync(condition_id(0)))
+    assert market.requests == 1
+    assert storage.get_trades_df(condition_id(0)).height == 98
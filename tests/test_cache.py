@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from cache import TradeCache
+from backfill import TradeBackfill
+from conftest import trade, condition_id
+import asyncio
+import time
+
+
+class FakeBackfill:
+    """Counts syncs, each of which marks the market as synced at `synced_at`"""
+    def __init__(self, storage, high_water: int):
+        self.storage = storage
+        self.high_water = high_water
+        self.syncs = 0
+
+    async def sync(self, key: str, committed: Optional[asyncio.Event] = None) -> int:
+        self.syncs += 1
+        await asyncio.sleep(0.01)
+        self.storage.save_sync_state(key, 0, True, self.high_water)
+        return 0
+
+
+def age_state(storage, key: str, seconds: float) -> None:
+    with storage._writer() as conn:
+        conn.execute("UPDATE sync_state SET synced_at = ? WHERE condition_id = ?",
+                     [datetime.now() - timedelta(seconds=seconds), key])
+
+
+def test_miss_hit_stale(storage):
+    backfill = FakeBackfill(storage, high_water=int(time.time()))
+    cache = TradeCache(backfill, storage, hot_ttl=30)
+    key = condition_id(0)
+
+    async def run():
+        assert await cache.ensure(key) == "miss"
+        assert await cache.ensure(key) == "hit"
+        age_state(storage, key, 60)
+        assert await cache.ensure(key) == "stale"
+        # The background revalidation is joined rather than started twice
+        assert await cache.ensure(key) == "stale"
+        await asyncio.gather(*cache._inflight.values())
+        assert await cache.ensure(key) == "hit"
+
+    asyncio.run(run())
+    assert backfill.syncs == 2
+
+
+def test_dormant_markets_use_cold_ttl(storage):
+    backfill = FakeBackfill(storage, high_water=int(time.time()) - 10 * 86400)
+    cache = TradeCache(backfill, storage, hot_ttl=30, cold_ttl=3600)
+    key = condition_id(0)
+
+    async def run():
+        await cache.ensure(key)
+        age_state(storage, key, 600)
+        return await cache.ensure(key)
+
+    assert asyncio.run(run()) == "hit"
+
+
+def test_concurrent_misses_share_one_sync(storage):
+    backfill = FakeBackfill(storage, high_water=int(time.time()))
+    cache = TradeCache(backfill, storage)
+
+    async def run():
+        return await asyncio.gather(*(cache.ensure(condition_id(0)) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["miss"] * 5
+    assert backfill.syncs == 1
+
+
+class GatedMarket:
+    """Serves `trades` newest first, holding every page past the first window until `gate` is set"""
+    def __init__(self, trades: list, window: int):
+        self.trades = sorted(trades, key=lambda t: -t["timestamp"])
+        self.window = window
+        self.gate = asyncio.Event()
+
+    async def get_trades_for_market_pages(self, market: str, offsets, limit: int, raw: bool = False) -> list:
+        if offsets[0] >= self.window:
+            await self.gate.wait()
+        return [self.trades[offset:offset + limit] for offset in offsets]
+
+    async def get_trades_for_market(self, market: str, limit: int, offset: int, raw: bool = False) -> list:
+        return self.trades[offset:offset + limit]
+
+
+def test_miss_waits_for_the_first_window_only(storage):
+    market = GatedMarket([trade(n) for n in range(100)], window=20)
+    cache = TradeCache(TradeBackfill(market, storage, page_size=10, concurrency=2), storage)
+    key = condition_id(0)
+
+    async def run():
+        assert await asyncio.wait_for(cache.ensure(key), 5) == "miss"
+        # The newest trades are served while the rest of the history is fetched
+        assert storage.get_trades_df(key).height == 20
+        assert not storage.get_sync_state(key)["backfill_complete"]
+        assert await cache.ensure(key) == "stale"
+        market.gate.set()
+        await asyncio.gather(*cache._inflight.values())
+
+    asyncio.run(run())
+    assert storage.get_trades_df(condition_id(0)).height == 100
+    assert storage.get_sync_state(condition_id(0))["backfill_complete"]
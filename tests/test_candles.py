@@ -0,0 +1,50 @@
+from conftest import trade, condition_id, T0
+import random
+
+COLUMNS = "bucket, open, high, low, close, volume, buy_volume, sell_volume, trade_count"
+
+
+def recomputed(storage, resolution: str) -> list:
+    """Candles computed from scratch over all stored trades"""
+    width = {"1m": "1 minute", "1h": "1 hour", "1d": "1 day"}[resolution]
+    return storage.conn.execute(f"""
+        SELECT
+            time_bucket(INTERVAL '{width}', timestamp) AS bucket,
+            arg_min(p, timestamp), max(p), min(p), arg_max(p, timestamp),
+            sum(size)::DOUBLE,
+            coalesce(sum(size) FILTER (WHERE side = 'BUY'), 0)::DOUBLE,
+            coalesce(sum(size) FILTER (WHERE side = 'SELL'), 0)::DOUBLE,
+            count(*)
+        FROM (SELECT *, CASE WHEN outcome_index = 1 THEN 1 - price ELSE price END::DOUBLE AS p FROM trades)
+        GROUP BY bucket
+        ORDER BY bucket
+    """).fetchall()
+
+
+def stored(storage, resolution: str) -> list:
+    return storage.conn.execute(
+        f"SELECT {COLUMNS} FROM candles WHERE resolution = ? ORDER BY bucket", [resolution]
+    ).fetchall()
+
+
+def test_candles_match_a_full_recompute(storage):
+    rng = random.Random(7)
+    trades = [
+        trade(n, timestamp=T0 + n * 37, price=round(rng.uniform(0.05, 0.95), 2),
+              side=rng.choice(["BUY", "SELL"]), outcome_index=rng.choice([0, 1]), size=rng.randint(1, 50))
+        for n in range(400)
+    ]
+    rng.shuffle(trades)
+    # Out of order batches, with every trade delivered twice
+    for batch in range(0, 400, 50):
+        storage.insert_trades(trades[batch:batch + 50])
+        storage.insert_trades(trades[max(batch - 25, 0):batch + 25])
+    for resolution in ("1m", "1h", "1d"):
+        assert stored(storage, resolution) == recomputed(storage, resolution)
+
+
+def test_latest_candles_oldest_first(storage):
+    storage.insert_trades([trade(n, timestamp=T0 + n * 3600) for n in range(10)])
+    buckets = storage.get_candles(condition_id(0), resolution="1h", limit=3).column("bucket").to_pylist()
+    everything = storage.get_candles(condition_id(0), resolution="1h").column("bucket").to_pylist()
+    assert len(everything) == 10 and buckets == everything[-3:]
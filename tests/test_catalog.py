@@ -0,0 +1,84 @@
+from catalog import CatalogIngester, CatalogRefresher, catalog_sql, resolutions_sql, dataset_path, ingested
+from types import SimpleNamespace
+from conftest import condition_id, gamma_market, FakeGamma
+import asyncio
+import duckdb
+import os
+
+PAGE = 5
+
+
+def rows(root: str) -> list:
+    return duckdb.sql(f"SELECT id, closed FROM {catalog_sql(root)} ORDER BY id::INT").fetchall()
+
+
+def test_ingest_writes_open_and_closed(tmp_path):
+    root = str(tmp_path / "catalog")
+    gamma = FakeGamma([gamma_market(n, "2024-01-01T00:00:00Z", closed=n % 2 == 0) for n in range(12)])
+    assert CatalogIngester(gamma, root=root, page_size=PAGE).ingest(closed=False) == 6
+    assert CatalogIngester(gamma, root=root, page_size=PAGE).ingest(closed=True) == 6
+    assert rows(root) == [(str(n), n % 2 == 0) for n in range(12)]
+
+
+def test_refresh_writes_updates_and_compacts(tmp_path):
+    root = str(tmp_path / "catalog")
+    markets = [gamma_market(n, f"2024-01-01T00:00:{n:02d}Z") for n in range(12)]
+    gamma = FakeGamma(markets)
+    ingester = CatalogIngester(gamma, root=root, page_size=PAGE)
+    for closed in (False, True):
+        ingester.ingest(closed=closed)
+    # Market 3 resolves and a new market appears
+    markets[3] = gamma_market(3, "2024-02-01T00:00:00Z", closed=True, prices='["1", "0"]')
+    markets.append(gamma_market(12, "2024-02-01T00:00:01Z"))
+    assert asyncio.run(CatalogRefresher(ingester).run_once()) == 2
+    assert rows(root) == [(str(n), n == 3) for n in range(13)]
+    files = duckdb.sql(f"SELECT count(*) FROM glob('{dataset_path(root)}/**/*.parquet')").fetchone()[0]
+    assert files == 2
+    resolved = duckdb.sql(f"SELECT * FROM {resolutions_sql(root)}").fetchall()
+    assert resolved == [(condition_id(3), 0)]
+    assert ingester.refresh() == 0
+
+
+class FlakyGamma(FakeGamma):
+    """FakeGamma failing the pages at the offsets in `fail`"""
+    def __init__(self, markets: list):
+        super().__init__(markets)
+        self.fail: set = set()
+
+    def get_markets(self, limit: int, offset: int = 0, **kwargs):
+        if offset in self.fail:
+            return SimpleNamespace(ok=False)
+        return super().get_markets(limit, offset, **kwargs)
+
+
+def test_interrupted_ingest_is_run_again(tmp_path):
+    root = str(tmp_path / "catalog")
+    gamma = FlakyGamma([gamma_market(n, f"2024-01-01T00:00:{n:02d}Z") for n in range(12)])
+    gamma.fail = {5}
+    ingester = CatalogIngester(gamma, root=root, page_size=PAGE)
+    assert ingester.ingest() == 5
+    assert ingester.exists() and not ingested(root)
+    # The markets it never reached are older than the watermark; a refresh fetches them anyway
+    gamma.fail = set()
+    assert ingester.refresh() == 12
+    assert ingested(root) and len(rows(root)) == 12
+    assert ingester.refresh() == 0
+
+
+def test_compaction_keeps_a_readable_dataset(tmp_path):
+    root = str(tmp_path / "catalog")
+    markets = [gamma_market(n, f"2024-01-01T00:00:{n:02d}Z") for n in range(6)]
+    ingester = CatalogIngester(FakeGamma(markets), root=root, page_size=PAGE)
+    ingester.ingest()
+    # Left behind by a crash of the old directory swap
+    os.makedirs(f"{root}.old/closed=false")
+    versions = [dataset_path(root)]
+    for n in range(6, 9):
+        markets.append(gamma_market(n, f"2024-02-01T00:00:{n:02d}Z"))
+        assert ingester.refresh() == 1
+        versions.append(dataset_path(root))
+        assert len(rows(root)) == n + 1
+    # Readers may still be on the version just replaced; older ones are gone
+    assert len(set(versions)) == 4
+    assert sorted(os.listdir(root)) == sorted([".ingested-all", "CURRENT", *map(os.path.basename, versions[-2:])])
+    assert not os.path.exists(f"{root}.old")
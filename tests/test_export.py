@@ -0,0 +1,55 @@
+from export import TradeExporter
+from conftest import trade, condition_id, T0
+import polars as pl
+import export
+import os
+
+PAGE = 10
+
+
+class FakeData:
+    """Serves trades newest first like the data API, failing the markets in `down`"""
+    def __init__(self, trades: list):
+        self.trades = sorted(trades, key=lambda t: -t["timestamp"])
+        self.down: set = set()
+        self.requests: dict = {}
+
+    def get_trades_for_market(self, market: str, limit: int, offset: int):
+        self.requests[market] = self.requests.get(market, 0) + 1
+        if market in self.down:
+            return None
+        return [t for t in self.trades if t["conditionId"] == market][offset:offset + limit]
+
+
+class FakeExporter(TradeExporter):
+    fake: FakeData = None
+
+    @property
+    def market(self) -> FakeData:
+        return self.fake
+
+
+def exporter(out: str, storage, fake: FakeData) -> FakeExporter:
+    e = FakeExporter(out, storage, snapshot_at=T0 + 100, workers=2, page_size=PAGE, batch_rows=25, retries=1)
+    e.fake = fake
+    return e
+
+
+def test_export_resumes_with_the_failed_markets(storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(export.time, "sleep", lambda seconds: None)
+    out = str(tmp_path / "out")
+    # Three markets of 45 trades each, the last 5 of every market after the snapshot
+    fake = FakeData([trade(m * 1_000 + n, market=m, timestamp=T0 + 60 + n) for m in range(3) for n in range(45)])
+    fake.down = {condition_id(1)}
+    markets = [condition_id(m) for m in range(3)]
+    assert exporter(out, storage, fake).run(markets) == {
+        "markets": 3, "exported": 2, "skipped": 0, "failed": 1, "trades": 80,
+    }
+    assert sorted(os.listdir(os.path.join(out, "trades"))) == sorted(f"{condition_id(m)}.parquet" for m in (0, 2))
+    fake.down, fake.requests = set(), {}
+    assert exporter(out, storage, fake).run(markets) == {
+        "markets": 3, "exported": 1, "skipped": 2, "failed": 0, "trades": 40,
+    }
+    assert set(fake.requests) == {condition_id(1)}
+    exported = pl.read_parquet(os.path.join(out, "trades", f"{condition_id(1)}.parquet"))
+    assert exported["timestamp"].is_sorted() and exported.height == 40
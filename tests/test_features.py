@@ -0,0 +1,77 @@
+from trades import TradeStorage
+from conftest import trade, condition_id, T0
+import random
+import pytest
+
+
+def trades(count: int) -> list:
+    rng = random.Random(3)
+    return [
+        trade(n, market=n % 2, timestamp=T0 + n * 53, size=round(rng.lognormvariate(3, 2), 2),
+              price=round(rng.uniform(0.01, 0.99), 3), side=rng.choice(["BUY", "SELL"]),
+              outcome_index=rng.randint(0, 1))
+        for n in range(count)
+    ]
+
+
+def test_incremental_features_match_a_single_insert(storage, tmp_path):
+    rows = trades(3_000)
+    # Newest first with overlapping batches, like a backfill racing live polling
+    newest_first = sorted(rows, key=lambda t: -t["timestamp"])
+    for start in range(0, len(rows), 200):
+        storage.insert_trades(newest_first[start:start + 300])
+    once = TradeStorage(str(tmp_path / "once.duckdb"), shared=False)
+    try:
+        once.insert_trades(rows)
+        for resolution in ("1m", "1h", "1d"):
+            for market in range(2):
+                incremental = storage.get_features(condition_id(market), resolution).to_pylist()
+                expected = once.get_features(condition_id(market), resolution).to_pylist()
+                assert len(incremental) == len(expected)
+                for got, want in zip(incremental, expected):
+                    assert got.pop("bucket") == want.pop("bucket")
+                    assert got == pytest.approx(want, nan_ok=True)
+    finally:
+        once.close()
+
+
+def test_latest_features_oldest_first(storage):
+    storage.insert_trades([trade(n, timestamp=T0 + n * 3600) for n in range(10)])
+    buckets = storage.get_features(condition_id(0), resolution="1h", limit=4).column("bucket").to_pylist()
+    everything = storage.get_features(condition_id(0), resolution="1h").column("bucket").to_pylist()
+    assert len(everything) == 10 and buckets == everything[-4:]
+
+
+def test_features_of_one_bucket(storage):
+    storage.insert_trades([
+        trade(0, timestamp=T0, size=10, price=0.4, side="BUY", outcome_index=0),
+        trade(1, timestamp=T0 + 60, size=20, price=0.5, side="SELL", outcome_index=0),
+        trade(2, timestamp=T0 + 120, size=5, price=0.3, side="BUY", outcome_index=1),
+    ])
+    row, = storage.get_features(condition_id(0), resolution="1h").to_pylist()
+    assert row["trade_count"] == 3
+    assert (row["buy_volume"], row["sell_volume"], row["net_flow"]) == (15, 20, -15)
+    assert row["count_imbalance"] == pytest.approx(1 / 3)
+    assert row["mean_size"] == pytest.approx(35 / 3)
+    assert row["price_change"] == pytest.approx(0.3)
+    assert row["impact_per_volume"] == pytest.approx(-0.02)
+    assert row["mean_gap_seconds"] == 60
+
+
+def test_features_with_candle_columns_are_migrated(storage):
+    storage.insert_trades([trade(n, timestamp=T0 + n * 3600) for n in range(5)])
+    expected = storage.get_features(condition_id(0)).to_pylist()
+    conn = storage.conn
+    conn.execute("ALTER TABLE market_features ADD COLUMN open DOUBLE")
+    conn.execute("ALTER TABLE market_features ADD COLUMN trade_count BIGINT")
+    storage.close()
+    reopened = TradeStorage(storage.path, shared=False)
+    try:
+        features = reopened.get_features(condition_id(0)).to_pylist()
+        columns = [c for c, in reopened.conn.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'market_features'"
+        ).fetchall()]
+        assert "open" not in columns and "trade_count" not in columns
+        assert features == expected
+    finally:
+        reopened.close()
@@ -0,0 +1,61 @@
+from fastapi.encoders import jsonable_encoder
+from formats import (negotiate, arrow_response, JSON_MEDIA_TYPE, ARROW_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE,
+                     PARQUET_MEDIA_TYPE, NDJSON_MEDIA_TYPE)
+from conftest import trade, condition_id
+import pyarrow.parquet as pq
+import pyarrow as pa
+import polars as pl
+import asyncio
+import json
+import io
+import pytest
+
+
+def body(response) -> bytes:
+    async def read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(read())
+
+
+def stored_trades(storage, n: int = 50) -> pa.Table:
+    storage.insert_trades([trade(i, size=1.07 + i, price=0.123) for i in range(n)])
+    return pa.Table.from_batches(list(storage.iter_trades_arrow(condition_id(0))))
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON_MEDIA_TYPE),
+    ("*/*", JSON_MEDIA_TYPE),
+    ("application/vnd.apache.arrow.stream", ARROW_MEDIA_TYPE),
+    ("application/vnd.apache.arrow.file", ARROW_FILE_MEDIA_TYPE),
+    ("application/json;q=0.5, application/x-parquet;q=0.9", PARQUET_MEDIA_TYPE),
+    ("application/jsonl;q=0", JSON_MEDIA_TYPE),
+    ("text/html", JSON_MEDIA_TYPE),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_binary_formats_round_trip(storage):
+    table = stored_trades(storage)
+    assert pa.ipc.open_stream(body(arrow_response(table, ARROW_MEDIA_TYPE, batch_size=7))).read_all().equals(table)
+    assert pa.ipc.open_file(body(arrow_response(table, ARROW_FILE_MEDIA_TYPE, batch_size=7))).read_all().equals(table)
+    assert pq.read_table(io.BytesIO(body(arrow_response(table, PARQUET_MEDIA_TYPE, batch_size=7)))).equals(table)
+
+
+def test_reader_is_streamed(storage):
+    table = stored_trades(storage)
+    batches = storage.iter_trades_arrow(condition_id(0), batch_size=10)
+    reader = pa.RecordBatchReader.from_batches(table.schema, batches)
+    assert pa.ipc.open_stream(body(arrow_response(reader, ARROW_MEDIA_TYPE))).read_all().num_rows == 50
+
+
+def test_ndjson_matches_json(storage):
+    table = stored_trades(storage, n=3)
+    lines = [json.loads(line) for line in body(arrow_response(table, NDJSON_MEDIA_TYPE)).splitlines()]
+    assert lines == json.loads(json.dumps(jsonable_encoder(pl.from_arrow(table).to_dicts())))
+    assert lines[0]["size"] == 1.07 and lines[0]["timestamp"] == "2023-11-14T22:13:20"
+
+
+def test_no_batches_for_unknown_market(storage):
+    stored_trades(storage, n=3)
+    assert list(storage.iter_trades_arrow(condition_id(9))) == []
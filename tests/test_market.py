@@ -0,0 +1,35 @@
+from market import TokenBucket, AsyncMarketAPI
+import asyncio
+import httpx
+import time
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    async def run() -> tuple:
+        bucket = TokenBucket(rate=50, capacity=5)
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(5)))
+        burst = time.monotonic() - start
+        await asyncio.gather(*(bucket.acquire() for _ in range(25)))
+        return burst, time.monotonic() - start
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    # 25 tokens beyond the burst at 50 per second
+    assert 0.45 <= total < 0.75
+
+
+def test_throttled_requests_are_retried():
+    statuses = [429, 503, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = statuses.pop(0)
+        return httpx.Response(status, json=[] if status == 200 else None, headers={"Retry-After": "0"})
+
+    async def run() -> httpx.Response:
+        async with AsyncMarketAPI(rate_limit=100, backoff_base=0.01) as api:
+            await api.client.aclose()
+            api.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            return await api._get(f"{api.data_api_url}/trades")
+
+    assert asyncio.run(run()).status_code == 200 and statuses == []
@@ -0,0 +1,34 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from metrics import RequestMetricsMiddleware
+import asyncio
+
+app = FastAPI()
+app.add_middleware(RequestMetricsMiddleware)
+
+
+@app.get("/slow/{n}")
+async def slow(n: int) -> StreamingResponse:
+    async def chunks():
+        for i in range(n):
+            await asyncio.sleep(0.1)
+            yield b"chunk\n"
+    return StreamingResponse(chunks())
+
+
+def request_seconds(route: str, status: str) -> tuple:
+    labels = {"route": route, "method": "GET", "status": status}
+    return (REGISTRY.get_sample_value("polymarket_request_seconds_count", labels) or 0,
+            REGISTRY.get_sample_value("polymarket_request_seconds_sum", labels) or 0)
+
+
+def test_streamed_body_is_timed_until_complete():
+    with TestClient(app) as client:
+        count, seconds = request_seconds("/slow/{n}", "200")
+        assert client.get("/slow/3").text == "chunk\n" * 3
+        assert client.get("/missing").status_code == 404
+    after_count, after_seconds = request_seconds("/slow/{n}", "200")
+    assert after_count == count + 1 and after_seconds - seconds >= 0.3
+    assert request_seconds("unmatched", "404")[0] >= 1
@@ -0,0 +1,65 @@
+from catalog import CatalogIngester
+from scanner import MarketScanner
+from conftest import trade, condition_id, gamma_market, FakeGamma
+import random
+import time
+import pytest
+
+HOURS = 30
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    root = str(tmp_path / "catalog")
+    # Markets 0-2 are the open outcomes of a negRisk event, 3 its closed (lost) outcome;
+    # 4-6 are unrelated open markets and 7 a closed one
+    markets = [gamma_market(n, event="e", neg_risk=True) for n in range(3)]
+    markets.append(gamma_market(3, event="e", neg_risk=True, closed=True, prices='["0", "1"]'))
+    markets += [gamma_market(n, event=f"m{n}") for n in range(4, 7)]
+    markets.append(gamma_market(7, event="m7", closed=True, prices='["1", "0"]'))
+    for closed in (False, True):
+        CatalogIngester(FakeGamma(markets), root=root).ingest(closed=closed)
+    return root
+
+
+def hourly(market: int, prices: list, first: int) -> list:
+    """One trade per hour at `prices`, starting `HOURS` hours ago"""
+    start = (int(time.time()) // 3600 - HOURS) * 3600
+    return [trade(first + h, market=market, timestamp=start + h * 3600 + 60, price=round(p, 4))
+            for h, p in enumerate(prices)]
+
+
+def walk(seed: int) -> list:
+    rng = random.Random(seed)
+    prices = [0.5]
+    for _ in range(HOURS - 1):
+        prices.append(min(max(prices[-1] + rng.uniform(-0.05, 0.05), 0.05), 0.95))
+    return prices
+
+
+def test_event_sums_cover_open_outcomes(storage, catalog):
+    for market, price in enumerate([0.5, 0.4, 0.3]):
+        storage.insert_trades(hourly(market, [price] * HOURS, first=market * 1_000))
+    storage.insert_trades(hourly(3, [0.2] * HOURS, first=3_000))
+    events = MarketScanner(storage, catalog_root=catalog).scan()["events"]
+    assert len(events) == 1
+    event = events[0]
+    assert event["event_id"] == "e" and event["markets"] == 3
+    assert event["price_sum"] == pytest.approx(1.2)
+    assert event["deviation"] == pytest.approx(0.2)
+    assert {o["condition_id"] for o in event["outcomes"]} == {condition_id(n) for n in range(3)}
+
+
+def test_correlations_of_open_markets(storage, catalog):
+    base = walk(1)
+    storage.insert_trades(hourly(4, base, first=4_000))
+    storage.insert_trades(hourly(5, [0.2 + p / 2 for p in base], first=5_000))
+    storage.insert_trades(hourly(6, [1 - p for p in base], first=6_000))
+    storage.insert_trades(hourly(7, base, first=7_000))
+    result = MarketScanner(storage, catalog_root=catalog, window=24).scan()
+    assert result["markets"] == 3
+    pairs = {(p["condition_id_a"], p["condition_id_b"]): p["correlation"] for p in result["correlations"]}
+    correlation = {frozenset(pair): value for pair, value in pairs.items()}
+    assert correlation[frozenset({condition_id(4), condition_id(5)})] == pytest.approx(1.0, abs=1e-3)
+    assert correlation[frozenset({condition_id(4), condition_id(6)})] == pytest.approx(-1.0, abs=1e-3)
+    assert not any(condition_id(7) in pair for pair in correlation)
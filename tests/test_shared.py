@@ -0,0 +1,75 @@
+from trades import TradeStorage
+from conftest import trade, condition_id
+import subprocess
+import glob
+import textwrap
+import sys
+import os
+
+
+def shared_storage(tmp_path) -> TradeStorage:
+    return TradeStorage(str(tmp_path / "trades.duckdb"), shared=True)
+
+
+def test_cached_reader_sees_writes_from_another_process(tmp_path):
+    storage = shared_storage(tmp_path)
+    try:
+        storage.insert_trades([trade(n) for n in range(10)])
+        storage.flush()
+        assert storage.get_market_stats(condition_id(0))["trade_count"] == 10
+        writer = textwrap.dedent(f"""
+            import sys
+            sys.path[:0] = [{os.getcwd()!r}, {os.path.dirname(__file__)!r}]
+            from trades import TradeStorage
+            from conftest import trade
+            storage = TradeStorage({str(tmp_path / "trades.duckdb")!r}, shared=True)
+            storage.insert_trades([trade(n) for n in range(10, 15)])
+            storage.close()
+        """)
+        # Runs while this process still holds its cached read-only connection
+        subprocess.run([sys.executable, "-c", writer], check=True, timeout=60)
+        assert storage.get_market_stats(condition_id(0))["trade_count"] == 15
+    finally:
+        storage.close()
+
+
+def test_dropped_trades_block_their_sync_state(tmp_path, monkeypatch):
+    storage = shared_storage(tmp_path)
+    try:
+        storage.open()
+        key = condition_id(0)
+        with monkeypatch.context() as m:
+            m.setattr(storage, "_insert_df", lambda conn, df: (_ for _ in ()).throw(RuntimeError("disk full")))
+            storage.insert_trades([trade(n) for n in range(10)])
+            storage.flush()
+        # The cursor must not move past the lost trades
+        storage.save_sync_state(key, 500, True, 1)
+        storage.flush()
+        assert storage.get_market_stats(key) is None
+        with storage._reader() as conn:
+            assert conn.execute("SELECT count(*) FROM sync_state").fetchone()[0] == 0
+        # A new sync starts from the stored state and may save it again
+        assert storage.get_sync_state(key) is None
+        storage.insert_trades([trade(n) for n in range(10)])
+        storage.save_sync_state(key, 500, True, 1)
+        storage.flush()
+        assert storage.get_sync_state(key)["backfill_complete"]
+    finally:
+        storage.close()
+
+
+def test_stalled_download_does_not_hold_up_writes(tmp_path):
+    storage = shared_storage(tmp_path)
+    try:
+        storage.insert_trades([trade(n) for n in range(100)])
+        storage.flush()
+        # A client that read one batch and went quiet
+        batches = storage.iter_trades_arrow(condition_id(0), batch_size=10)
+        assert next(batches).num_rows == 10
+        storage.insert_trades([trade(n) for n in range(100, 110)])
+        storage.flush(timeout=5)
+        assert storage.get_market_stats(condition_id(0))["trade_count"] == 110
+        assert sum(batch.num_rows for batch in batches) == 90
+        assert not glob.glob(str(tmp_path / ".spool-*"))
+    finally:
+        storage.close()
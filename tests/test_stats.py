@@ -0,0 +1,41 @@
+from conftest import trade, condition_id
+import pytest
+
+
+def test_stats_count_wallets_not_names(storage):
+    # Two wallets behind one display name, and one with an empty name
+    storage.insert_trades([
+        trade(0, wallet="0xaaa", name="whale", size=30, price=0.4),
+        trade(1, wallet="0xbbb", name="whale", size=10, price=0.6),
+        trade(2, wallet="0xccc", name="", size=10, price=0.5, side="SELL"),
+    ])
+    stats = storage.get_market_stats(condition_id(0))
+    assert stats["trade_count"] == 3
+    assert stats["unique_users"] == 3
+    assert stats["volume"] == pytest.approx(50)
+    assert stats["vwap"] == pytest.approx((12 + 6 + 5) / 50)
+    assert stats["last_price"] == pytest.approx(0.5)
+
+
+def test_user_distribution_by_wallet(storage):
+    storage.insert_trades([
+        trade(0, wallet="0xaaa", name="whale", size=30),
+        trade(1, wallet="0xbbb", name="whale", size=10),
+        trade(2, wallet="0xbbb", name="renamed", size=10, side="SELL"),
+    ])
+    distribution = storage.get_user_distribution(condition_id(0), top_n=1)
+    assert distribution["unique_users"] == 2
+    assert distribution["total_size"] == pytest.approx(50)
+    assert distribution["hhi"] == pytest.approx((30 ** 2 + 20 ** 2) / 50 ** 2)
+    assert distribution["top_n_share"] == pytest.approx(0.6)
+    assert distribution["top_users"] == [
+        {"wallet": "0xaaa", "user": "whale", "size": 30.0, "buy_size": 30.0, "sell_size": 0.0,
+         "trades": 1, "share": pytest.approx(0.6)},
+    ]
+    runner_up = storage.get_user_distribution(condition_id(0), top_n=2)["top_users"][1]
+    assert (runner_up["wallet"], runner_up["user"], runner_up["sell_size"]) == ("0xbbb", "renamed", 10.0)
+
+
+def test_stats_of_unknown_market(storage):
+    assert storage.get_market_stats(condition_id(9)) is None
+    assert storage.get_user_distribution(condition_id(9)) is None
@@ -0,0 +1,55 @@
+from contextlib import aclosing
+from stream import TradeStream
+from conftest import trade, condition_id, T0
+import asyncio
+import time
+
+
+class FakeCache:
+    """Stores the next of `batches` on every refresh, like a sync finding new trades"""
+    def __init__(self, storage, batches: list):
+        self.storage = storage
+        self.batches = batches
+
+    async def refresh(self, condition_id: str) -> None:
+        if self.batches:
+            await asyncio.to_thread(self.storage.insert_trades, self.batches.pop(0))
+
+
+async def received(stream: TradeStream, market: int, batches: int) -> list:
+    """The trades pushed to one subscriber until it sees `batches` heartbeats"""
+    hashes = []
+    async with aclosing(stream.subscribe(condition_id(market), heartbeat=0.2)) as tables:
+        async for table in tables:
+            if table is None:
+                batches -= 1
+                if batches < 0:
+                    break
+                continue
+            hashes += table.column("hash").to_pylist()
+    return hashes
+
+
+def test_only_trades_newer_than_the_subscription_are_pushed(storage):
+    storage.insert_trades([trade(n) for n in range(50)])
+    # A resumed backfill of older trades, then the head of the market moving on
+    older = [trade(n, timestamp=T0 - n) for n in range(100, 400)]
+    newer = [trade(n) for n in range(50, 60)]
+    stream = TradeStream(FakeCache(storage, [older, newer]), poll_interval=0.01)
+
+    async def run() -> list:
+        stream.start()
+        assert storage._listeners == []
+        hashes = await received(stream, 0, batches=3)
+        assert storage._listeners == []
+        return hashes
+
+    assert asyncio.run(run()) == [t["transactionHash"] for t in newer]
+
+
+def test_new_market_backfill_is_not_replayed(storage):
+    now = int(time.time())
+    history = [trade(n, market=1) for n in range(300)]
+    live = [trade(1_000, market=1, timestamp=now + 60)]
+    stream = TradeStream(FakeCache(storage, [history, live]), poll_interval=0.01)
+    assert asyncio.run(received(stream, 1, batches=3)) == [live[0]["transactionHash"]]
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from trades import TradeStorage, CursorError, InsertError, EPOCH, FEATURE_SIZE_BINS, encode_cursor, decode_cursor
+from conftest import trade, condition_id, T0
+import polars as pl
+import threading
+import duckdb
+import json
+import pytest
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 3, 1, 12, 30, 5, 250)
+    micros, trade_hash = decode_cursor(encode_cursor(timestamp, "0xab01"))
+    assert (micros, trade_hash) == (1709296205000250, "0xab01")
+
+
+@pytest.mark.parametrize("cursor", ["", "12", "x:0xab", "12:ab", "12:0xabc", "12:0xAB", "9999999999999999999:0xab"])
+def test_malformed_cursor(cursor):
+    with pytest.raises(CursorError):
+        decode_cursor(cursor)
+
+
+def test_pages_by_wallet_and_window(storage):
+    storage.insert_trades([trade(n, market=n % 3, wallet="0xAA" if n % 2 else None) for n in range(30)])
+    first, cursor = storage.query_trades(wallet="0xaa", start=trade(5)["timestamp"], limit=5)
+    rest, end = storage.query_trades(wallet="0xaa", start=trade(5)["timestamp"], cursor=cursor, limit=100)
+    assert end is None
+    expected = [trade(n)["transactionHash"] for n in reversed(range(5, 30, 2))]
+    assert first.column("hash").to_pylist() + rest.column("hash").to_pylist() == expected
+
+
+def test_cluster_keeps_trades_and_indexes(storage):
+    storage.insert_trades([trade(n, market=n % 4) for n in range(40)])
+    storage.cluster()
+    conn = storage.conn
+    assert conn.execute("SELECT count(*) FROM trades").fetchone()[0] == 40
+    assert conn.execute("SELECT list(condition_id) = list_sort(list(condition_id)) FROM trades").fetchone()[0]
+    indexes = {name for name, in conn.execute("SELECT index_name FROM duckdb_indexes() WHERE table_name = 'trades'").fetchall()}
+    assert indexes == {"trades_condition_id", "trades_wallet"}
+    storage.insert_trades([trade(0, market=0)])
+    assert storage.query_trades(condition_id=condition_id(1))[0].num_rows == 10
+
+
+def test_cluster_waits_for_enough_new_trades(storage):
+    storage.insert_trades([trade(n, market=n % 4) for n in range(100)])
+    assert storage.cluster() == 100
+    assert storage.cluster() == 0
+    # Duplicates are not new trades
+    storage.insert_trades([trade(n, market=n % 4) for n in range(100)] + [trade(n, market=n % 4) for n in range(100, 110)])
+    assert storage.cluster() == 0
+    storage.insert_trades([trade(n, market=n % 4) for n in range(110, 130)])
+    assert storage.cluster() == 130
+
+
+def test_writes_during_cluster_are_kept(storage):
+    storage.insert_trades([trade(n, market=n % 50) for n in range(20_000)])
+    clustering = threading.Thread(target=storage.cluster)
+    clustering.start()
+    for n in range(20):
+        storage.insert_trades([trade(100_000 + n)])
+    clustering.join()
+    assert storage.conn.execute("SELECT count(*) FROM trades").fetchone()[0] == 20_020
+
+
+def test_concurrent_inserts_into_one_market(storage):
+    # Candles and features of the first trades already exist, so every insert updates them
+    storage.insert_trades([trade(n) for n in range(10)])
+    threads = [
+        threading.Thread(target=storage.insert_trades, args=([trade(100 * t + n) for n in range(10, 60)],))
+        for t in range(1, 9)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    conn = storage.conn
+    assert conn.execute("SELECT count(*) FROM trades").fetchone()[0] == 410
+    for table, count in (("candles", "trade_count"), ("market_features", " + ".join(FEATURE_SIZE_BINS))):
+        counts = conn.execute(f"SELECT resolution, sum({count}) FROM {table} GROUP BY ALL ORDER BY ALL").fetchall()
+        assert counts == [("1d", 410), ("1h", 410), ("1m", 410)]
+
+
+def test_error_objects_are_not_stored(storage):
+    storage.open()
+    for payload in (b'{"error": "rate limited"}', {"error": "rate limited"}):
+        with pytest.raises(InsertError):
+            storage.insert_trades(payload)
+    assert storage.conn.execute("SELECT count(*) FROM trades").fetchone()[0] == 0
+
+
+def test_raw_bytes_match_parsed_trades(tmp_path):
+    trades = [{**trade(n, price=0.123, size=1.5 + n), "outcome": "Yes", "icon": None} for n in range(20)]
+    stored = []
+    for name, payload in (("parsed", trades), ("raw", json.dumps(trades).encode())):
+        storage = TradeStorage(str(tmp_path / f"{name}.duckdb"), shared=False)
+        storage.insert_trades(payload)
+        stored.append(storage.get_trades_df(condition_id(0)).sort("hash"))
+        storage.close()
+    assert stored[0].height == 20 and stored[0].equals(stored[1])
+
+
+def test_baseline_database_is_migrated(tmp_path):
+    # The original schema and insert: free-form columns, epoch seconds cast as nanoseconds
+    path = str(tmp_path / "data.parquet")
+    trades = [trade(n, timestamp=T0 + n * 3600, price=0.25, size=3.5, side="SELL" if n % 2 else "BUY") for n in range(10)]
+    with duckdb.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE trades (
+                hash VARCHAR PRIMARY KEY, condition_id VARCHAR, user VARCHAR, size DECIMAL,
+                price DECIMAL, side VARCHAR, timestamp TIMESTAMP
+            )
+        """)
+        df = pl.DataFrame(trades).select(
+            pl.col("transactionHash").alias("hash"), pl.col("conditionId").alias("condition_id"),
+            pl.col("name").alias("user"), "size", "price", "side",
+            pl.col("timestamp").cast(pl.Datetime("ns")),
+        )
+        conn.register("trades_temp", df)
+        conn.execute("INSERT INTO trades SELECT * FROM trades_temp")
+    storage = TradeStorage(path, shared=False)
+    try:
+        migrated = storage.get_trades_df(condition_id(0)).sort("timestamp")
+        assert migrated["hash"].to_list() == [t["transactionHash"] for t in trades]
+        # The microsecond column kept only the thousands of the seconds cast as nanoseconds
+        assert migrated["timestamp"].to_list() == [EPOCH + timedelta(seconds=t["timestamp"] // 1000 * 1000) for t in trades]
+        assert migrated["side"].to_list() == [t["side"] for t in trades]
+        assert migrated["size"].cast(pl.Float64).to_list() == [3.5] * 10
+        assert migrated["price"].cast(pl.Float64).to_list() == [0.25] * 10
+        assert migrated["wallet"].null_count() == 10
+        # Candles are built for the migrated trades, and new trades go in alongside them
+        assert storage.conn.execute("SELECT sum(trade_count) FROM candles WHERE resolution = '1d'").fetchone()[0] == 10
+        storage.insert_trades([trade(n) for n in range(5, 15)])
+        assert storage.get_trades_df(condition_id(0)).height == 15
+    finally:
+        storage.close()
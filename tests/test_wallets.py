@@ -0,0 +1,64 @@
+from conftest import trade, condition_id
+import pytest
+
+WALLET = "0x" + "ab" * 20
+OTHER = "0x" + "cd" * 20
+
+
+def resolutions(*outcomes: tuple) -> str:
+    """A resolutions relation of (market, winning outcome_index) pairs"""
+    rows = ", ".join(f"('{condition_id(m)}', {outcome})" for m, outcome in outcomes)
+    return f"(SELECT * FROM (VALUES {rows}) v(condition_id, outcome_index))"
+
+
+# Market 0 resolved to outcome 0 and market 1 to outcome 1; markets 2 and 3 are open
+RESOLUTIONS = resolutions((0, 0), (1, 1))
+
+
+@pytest.fixture
+def traded(storage):
+    storage.insert_trades([
+        # Won: bought 100 at 0.40, sold half at 0.70, the rest pays out 1
+        trade(0, market=0, size=100, price=0.40, wallet=WALLET),
+        trade(1, market=0, size=50, price=0.70, side="SELL", wallet=WALLET),
+        # Lost: the outcome held resolved to 0
+        trade(2, market=1, size=10, price=0.30, wallet=WALLET),
+        # Open, partially sold: 50 of 200 shares bought at 0.30 on average, sold at 0.50
+        trade(3, market=2, size=100, price=0.20, wallet=WALLET),
+        trade(4, market=2, size=100, price=0.40, wallet=WALLET),
+        trade(5, market=2, size=50, price=0.50, side="SELL", wallet=WALLET),
+        # Open, nothing sold yet
+        trade(6, market=3, size=10, price=0.50, wallet=WALLET),
+        trade(7, market=0, size=10, price=0.60, outcome_index=1, wallet=OTHER),
+    ])
+    return storage
+
+
+def test_wallet_profile(traded):
+    profile = traded.get_wallet_profile(WALLET, RESOLUTIONS)
+    assert profile["trades"] == 7 and profile["markets"] == 4
+    assert (profile["resolved_markets"], profile["wins"], profile["win_rate"]) == (2, 1, 0.5)
+    volumes = [75, 3, 85, 5]
+    assert profile["volume"] == pytest.approx(sum(volumes))
+    assert profile["realized_pnl"] == pytest.approx(45 - 3 + 10)
+    assert profile["avg_entry_price"] == pytest.approx((40 + 3 + 60 + 5) / (100 + 10 + 200 + 10))
+    assert profile["concentration"] == pytest.approx(sum(v * v for v in volumes) / sum(volumes) ** 2)
+    assert profile["top_market_share"] == pytest.approx(85 / sum(volumes))
+    markets = [(m["condition_id"], m["resolved"], m["won"], m["realized_pnl"]) for m in profile["top_markets"]]
+    assert markets == [
+        (condition_id(2), False, False, pytest.approx(10)),
+        (condition_id(0), True, True, pytest.approx(45)),
+        (condition_id(3), False, False, 0),
+        (condition_id(1), True, False, pytest.approx(-3)),
+    ]
+    assert len(traded.get_wallet_profile(WALLET, RESOLUTIONS, top_n=2)["top_markets"]) == 2
+
+
+def test_stored_wallet_stats_match_the_profile(traded):
+    traded.refresh_wallet_stats(RESOLUTIONS)
+    leaderboard = traded.get_wallet_leaderboard()
+    assert [w["wallet"] for w in leaderboard] == [WALLET, OTHER]
+    assert leaderboard[0]["realized_pnl"] == pytest.approx(52)
+    # Held the losing outcome of market 0
+    assert leaderboard[1]["realized_pnl"] == pytest.approx(-6) and leaderboard[1]["win_rate"] == 0
+    assert [w["wallet"] for w in traded.get_wallet_leaderboard(order_by="volume", min_resolved=2)] == [WALLET]
@@ -1,11 +1,87 @@
-from typing import Optional, Union
-from market import MarketAPI
+from typing import Optional, Union, Iterator, Callable
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from metrics import timed
 import polars as pl
+import pyarrow as pa
 import duckdb
+import threading
+import tempfile
+import shutil
+import uuid
+import glob
+import io
 import logging
+import queue
+import fcntl
+import re
+import time
 import os
 
 
+EPOCH = datetime(1970, 1, 1)
+
+# Compact trade storage: 32-byte binary hash, enum side, fixed-precision
+# price/size. DuckDB dictionary-compresses the repetitive condition_id and
+# wallet strings per row group, so they stay VARCHAR for readable queries.
+TRADES_SCHEMA = """
+    hash BLOB PRIMARY KEY,
+    condition_id VARCHAR,
+    user VARCHAR,
+    wallet VARCHAR,
+    size DECIMAL(18, 6),
+    price DECIMAL(7, 6),
+    side trade_side,
+    outcome_index UTINYINT,
+    timestamp TIMESTAMP
+"""
+
+# Share of the trades inserted since the last `cluster` at which it rewrites the table
+CLUSTER_MIN_UNCLUSTERED = 0.2
+
+# Files per archive bucket below this size are merged by compact_archive
+ARCHIVE_TARGET_FILE_BYTES = 64 * 1024 * 1024
+
+# Trade columns as served, with the hash rendered back to its 0x hex form
+TRADE_COLUMNS = """
+    '0x' || lower(hex(hash)) AS hash,
+    condition_id, user, wallet, size, price, side, outcome_index, timestamp
+"""
+
+# The /trades payload fields kept, decoded straight into typed columns
+TRADE_API_SCHEMA = {
+    "transactionHash": pl.Utf8,
+    "conditionId": pl.Utf8,
+    "name": pl.Utf8,
+    "proxyWallet": pl.Utf8,
+    "size": pl.Float64,
+    "price": pl.Float64,
+    "side": pl.Utf8,
+    "outcomeIndex": pl.UInt8,
+    "timestamp": pl.Int64,
+}
+
+# wallet_stats columns a leaderboard can be ranked by
+WALLET_RANKINGS = ("realized_pnl", "win_rate", "volume", "trades", "resolved_markets", "concentration")
+
+# Candle resolutions maintained per market, and the bucket width of each
+CANDLE_RESOLUTIONS = {
+    "1m": "1 minute",
+    "1h": "1 hour",
+    "1d": "1 day",
+}
+
+# Trade-size histogram of market_features: column, and upper bound in shares
+# (None for the open-ended top bin)
+FEATURE_SIZE_BINS = {
+    "size_lt_10": 10,
+    "size_lt_100": 100,
+    "size_lt_1k": 1_000,
+    "size_lt_10k": 10_000,
+    "size_ge_10k": None,
+}
+
+
 class InsertError(Exception):
     """
     Exception raised when an error occurs while inserting trades
@@ -14,70 +90,1493 @@ class InsertError(Exception):
         self.message = message
         super().__init__(self.message)
 
-class TradeStorage:
+
+class CursorError(ValueError):
     """
-    Storage for trades data in a parquet file to avoid making too many requests to the market API
+    Exception raised for a pagination cursor that `query_trades` did not return
+    """
+
+def encode_cursor(timestamp: datetime, trade_hash: str) -> str:
+    """Opaque keyset cursor for the trade (timestamp, hash) a page ended on"""
+    micros = (timestamp - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}:{trade_hash}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, str]:
+    """The (microseconds since the epoch, hash) of a cursor, or CursorError if it is malformed"""
+    micros, _, trade_hash = cursor.partition(":")
+    if not re.fullmatch(r"-?\d{1,19}", micros) or not re.fullmatch(r"0x(?:[0-9a-f]{2})+", trade_hash):
+        raise CursorError(f"Invalid cursor: {cursor}")
+    try:
+        EPOCH + timedelta(microseconds=int(micros))
+    except OverflowError:
+        raise CursorError(f"Invalid cursor: {cursor}")
+    return int(micros), trade_hash
+
+
+def decode_trades(trades: Union[list, dict, bytes, pl.DataFrame]) -> pl.DataFrame:
+    """
+    Decode a /trades payload into a frame with the TRADE_API_SCHEMA columns.
+
+    Raw bytes are parsed by Polars directly into Arrow columns; fields outside
+    the schema are skipped rather than materialized. A payload that is neither a
+    list of trades nor a single trade, such as an error object, raises ValueError.
+    """
+    if isinstance(trades, pl.DataFrame):
+        return trades
+    if isinstance(trades, (bytes, bytearray)):
+        if not trades.lstrip().startswith(b"["):
+            raise ValueError(f"Expected a JSON list of trades, got: {bytes(trades[:200])!r}")
+        return pl.read_json(io.BytesIO(trades), schema=TRADE_API_SCHEMA)
+    if isinstance(trades, dict):
+        if "transactionHash" not in trades:
+            raise ValueError(f"Expected a list of trades, got: {str(trades)[:200]}")
+        trades = [trades]
+    if trades is not None and not isinstance(trades, list):
+        raise ValueError(f"Expected a list of trades, got {type(trades).__name__}")
+    return pl.DataFrame(trades or [], schema=TRADE_API_SCHEMA)
+
+
+def to_storage_frame(df: pl.DataFrame) -> pl.DataFrame:
+    """Convert decoded /trades columns to the trades table layout"""
+    return df.select(
+        pl.col("transactionHash").str.strip_prefix("0x").str.decode("hex").alias("hash"),
+        pl.col("conditionId").alias("condition_id"),
+        pl.col("name").alias("user"),
+        pl.col("proxyWallet").str.to_lowercase().alias("wallet"),
+        pl.col("size"),
+        pl.col("price"),
+        pl.col("side"),
+        pl.col("outcomeIndex").alias("outcome_index"),
+        pl.from_epoch(pl.col("timestamp"), time_unit="s").alias("timestamp"),
+    )
+
+
+class _ReadWriteLock:
+    """
+    In-process readers/writer lock. DuckDB refuses to open a read-only and a
+    read-write connection to the same file from one process at the same time.
     """
-    #TODO fix this so it can be used in a multi-process environment
     def __init__(self):
-        self.path = "data.parquet"
-        self.conn = duckdb.connect(self.path)
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+class TradeStorage:
+    """
+    Storage for trades data in a DuckDB file to avoid making too many requests to the market API
+
+    By default the process keeps one read-write connection open, which locks the
+    file for every other process. With `shared=True` (or TRADES_DB_MODE=shared)
+    several processes, e.g. uvicorn workers, can use the same file:
+
+    - reads share one cached read-only connection per process, so any number of
+      processes read in parallel. Every write bumps a generation counter in the
+      lock file; a reader that sees a new generation reopens the connection, and
+      the writer thread closes it once idle, so other processes can write
+    - writes are queued and applied in batches by a background thread, which only
+      holds the read-write lock while it flushes and serialises with the writers
+      of other processes through a lock file. If a batch of trades cannot be
+      written, later sync-state writes for its markets and wallets are refused
+      until their next sync starts, so the lost trades are refetched
+
+    The database is opened, and its schema created or migrated, by `open`, or on
+    first use if `open` was not called, so constructing a TradeStorage is free.
+
+    Trades of resolved markets can be moved out of the database into a cold tier
+    of zstd Parquet files under `archive_path` (see `archive_resolved`), one
+    directory per `bucket` (the first byte of the condition_id, itself a hash),
+    sorted by condition_id and timestamp. Reads union both tiers, opening only
+    the buckets of the market, or of the wallets, they are for.
+    """
+    def __init__(self, path: Optional[str] = None,
+                 shared: Optional[bool] = None,
+                 flush_interval: float = 0.5,
+                 max_batch_rows: int = 100_000,
+                 lock_timeout: float = 30.0,
+                 archive_path: Optional[str] = None):
+        self.path = path or os.getenv("TRADES_DB_PATH", "trades.duckdb")
+        self.archive_path = archive_path or os.getenv(
+            "TRADES_ARCHIVE_PATH", f"{os.path.splitext(self.path)[0]}_archive"
+        )
+        self._archive_lock_path = f"{self.archive_path}.lock"
+        if shared is None:
+            shared = os.getenv("TRADES_DB_MODE", "single") == "shared"
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self.max_batch_rows = max_batch_rows
+        self.lock_timeout = lock_timeout
         self.logger = logging.getLogger("polymarket.trades")
-        self.create_table()
+        self.conn = None
+        self._listeners: list[Callable[[pa.Table], None]] = []
+        self._opened = False
+        self._opening = False
+        self._open_lock = threading.RLock()
+        # Serialises the writers of a single-mode connection
+        self._write_lock = threading.Lock()
+        if self.shared:
+            self._lock = _ReadWriteLock()
+            self._lock_path = f"{self.path}.lock"
+            self._read_conn: Optional[duckdb.DuckDBPyConnection] = None
+            self._read_generation: Optional[str] = None
+            self._read_users = 0
+            self._read_cond = threading.Condition()
+            # sync_state keys whose trades were dropped after repeated write failures
+            self._lost: set[str] = set()
+            self._queue: queue.Queue = queue.Queue()
+            self._closed = threading.Event()
+            self._flusher = threading.Thread(target=self._flush_loop, name="trades-writer", daemon=True)
+
+    def open(self) -> None:
+        """Connect and create or migrate the schema; a no-op once done"""
+        if self._opened:
+            return
+        with self._open_lock:
+            # Other threads wait here; create_table re-enters from this one
+            if self._opened or self._opening:
+                return
+            self._opening = True
+            try:
+                start = time.perf_counter()
+                if not self.shared:
+                    self.conn = duckdb.connect(self.path)
+                self.create_table()
+                if self.shared:
+                    self._flusher.start()
+                self._opened = True
+                self.logger.info("Opened %s in %.2fs", self.path, time.perf_counter() - start)
+            except Exception:
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                raise
+            finally:
+                self._opening = False
 
     def create_table(self) -> None:
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS trades (
-                hash VARCHAR PRIMARY KEY,
+        with self._writer() as conn:
+            if not conn.execute("SELECT count(*) FROM duckdb_types() WHERE type_name = 'trade_side'").fetchone()[0]:
+                conn.execute("CREATE TYPE trade_side AS ENUM ('BUY', 'SELL')")
+            columns = dict(conn.execute(
+                "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'trades'"
+            ).fetchall())
+            if columns.get("hash") == "VARCHAR":
+                self._migrate_trades(conn, columns)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS trades ({TRADES_SCHEMA})")
+            self._create_trade_indexes(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    condition_id VARCHAR PRIMARY KEY,
+                    backfill_offset INTEGER,
+                    backfill_complete BOOLEAN,
+                    high_water BIGINT,
+                    synced_at TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS candles (
+                    condition_id VARCHAR,
+                    resolution VARCHAR,
+                    bucket TIMESTAMP,
+                    open DOUBLE,
+                    high DOUBLE,
+                    low DOUBLE,
+                    close DOUBLE,
+                    volume DOUBLE,
+                    buy_volume DOUBLE,
+                    sell_volume DOUBLE,
+                    trade_count BIGINT,
+                    first_trade TIMESTAMP,
+                    last_trade TIMESTAMP,
+                    PRIMARY KEY (condition_id, resolution, bucket)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS wallet_stats (
+                    wallet VARCHAR PRIMARY KEY,
+                    trades BIGINT,
+                    markets BIGINT,
+                    resolved_markets BIGINT,
+                    wins BIGINT,
+                    win_rate DOUBLE,
+                    volume DOUBLE,
+                    realized_pnl DOUBLE,
+                    avg_entry_price DOUBLE,
+                    concentration DOUBLE,
+                    top_market_share DOUBLE,
+                    first_trade TIMESTAMP,
+                    last_trade TIMESTAMP,
+                    updated_at TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS archived_markets (
+                    condition_id VARCHAR PRIMARY KEY,
+                    bucket VARCHAR,
+                    trades BIGINT,
+                    first_trade TIMESTAMP,
+                    last_trade TIMESTAMP,
+                    archived_at TIMESTAMP
+                )
+            """)
+            # The archive buckets holding each wallet's trades, and their notional,
+            # so wallet reads only open those buckets
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS archived_wallets (
+                    wallet VARCHAR,
+                    bucket VARCHAR,
+                    trades BIGINT,
+                    notional DOUBLE,
+                    PRIMARY KEY (wallet, bucket)
+                )
+            """)
+            # Trades inserted since the table was last clustered; all of them at first
+            conn.execute("CREATE TABLE IF NOT EXISTS cluster_state (unclustered_rows BIGINT, clustered_at TIMESTAMP)")
+            conn.execute("""
+                INSERT INTO cluster_state
+                SELECT (SELECT count(*) FROM trades), NULL
+                WHERE NOT EXISTS (FROM cluster_state)
+            """)
+            size_bins = "".join(f"{column} BIGINT, " for column in FEATURE_SIZE_BINS)
+            features = f"""
                 condition_id VARCHAR,
-                user VARCHAR,
-                size DECIMAL,
-                price DECIMAL,
-                side VARCHAR,
-                timestamp TIMESTAMP
-            )
+                resolution VARCHAR,
+                bucket TIMESTAMP,
+                buy_count BIGINT,
+                net_flow DOUBLE,
+                size_sum_sq DOUBLE,
+                size_max DOUBLE,
+                {size_bins}
+                PRIMARY KEY (condition_id, resolution, bucket)
+            """
+            columns = {c for c, in conn.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = 'market_features'"
+            ).fetchall()}
+            if "open" in columns:
+                self._migrate_features(conn, features)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS market_features ({features})")
+            # Build candles and features for trades stored before their tables existed
+            if conn.execute("SELECT NOT EXISTS (FROM candles) AND EXISTS (FROM trades)").fetchone()[0]:
+                self.logger.info("Building candles from stored trades")
+                self._update_candles(conn, "trades")
+            if conn.execute("SELECT NOT EXISTS (FROM market_features) AND EXISTS (FROM trades)").fetchone()[0]:
+                self.logger.info("Building market features from stored trades")
+                self._update_features(conn, "trades")
+            if conn.execute("SELECT NOT EXISTS (FROM archived_wallets) AND EXISTS (FROM archived_markets)").fetchone()[0]:
+                self.logger.info("Indexing the wallets of archived trades")
+                self._update_archived_wallets(conn, [f"{self.archive_path}/bucket=*/*.parquet"])
+
+    def _migrate_trades(self, conn: duckdb.DuckDBPyConnection, columns: dict) -> None:
+        """Rewrite a trades table from the original free-form VARCHAR/DECIMAL schema"""
+        self.logger.info("Migrating trades table to the compact schema")
+        # Rows written before timestamps were parsed as epoch seconds landed in 1970
+        timestamp = """CASE WHEN timestamp < TIMESTAMP '1971-01-01'
+                       THEN make_timestamp(epoch_ns(timestamp) * 1000000) ELSE timestamp END"""
+        wallet = "wallet" if "wallet" in columns else "NULL"
+        outcome_index = "outcome_index" if "outcome_index" in columns else "NULL"
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(f"CREATE TABLE trades_compact ({TRADES_SCHEMA})")
+        conn.execute(f"""
+            INSERT OR IGNORE INTO trades_compact
+            SELECT
+                unhex(regexp_replace(hash, '^0x', '')),
+                condition_id,
+                user,
+                {wallet},
+                size,
+                price,
+                side::trade_side,
+                {outcome_index},
+                {timestamp}
+            FROM trades
+            ORDER BY condition_id, timestamp
         """)
+        conn.execute("DROP TABLE trades")
+        conn.execute("ALTER TABLE trades_compact RENAME TO trades")
+        conn.execute("COMMIT")
+
+    def _migrate_features(self, conn: duckdb.DuckDBPyConnection, features: str) -> None:
+        """Drop the market_features columns that duplicated candles"""
+        self.logger.info("Migrating market_features to the columns candles do not hold")
+        kept = ", ".join(["condition_id", "resolution", "bucket", "buy_count", "net_flow", "size_sum_sq", "size_max",
+                          *FEATURE_SIZE_BINS])
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(f"CREATE TABLE market_features_slim ({features})")
+        conn.execute(f"INSERT INTO market_features_slim SELECT {kept} FROM market_features")
+        conn.execute("DROP TABLE market_features")
+        conn.execute("ALTER TABLE market_features_slim RENAME TO market_features")
+        conn.execute("COMMIT")
+
+    def _create_trade_indexes(self, conn: duckdb.DuckDBPyConnection) -> None:
+        # Point lookups by market or wallet; time windows and pagination are then
+        # resolved on the (much smaller) matching rows
+        conn.execute("CREATE INDEX IF NOT EXISTS trades_condition_id ON trades (condition_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS trades_wallet ON trades (wallet)")
+
+    def _connect(self, read_only: bool) -> duckdb.DuckDBPyConnection:
+        """Open a connection, retrying while another process holds a conflicting lock"""
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.005
+        while True:
+            try:
+                return duckdb.connect(self.path, read_only=read_only)
+            except duckdb.IOException as e:
+                if "lock" not in str(e).lower() or time.monotonic() > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.2)
+
+    @contextmanager
+    def _reader(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        self.open()
+        if not self.shared:
+            # A cursor per call, so reads can also run from worker threads
+            with self.conn.cursor() as conn, self._archive_lock(fcntl.LOCK_SH):
+                yield conn
+            return
+        with self._lock.read():
+            conn = self._acquire_reader()
+            try:
+                with conn.cursor() as cursor, self._archive_lock(fcntl.LOCK_SH):
+                    yield cursor
+            finally:
+                self._release_reader()
+
+    @contextmanager
+    def _writer(self, archive_lock: Optional[int] = fcntl.LOCK_SH) -> Iterator[duckdb.DuckDBPyConnection]:
+        self.open()
+        if not self.shared:
+            # One writer at a time, like the writer thread of shared mode: concurrent
+            # inserts conflict on the candle and feature rows they both upsert, and a
+            # write committed to a table being rewritten by `cluster` would be lost
+            with self._write_lock, self.conn.cursor() as conn, self._archive_lock(archive_lock) if archive_lock is not None else nullcontext():
+                yield conn
+            return
+        with self._lock.write(), open(self._lock_path, "a") as lock_file:
+            # No reader of this process is active; one process can't hold both kinds of connection
+            self._close_reader()
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Before connecting, so other processes release their readers
+                self._bump_generation()
+                conn = self._connect(read_only=False)
+                try:
+                    with self._archive_lock(archive_lock) if archive_lock is not None else nullcontext():
+                        yield conn
+                finally:
+                    conn.close()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _generation(self) -> str:
+        try:
+            with open(self._lock_path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def _bump_generation(self) -> None:
+        """Count a write in the lock file; called with the lock file held exclusively"""
+        with open(self._lock_path, "r+") as f:
+            generation = int(f.read() or 0) + 1
+            f.seek(0)
+            f.write(str(generation))
+            f.truncate()
+
+    def _acquire_reader(self) -> duckdb.DuckDBPyConnection:
+        """The cached read-only connection, reopened if any process wrote since it was opened"""
+        with self._read_cond:
+            while self._read_conn is not None and self._generation() != self._read_generation:
+                # Every connection must be closed before DuckDB rereads the file
+                if self._read_users:
+                    self._read_cond.wait()
+                    continue
+                self._close_reader()
+            if self._read_conn is None:
+                with open(self._lock_path, "a") as lock_file:
+                    # Wait out a writer holding the lock file rather than racing it for the database
+                    fcntl.flock(lock_file, fcntl.LOCK_SH)
+                    try:
+                        self._read_generation = self._generation()
+                        self._read_conn = self._connect(read_only=True)
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._read_users += 1
+            return self._read_conn
+
+    def _release_reader(self) -> None:
+        with self._read_cond:
+            self._read_users -= 1
+            self._read_cond.notify_all()
+
+    def _close_reader(self, stale_only: bool = False) -> None:
+        """Close the cached reader unless it is in use (or, with stale_only, still current)"""
+        with self._read_cond:
+            if self._read_conn is None or self._read_users:
+                return
+            if stale_only and self._generation() == self._read_generation:
+                return
+            self._read_conn.close()
+            self._read_conn = None
+
+    @contextmanager
+    def _archive_lock(self, operation: int) -> Iterator[None]:
+        """
+        Hold the archive lock file: shared while a statement may read cold files,
+        exclusive while files are swapped in or out. Always taken after the
+        connection, so it cannot deadlock with the database locks.
+        """
+        with open(self._archive_lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
 
+    def _trades_sql(self, conn: duckdb.DuckDBPyConnection,
+                    condition_id: Optional[str] = None,
+                    wallets: Optional[list] = None) -> str:
+        """
+        SQL relation over both tiers: the trades table plus the archive files that
+        may hold condition_id's trades, or else the trades of `wallets` (any
+        market's and wallet's if both are None), or just the table when nothing
+        relevant is archived
+        """
+        if condition_id is not None:
+            buckets = [r[0] for r in conn.execute(
+                "SELECT bucket FROM archived_markets WHERE condition_id = ?", [condition_id]
+            ).fetchall()]
+        elif wallets is not None:
+            buckets = [r[0] for r in conn.execute(
+                "SELECT DISTINCT bucket FROM archived_wallets WHERE wallet IN (SELECT unnest(?)) ORDER BY bucket",
+                [wallets]
+            ).fetchall()]
+        else:
+            buckets = ["*"] if conn.execute("SELECT EXISTS (FROM archived_markets)").fetchone()[0] else []
+        if not buckets:
+            return "trades"
+        files = ", ".join(
+            "'{}'".format(f"{self.archive_path}/bucket={bucket}/*.parquet".replace("'", "''")) for bucket in buckets
+        )
+        return f"""(
+            FROM trades
+            UNION ALL BY NAME
+            SELECT * EXCLUDE (bucket) REPLACE (side::trade_side AS side) FROM read_parquet(
+                [{files}], hive_partitioning = true, hive_types = {{'bucket': VARCHAR}}
+            )
+        )"""
+
+    def _update_archived_wallets(self, conn: duckdb.DuckDBPyConnection, files: list) -> None:
+        """Add the trades in the archive `files` to archived_wallets"""
+        conn.execute("""
+            INSERT INTO archived_wallets BY NAME
+            SELECT wallet, bucket, count(*) AS trades, sum(size * price)::DOUBLE AS notional
+            FROM read_parquet(?, hive_partitioning = true, hive_types = {'bucket': VARCHAR})
+            WHERE wallet IS NOT NULL
+            GROUP BY wallet, bucket
+            ON CONFLICT (wallet, bucket) DO UPDATE SET
+                trades = trades + EXCLUDED.trades,
+                notional = notional + EXCLUDED.notional
+        """, [files])
+
+    def _execute_write(self, sql: str, params: list, key: Optional[str] = None) -> None:
+        """
+        Run a write statement now, or queue it behind pending trade batches in
+        shared mode, where a statement saving the sync state of `key` is skipped
+        if trades for `key` were dropped since its sync started
+        """
+        if self.shared:
+            self.open()
+            self._queue.put(("sql", (sql, params, key)))
+            return
+        with self._writer() as conn:
+            conn.execute(sql, params)
+
+    def _flush_loop(self) -> None:
+        while not self._closed.is_set() or not self._queue.empty():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                # Idle: let go of a reader that another process is waiting to write past
+                self._close_reader(stale_only=True)
+                continue
+            # Coalesce whatever else is queued, up to max_batch_rows of trades
+            rows = batch[0][1].height if batch[0][0] == "trades" else 0
+            while rows < self.max_batch_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                if item[0] == "trades":
+                    rows += item[1].height
+            self._apply_batch(batch)
+
+    def _apply_batch(self, batch: list) -> None:
+        for attempt in range(3):
+            try:
+                new = []
+                with self._writer() as conn:
+                    conn.execute("BEGIN TRANSACTION")
+                    try:
+                        pending = []
+                        for kind, payload in batch:
+                            if kind == "trades":
+                                pending.append(payload)
+                                continue
+                            if pending:
+                                new.append(self._insert_df(conn, pl.concat(pending)))
+                                pending = []
+                            if kind == "sql":
+                                sql, params, key = payload
+                                if key is not None and key in self._lost:
+                                    self.logger.error("Not saving sync state for %s: its trades were dropped", key)
+                                    continue
+                                conn.execute(sql, params)
+                        if pending:
+                            new.append(self._insert_df(conn, pl.concat(pending)))
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                self._notify(new)
+                break
+            except Exception as e:
+                self.logger.error("Error writing batch of %s operations (attempt %s): %s", len(batch), attempt + 1, e)
+        else:
+            self.logger.error("Dropping batch of %s operations after repeated failures", len(batch))
+            for kind, payload in batch:
+                if kind == "trades":
+                    # Market keys, and wallet keys as in backfill.user_key
+                    self._lost.update(payload["condition_id"].unique().to_list())
+                    self._lost.update(f"user:{w}" for w in payload["wallet"].drop_nulls().unique().to_list())
+        for kind, payload in batch:
+            if kind == "flush":
+                payload.set()
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until every write queued so far has been applied (no-op unless shared)"""
+        if not self.shared:
+            return
+        self.open()
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """Apply queued writes and release the database"""
+        if self.shared:
+            self._closed.set()
+            if self._flusher.is_alive():
+                self._flusher.join()
+            self._close_reader()
+        elif self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @timed("archive_resolved")
+    def archive_resolved(self, resolutions: str, min_age: float = 86400.0) -> int:
+        """
+        Move the stored trades of resolved markets into the Parquet archive.
+
+        A market qualifies once it is in `resolutions` (see
+        `catalog.resolutions_sql`), its backfill is complete and its newest stored
+        trade is at least `min_age` seconds old. The files are written to a staging
+        directory first; then, in one transaction, the archived trades are deleted
+        by hash and the files moved into their buckets, so readers see each trade
+        in exactly one tier; readers only wait for the move and the commit.
+        Trades arriving later are kept hot, unless they are older than the last
+        archived trade of their market.
+
+        Returns:
+            int: The number of trades archived.
+        """
+        cutoff = EPOCH + timedelta(seconds=time.time() - min_age)
+        staging = os.path.join(self.archive_path, f".staging-{uuid.uuid4().hex}")
+        try:
+            with self._reader() as conn:
+                markets = conn.execute(f"""
+                    SELECT
+                        condition_id,
+                        lower(substr(condition_id, 3, 2)) AS bucket,
+                        count(*) AS trades,
+                        min(timestamp) AS first_trade,
+                        max(timestamp) AS last_trade
+                    FROM trades
+                    WHERE condition_id IN (SELECT condition_id FROM {resolutions})
+                      AND condition_id IN (SELECT condition_id FROM sync_state WHERE backfill_complete)
+                    GROUP BY condition_id
+                    HAVING max(timestamp) < ?
+                """, [cutoff]).pl()
+                if markets.is_empty():
+                    return 0
+                for bucket, ids in markets.group_by("bucket").agg("condition_id").iter_rows():
+                    os.makedirs(os.path.join(staging, f"bucket={bucket}"))
+                    part = os.path.join(staging, f"bucket={bucket}", f"part-{uuid.uuid4().hex}.parquet")
+                    conn.execute(f"""
+                        COPY (
+                            SELECT * FROM trades
+                            WHERE condition_id IN (SELECT unnest(?))
+                            ORDER BY condition_id, timestamp
+                        ) TO '{part.replace("'", "''")}' (FORMAT parquet, COMPRESSION zstd)
+                    """, [ids])
+            staged = glob.glob(os.path.join(staging, "bucket=*", "*.parquet"))
+            # Only reads the staged files, so readers of the archive are not held up until the swap
+            with self._writer(archive_lock=None) as conn:
+                conn.execute("BEGIN TRANSACTION")
+                try:
+                    deleted = conn.execute("""
+                        DELETE FROM trades
+                        WHERE hash IN (SELECT hash FROM read_parquet(?, hive_partitioning = false))
+                    """, [staged]).fetchone()[0]
+                    if deleted != markets["trades"].sum():
+                        # Another process archived some of these markets in the meantime
+                        self.logger.warning("Staged %s trades but %s were still stored; skipping this run",
+                                            markets["trades"].sum(), deleted)
+                        conn.execute("ROLLBACK")
+                        return 0
+                    conn.register("archived_temp", markets)
+                    conn.execute("""
+                        INSERT INTO archived_markets BY NAME
+                        SELECT *, now()::TIMESTAMP AS archived_at FROM archived_temp
+                        ON CONFLICT (condition_id) DO UPDATE SET
+                            trades = trades + EXCLUDED.trades,
+                            first_trade = least(first_trade, EXCLUDED.first_trade),
+                            last_trade = greatest(last_trade, EXCLUDED.last_trade),
+                            archived_at = EXCLUDED.archived_at
+                    """)
+                    conn.unregister("archived_temp")
+                    self._update_archived_wallets(conn, staged)
+                    # Readers see the files arrive and the trades go in one step
+                    with self._archive_lock(fcntl.LOCK_EX):
+                        moved = []
+                        try:
+                            for path in staged:
+                                target = os.path.join(self.archive_path, os.path.relpath(path, staging))
+                                os.makedirs(os.path.dirname(target), exist_ok=True)
+                                os.replace(path, target)
+                                moved.append((path, target))
+                            conn.execute("COMMIT")
+                        except Exception:
+                            for path, target in moved:
+                                os.replace(target, path)
+                            raise
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.logger.info("Archived %s trades of %s resolved markets", deleted, markets.height)
+        return deleted
+
+    @timed("compact_archive")
+    def compact_archive(self, target_bytes: int = ARCHIVE_TARGET_FILE_BYTES) -> int:
+        """
+        Merge the archive files smaller than `target_bytes`, bucket by bucket, into
+        files of up to about `target_bytes`, sorted by condition_id and timestamp.
+
+        Returns:
+            int: The number of files merged away.
+        """
+        merged = 0
+        for bucket_dir in sorted(glob.glob(os.path.join(self.archive_path, "bucket=*"))):
+            small = [f for f in sorted(glob.glob(os.path.join(bucket_dir, "*.parquet")))
+                     if os.path.getsize(f) < target_bytes]
+            # Greedily group the small files into merges of up to target_bytes
+            groups, group, size = [], [], 0
+            for f in small:
+                if group and size + os.path.getsize(f) > target_bytes:
+                    groups.append(group)
+                    group, size = [], 0
+                group.append(f)
+                size += os.path.getsize(f)
+            groups.append(group)
+            for group in groups:
+                if len(group) < 2:
+                    continue
+                staging = os.path.join(self.archive_path, f".staging-{uuid.uuid4().hex}")
+                os.makedirs(staging)
+                try:
+                    part = os.path.join(staging, f"part-{uuid.uuid4().hex}.parquet")
+                    with self._archive_lock(fcntl.LOCK_SH), duckdb.connect() as conn:
+                        conn.execute(f"""
+                            COPY (
+                                SELECT * FROM read_parquet(?, hive_partitioning = false)
+                                ORDER BY condition_id, timestamp
+                            ) TO '{part.replace("'", "''")}' (FORMAT parquet, COMPRESSION zstd)
+                        """, [group])
+                    with self._archive_lock(fcntl.LOCK_EX):
+                        os.replace(part, os.path.join(bucket_dir, os.path.basename(part)))
+                        for f in group:
+                            os.remove(f)
+                finally:
+                    shutil.rmtree(staging, ignore_errors=True)
+                merged += len(group)
+        if merged:
+            self.logger.info("Compacted %s archive files", merged)
+        return merged
+
+    @timed("cluster")
+    def cluster(self, min_unclustered: float = CLUSTER_MIN_UNCLUSTERED) -> int:
+        """
+        Rewrite the trades table ordered by condition_id and timestamp, once at
+        least `min_unclustered` of its trades were inserted since it was last
+        clustered.
+
+        Syncs interleave the markets, so without this one market's trades are
+        spread over every row group and even an index lookup reads most of the
+        table. Clustered, they sit in a few row groups that the zone maps and the
+        condition_id index reach directly. The rewrite costs a full pass over the
+        table and other writes wait until it is done, so it is skipped until
+        enough new trades have drifted out of order to be worth it.
+
+        Returns:
+            int: The number of trades rewritten, 0 if the table was left as is.
+        """
+        with self._reader() as conn:
+            unclustered, total = conn.execute(
+                "SELECT unclustered_rows, (SELECT count(*) FROM trades) FROM cluster_state"
+            ).fetchone()
+        if not unclustered or unclustered < min_unclustered * total:
+            self.logger.info("Not clustering: %s of %s trades inserted since the last run", unclustered, total)
+            return 0
+        with self._writer() as conn:
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                conn.execute(f"CREATE TABLE trades_clustered ({TRADES_SCHEMA})")
+                rows = conn.execute(
+                    "INSERT INTO trades_clustered SELECT * FROM trades ORDER BY condition_id, timestamp"
+                ).fetchone()[0]
+                conn.execute("DROP TABLE trades")
+                conn.execute("ALTER TABLE trades_clustered RENAME TO trades")
+                self._create_trade_indexes(conn)
+                conn.execute("UPDATE cluster_state SET unclustered_rows = 0, clustered_at = now()::TIMESTAMP")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self.logger.info("Clustered %s trades", rows)
+        return rows
+
+    def checkpoint(self) -> None:
+        """
+        Write the WAL into the database file. Space freed by archiving is reused
+        by later inserts; DuckDB does not shrink the file itself.
+        """
+        with self._writer() as conn:
+            conn.execute("CHECKPOINT")
+
+    @timed("get_trades_df")
     def get_trades_df(self, condition_id: str) -> pl.DataFrame:
         """Get trades for a condition_id as Polars DataFrame"""
         try:
-            result = self.conn.execute(
-                "SELECT * FROM trades WHERE condition_id = ?",
-                [condition_id]
-            ).pl()
+            with self._reader() as conn:
+                result = conn.execute(
+                    f"SELECT {TRADE_COLUMNS} FROM {self._trades_sql(conn, condition_id)} WHERE condition_id = ?",
+                    [condition_id]
+                ).pl()
             return result
         except Exception as e:
-            self.logger.error(f"Error fetching trades: {e}")
+            self.logger.error("Error fetching trades: %s", e)
             return pl.DataFrame()  # Return empty DataFrame on error
 
-    def insert_trades(self, trades: Union[list, dict]) -> None:
-        """Insert trades into database"""
-        if isinstance(trades, dict):
-            trades = [trades]
-        if not trades:
-            self.logger.warning("No trades to insert")
-            return
+    def iter_trades_arrow(self, condition_id: str, batch_size: int = 65_536) -> Iterator[pa.RecordBatch]:
+        """
+        Trades for a condition_id as Arrow record batches of up to `batch_size`
+        rows, so a large market is never held in memory at once. The query result
+        is spooled to a temporary Arrow file next to the database first, and read
+        back from there, so no storage lock is held while a slow client consumes
+        the batches. The file is removed once the iterator is exhausted or closed.
+        """
+        fd, spool = tempfile.mkstemp(prefix=".spool-", suffix=".arrows", dir=os.path.dirname(os.path.abspath(self.path)))
+        os.close(fd)
         try:
-            df = pl.DataFrame(trades).select(
-                pl.col("transactionHash").alias("hash"),
-                pl.col("conditionId").alias("condition_id"),
-                pl.col("name").alias("user"),
-                pl.col("size"),
-                pl.col("price"),
-                pl.col("side"),
-                pl.col("timestamp").cast(pl.Datetime("ns")).alias("timestamp"),
-            )
-            self.conn.register("trades_temp", df)
-            # Use INSERT OR IGNORE to skip duplicates (based on PRIMARY KEY hash)
-            self.conn.execute("INSERT OR IGNORE INTO trades SELECT * FROM trades_temp")
-            # Unregister the temporary view
-            self.conn.unregister("trades_temp")
-            self.logger.info(f"Successfully inserted {len(df)} trades (duplicates skipped)")
+            with self._reader() as conn:
+                reader = conn.execute(
+                    f"SELECT {TRADE_COLUMNS} FROM {self._trades_sql(conn, condition_id)} WHERE condition_id = ?",
+                    [condition_id]
+                ).fetch_record_batch(batch_size)
+                with pa.OSFile(spool, "wb") as sink, pa.ipc.new_stream(sink, reader.schema) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+            with pa.OSFile(spool) as source:
+                yield from pa.ipc.open_stream(source)
+        finally:
+            os.remove(spool)
+
+    @timed("export_trades")
+    def export_trades(self, path: str, condition_id: str,
+                      start: Optional[int] = None,
+                      end: Optional[int] = None) -> int:
+        """
+        Write a market's trades within [start, end) (unix seconds), oldest first,
+        to a zstd-compressed Parquet file at `path`.
+
+        Returns:
+            int: The number of trades written.
+        """
+        window, window_params = _window_clauses(start, end)
+        clauses, params = ["condition_id = ?", *window], [condition_id, *window_params]
+        path = path.replace("'", "''")
+        with self._reader() as conn:
+            return conn.execute(f"""
+                COPY (
+                    SELECT {TRADE_COLUMNS} FROM {self._trades_sql(conn, condition_id)}
+                    WHERE {" AND ".join(clauses)}
+                    ORDER BY timestamp, hash
+                ) TO '{path}' (FORMAT parquet, COMPRESSION zstd)
+            """, params).fetchone()[0]
+
+    @timed("query_trades")
+    def query_trades(self, condition_id: Optional[str] = None,
+                     wallet: Optional[str] = None,
+                     start: Optional[int] = None,
+                     end: Optional[int] = None,
+                     cursor: Optional[str] = None,
+                     limit: int = 500) -> tuple[pa.Table, Optional[str]]:
+        """
+        One page of trades, newest first, filtered by market and/or wallet and an
+        optional [start, end) window in unix seconds.
+
+        Pagination is keyset-based on (timestamp, hash): pass the returned cursor
+        back to get the next page, so deep pages cost the same as the first one;
+        a cursor it did not return raises CursorError.
+
+        Returns:
+            tuple[pa.Table, Optional[str]]: The page and the cursor for the next
+            page, or None when this is the last one.
+        """
+        clauses, params = [], []
+        if condition_id is not None:
+            clauses.append("condition_id = ?")
+            params.append(condition_id)
+        if wallet is not None:
+            clauses.append("wallet = ?")
+            params.append(wallet.lower())
+        window, window_params = _window_clauses(start, end)
+        clauses += window
+        params += window_params
+        if cursor is not None:
+            micros, last_hash = decode_cursor(cursor)
+            clauses.append("(timestamp < make_timestamp(?) OR (timestamp = make_timestamp(?) AND hash < unhex(?)))")
+            params.extend([micros, micros, last_hash.removeprefix("0x")])
+        where = " AND ".join(clauses) or "true"
+        with self._reader() as conn:
+            table = conn.execute(f"""
+                SELECT {TRADE_COLUMNS} FROM {self._trades_sql(conn, condition_id, [wallet.lower()] if wallet is not None else None)}
+                WHERE {where}
+                ORDER BY timestamp DESC, hash DESC
+                LIMIT ?
+            """, [*params, limit]).fetch_arrow_table()
+        if table.num_rows < limit:
+            return table, None
+        last = table.slice(table.num_rows - 1).to_pylist()[0]
+        return table, encode_cursor(last["timestamp"], last["hash"])
+
+    @timed("get_candles")
+    def get_candles(self, condition_id: str,
+                    resolution: str = "1h",
+                    start: Optional[int] = None,
+                    end: Optional[int] = None,
+                    limit: int = 5_000) -> pa.Table:
+        """
+        The latest `limit` OHLCV candles for a condition_id at one of
+        CANDLE_RESOLUTIONS, oldest first, optionally limited to buckets within
+        [start, end) (unix seconds)
+        """
+        if resolution not in CANDLE_RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution: {resolution}")
+        window, window_params = _window_clauses(start, end, "bucket")
+        clauses = ["condition_id = ?", "resolution = ?", *window]
+        params = [condition_id, resolution, *window_params]
+        with self._reader() as conn:
+            return conn.execute(f"""
+                SELECT * FROM (
+                    SELECT bucket, open, high, low, close, volume, buy_volume, sell_volume, trade_count
+                    FROM candles
+                    WHERE {" AND ".join(clauses)}
+                    ORDER BY bucket DESC
+                    LIMIT ?
+                )
+                ORDER BY bucket
+            """, [*params, limit]).fetch_arrow_table()
+
+    @timed("get_features")
+    def get_features(self, condition_id: str,
+                     resolution: str = "1h",
+                     start: Optional[int] = None,
+                     end: Optional[int] = None,
+                     limit: int = 5_000) -> pa.Table:
+        """
+        Order-flow features for the latest `limit` buckets of a condition_id at
+        one of CANDLE_RESOLUTIONS, oldest first, optionally within [start, end)
+        (unix seconds): volume and count imbalance, net flow, the trade-size
+        distribution, price impact per unit of net flow, and the mean time
+        between trades
+        """
+        if resolution not in CANDLE_RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution: {resolution}")
+        window, window_params = _window_clauses(start, end, "bucket")
+        clauses = ["condition_id = ?", "resolution = ?", *window]
+        params = [condition_id, resolution, *window_params]
+        with self._reader() as conn:
+            return conn.execute(f"""
+                SELECT * FROM (
+                    SELECT
+                        bucket,
+                        trade_count,
+                        buy_volume,
+                        sell_volume,
+                        (buy_volume - sell_volume) / nullif(buy_volume + sell_volume, 0) AS volume_imbalance,
+                        (2 * buy_count - trade_count) / trade_count AS count_imbalance,
+                        net_flow,
+                        (buy_volume + sell_volume) / trade_count AS mean_size,
+                        sqrt(greatest(size_sum_sq / trade_count - pow((buy_volume + sell_volume) / trade_count, 2), 0))
+                            AS size_std,
+                        size_max,
+                        {", ".join(FEATURE_SIZE_BINS)},
+                        close - open AS price_change,
+                        (close - open) / nullif(net_flow, 0) AS impact_per_volume,
+                        epoch(last_trade - first_trade) / nullif(trade_count - 1, 0) AS mean_gap_seconds
+                    FROM market_features
+                    JOIN candles USING (condition_id, resolution, bucket)
+                    WHERE {" AND ".join(clauses)}
+                    ORDER BY bucket DESC
+                    LIMIT ?
+                )
+                ORDER BY bucket
+            """, [*params, limit]).fetch_arrow_table()
+
+    @timed("get_price_history")
+    def get_price_history(self, resolution: str = "1h",
+                          start: Optional[int] = None,
+                          condition_ids: Optional[list] = None) -> pa.Table:
+        """
+        Candle closes (probability of outcome 0) for many markets at once, as
+        (condition_id, bucket, close) rows from buckets >= start (unix seconds)
+        """
+        if resolution not in CANDLE_RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution: {resolution}")
+        window, window_params = _window_clauses(start, None, "bucket")
+        clauses, params = ["resolution = ?", *window], [resolution, *window_params]
+        if condition_ids is not None:
+            clauses.append("condition_id IN (SELECT unnest(?))")
+            params.append(condition_ids)
+        with self._reader() as conn:
+            return conn.execute(f"""
+                SELECT condition_id, bucket, close
+                FROM candles
+                WHERE {" AND ".join(clauses)}
+                ORDER BY bucket
+            """, params).fetch_arrow_table()
+
+    @timed("get_market_stats")
+    def get_market_stats(self, condition_id: str) -> Optional[dict]:
+        """
+        Aggregate trade statistics for a condition_id, or None if no trades are
+        stored. Users are counted by wallet, since display names are not unique.
+        """
+        with self._reader() as conn:
+            row = conn.execute(f"""
+                SELECT
+                    count(*) AS trade_count,
+                    sum(size)::DOUBLE AS volume,
+                    sum(size) FILTER (WHERE side = 'BUY')::DOUBLE AS buy_volume,
+                    sum(size) FILTER (WHERE side = 'SELL')::DOUBLE AS sell_volume,
+                    (sum(size * price) / nullif(sum(size), 0))::DOUBLE AS vwap,
+                    min(price)::DOUBLE AS min_price,
+                    max(price)::DOUBLE AS max_price,
+                    arg_max(price, timestamp)::DOUBLE AS last_price,
+                    count(DISTINCT wallet) AS unique_users,
+                    min(timestamp) AS first_trade,
+                    max(timestamp) AS last_trade
+                FROM {self._trades_sql(conn, condition_id)}
+                WHERE condition_id = ?
+            """, [condition_id]).fetchone()
+            columns = [d[0] for d in conn.description]
+        if row[0] == 0:
+            return None
+        return {"condition_id": condition_id, **dict(zip(columns, row))}
+
+    @timed("get_user_distribution")
+    def get_user_distribution(self, condition_id: str, top_n: int = 10) -> Optional[dict]:
+        """
+        Per-wallet traded size for a condition_id, summarised as the top_n wallets
+        (with their latest display name) and how concentrated volume is (top_n
+        share and Herfindahl index), or None if no trades are stored
+        """
+        with self._reader() as conn:
+            source = self._trades_sql(conn, condition_id)
+            totals = conn.execute(f"""
+                WITH per_user AS (
+                    SELECT wallet, sum(size)::DOUBLE AS size
+                    FROM {source}
+                    WHERE condition_id = ?
+                    GROUP BY wallet
+                )
+                SELECT count(*), sum(size), sum(size * size) / nullif(sum(size) * sum(size), 0)
+                FROM per_user
+            """, [condition_id]).fetchone()
+            if totals[0] == 0:
+                return None
+            top = conn.execute(f"""
+                SELECT
+                    wallet,
+                    arg_max(user, timestamp) AS user,
+                    sum(size)::DOUBLE AS size,
+                    sum(size) FILTER (WHERE side = 'BUY')::DOUBLE AS buy_size,
+                    sum(size) FILTER (WHERE side = 'SELL')::DOUBLE AS sell_size,
+                    count(*) AS trades
+                FROM {source}
+                WHERE condition_id = ?
+                GROUP BY wallet
+                ORDER BY size DESC, wallet
+                LIMIT ?
+            """, [condition_id, top_n]).fetchall()
+        user_count, total_size, hhi = totals
+        top_users = [
+            {
+                "wallet": wallet,
+                "user": user,
+                "size": size,
+                "buy_size": buy_size or 0.0,
+                "sell_size": sell_size or 0.0,
+                "trades": trades,
+                "share": size / total_size if total_size else None,
+            }
+            for wallet, user, size, buy_size, sell_size, trades in top
+        ]
+        top_size = sum(u["size"] for u in top_users)
+        return {
+            "condition_id": condition_id,
+            "unique_users": user_count,
+            "total_size": total_size,
+            "top_n": top_n,
+            "top_n_share": top_size / total_size if total_size else None,
+            "hhi": hhi,
+            "top_users": top_users,
+        }
+
+    @timed("refresh_wallet_stats")
+    def refresh_wallet_stats(self, resolutions: str, wallets: Optional[list] = None) -> None:
+        """
+        Recompute wallet_stats for `wallets` (every wallet with stored trades if
+        None) in one set-based statement.
+
+        `resolutions` is a SQL relation of (condition_id, outcome_index) giving
+        the winning outcome of each resolved market, see `catalog.resolutions_sql`.
+        """
+        where, params = ("WHERE wallet IN (SELECT unnest(?))", [wallets]) if wallets is not None else ("", [])
+        with self._reader() as conn:
+            source = self._trades_sql(conn, wallets=wallets)
+        self._execute_write(f"""
+            INSERT OR REPLACE INTO wallet_stats BY NAME
+            SELECT *, now()::TIMESTAMP AS updated_at
+            FROM ({_wallet_stats_sql(resolutions, where, source)})
+        """, params)
+
+    @timed("get_wallet_profile")
+    def get_wallet_profile(self, wallet: str, resolutions: str, top_n: int = 10) -> Optional[dict]:
+        """
+        Live wallet statistics (as stored in wallet_stats) for one wallet, plus its
+        top_n markets by traded volume, or None if no trades are stored
+        """
+        with self._reader() as conn:
+            source = self._trades_sql(conn, wallets=[wallet])
+            cursor = conn.execute(_wallet_stats_sql(resolutions, "WHERE wallet = ?", source), [wallet])
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            stats = dict(zip([d[0] for d in cursor.description], row))
+            cursor = conn.execute(f"""
+                SELECT condition_id, resolved, resolved AND realized_pnl > 0 AS won, volume, realized_pnl, trades, last_trade
+                FROM ({_wallet_markets_sql(resolutions, "WHERE wallet = ?", source)})
+                ORDER BY volume DESC
+                LIMIT ?
+            """, [wallet, top_n])
+            columns = [d[0] for d in cursor.description]
+            stats["top_markets"] = [dict(zip(columns, r)) for r in cursor.fetchall()]
+        return stats
+
+    @timed("get_wallet_leaderboard")
+    def get_wallet_leaderboard(self, order_by: str = "realized_pnl",
+                               limit: int = 100,
+                               min_resolved: int = 0) -> list:
+        """Wallets from wallet_stats ranked by `order_by` (any WALLET_RANKINGS column), best first"""
+        if order_by not in WALLET_RANKINGS:
+            raise ValueError(f"order_by must be one of {', '.join(WALLET_RANKINGS)}")
+        with self._reader() as conn:
+            cursor = conn.execute(f"""
+                SELECT * FROM wallet_stats
+                WHERE resolved_markets >= ?
+                ORDER BY {order_by} DESC NULLS LAST, wallet
+                LIMIT ?
+            """, [min_resolved, limit])
+            columns = [d[0] for d in cursor.description]
+            return [dict(zip(columns, r)) for r in cursor.fetchall()]
+
+    @timed("get_top_wallets")
+    def get_top_wallets(self, limit: int) -> list:
+        """
+        The `limit` wallets with the most traded notional across stored trades;
+        archived trades are counted from archived_wallets, without reading the archive
+        """
+        with self._reader() as conn:
+            return [r[0] for r in conn.execute("""
+                SELECT wallet FROM (
+                    SELECT wallet, sum(size * price)::DOUBLE AS notional FROM trades
+                    WHERE wallet IS NOT NULL
+                    GROUP BY wallet
+                    UNION ALL
+                    SELECT wallet, notional FROM archived_wallets
+                )
+                GROUP BY wallet
+                ORDER BY sum(notional) DESC
+                LIMIT ?
+            """, [limit]).fetchall()]
+
+    @timed("get_last_trade_time")
+    def get_last_trade_time(self, condition_id: str) -> Optional[datetime]:
+        """The timestamp of the newest stored trade of condition_id, or None if it has none"""
+        with self._reader() as conn:
+            return conn.execute(
+                f"SELECT max(timestamp) FROM {self._trades_sql(conn, condition_id)} WHERE condition_id = ?",
+                [condition_id],
+            ).fetchone()[0]
+
+    @timed("get_sync_state")
+    def get_sync_state(self, condition_id: str) -> Optional[dict]:
+        """
+        Get the backfill cursor for a condition_id, or None if it was never synced.
+
+        `backfill_offset` is the next page offset of the initial (newest to oldest)
+        history walk, and `high_water` is the newest trade timestamp (unix seconds)
+        known to be stored once that walk has completed.
+
+        Reading the state starts a new sync of the key, so sync-state writes for
+        it are accepted again after an earlier batch of its trades was dropped.
+        """
+        if self.shared:
+            self._lost.discard(condition_id)
+        with self._reader() as conn:
+            row = conn.execute(
+                "SELECT backfill_offset, backfill_complete, high_water, synced_at FROM sync_state WHERE condition_id = ?",
+                [condition_id]
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "backfill_offset": row[0],
+            "backfill_complete": row[1],
+            "high_water": row[2],
+            "synced_at": row[3],
+        }
+
+    @timed("save_sync_state")
+    def save_sync_state(self, condition_id: str,
+                        backfill_offset: int,
+                        backfill_complete: bool,
+                        high_water: Optional[int]) -> None:
+        """
+        Persist the backfill cursor for a condition_id.
+
+        In shared mode the update is queued after the trades inserted before it,
+        so a cursor is never stored ahead of the trades it covers.
+        """
+        self._execute_write(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, now()::TIMESTAMP)",
+            [condition_id, backfill_offset, backfill_complete, high_water],
+            key=condition_id,
+        )
+
+    def insert_trades(self, trades: Union[list, dict, bytes, pl.DataFrame]) -> None:
+        """
+        Insert trades into database
+
+        Accepts /trades payloads as parsed JSON, raw response bytes or a frame
+        from `decode_trades`. Raw bytes are decoded straight into typed columns
+        without building a Python dict per trade.
+
+        In shared mode the trades are queued for the writer thread; call `flush`
+        to wait until they are visible to readers.
+        """
+        try:
+            df = to_storage_frame(decode_trades(trades))
+            if df.is_empty():
+                self.logger.warning("No trades to insert")
+                return
+            if self.shared:
+                self.open()
+                self._queue.put(("trades", df))
+                self.logger.info("Queued %s trades for insert", len(df))
+                return
+            with self._writer() as conn:
+                conn.execute("BEGIN TRANSACTION")
+                try:
+                    new = self._insert_df(conn, df)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            self._notify([new])
+            self.logger.info("Successfully inserted %s trades (duplicates skipped)", len(df))
         except Exception as e:
-            self.logger.error(f"Error inserting trades: {e}")
-            # Clean up view if it exists
-            try:
-                self.conn.unregister("trades_temp")
-            except:
-                pass
-            raise InsertError(f"Error inserting trades: {e}")
\ No newline at end of file
+            self.logger.error("Error inserting trades: %s", e)
+            raise InsertError(f"Error inserting trades: {e}")
+
+    def add_listener(self, listener: Callable[[pa.Table], None]) -> None:
+        """
+        Call `listener` with every batch of newly stored trades (rendered like
+        `iter_trades_arrow`) once it is committed. Listeners run on the inserting
+        thread, which is the writer thread in shared mode, so they must be quick
+        and thread-safe.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[pa.Table], None]) -> None:
+        self._listeners.remove(listener)
+
+    def _notify(self, tables: list) -> None:
+        for table in tables:
+            if table is None:
+                continue
+            for listener in list(self._listeners):
+                try:
+                    listener(table)
+                except Exception as e:
+                    self.logger.error("Error in trade listener: %s", e)
+
+    @timed("insert")
+    def _insert_df(self, conn: duckdb.DuckDBPyConnection, df: pl.DataFrame) -> Optional[pa.Table]:
+        """Insert new trades, returning them for the listeners if there are any"""
+        conn.register("trades_temp", df)
+        try:
+            # Use INSERT OR IGNORE to skip duplicates (based on PRIMARY KEY hash);
+            # RETURNING yields only the rows that were actually new. Trades already
+            # in the archive (up to a market's last archived trade) are not re-added
+            new = conn.execute("""
+                INSERT OR IGNORE INTO trades BY NAME
+                SELECT * FROM trades_temp t
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM archived_markets a
+                    WHERE a.condition_id = t.condition_id AND t.timestamp <= a.last_trade
+                )
+                ORDER BY condition_id, timestamp
+                RETURNING *
+            """).fetch_arrow_table()
+        finally:
+            # Unregister the temporary view
+            conn.unregister("trades_temp")
+        if new.num_rows == 0:
+            return None
+        conn.execute("UPDATE cluster_state SET unclustered_rows = unclustered_rows + ?", [new.num_rows])
+        conn.register("new_trades", new)
+        try:
+            self._update_candles(conn, "new_trades")
+            self._update_features(conn, "new_trades")
+            if self._listeners:
+                return conn.execute(
+                    f"SELECT {TRADE_COLUMNS} FROM new_trades ORDER BY timestamp"
+                ).fetch_arrow_table()
+        finally:
+            conn.unregister("new_trades")
+        return None
+
+    @timed("update_candles")
+    def _update_candles(self, conn: duckdb.DuckDBPyConnection, source: str) -> None:
+        """
+        Fold the trades in `source` into the candles table.
+
+        Candles are merged rather than recomputed (high/low by max/min, volumes
+        summed, open/close taken from the earliest/latest trade), so the cost is
+        proportional to the new trades, not to the market's history. `source` must
+        only hold trades that are not already counted. Prices are expressed as the
+        probability of outcome 0: trades in outcome 1 count as 1 - price.
+        """
+        for resolution, width in CANDLE_RESOLUTIONS.items():
+            conn.execute(f"""
+                INSERT INTO candles BY NAME
+                SELECT
+                    condition_id,
+                    '{resolution}' AS resolution,
+                    time_bucket(INTERVAL '{width}', timestamp) AS bucket,
+                    arg_min(p, timestamp) AS open,
+                    max(p) AS high,
+                    min(p) AS low,
+                    arg_max(p, timestamp) AS close,
+                    sum(size)::DOUBLE AS volume,
+                    coalesce(sum(size) FILTER (WHERE side = 'BUY'), 0)::DOUBLE AS buy_volume,
+                    coalesce(sum(size) FILTER (WHERE side = 'SELL'), 0)::DOUBLE AS sell_volume,
+                    count(*) AS trade_count,
+                    min(timestamp) AS first_trade,
+                    max(timestamp) AS last_trade
+                FROM (
+                    SELECT *, CASE WHEN outcome_index = 1 THEN 1 - price ELSE price END::DOUBLE AS p
+                    FROM {source}
+                )
+                GROUP BY condition_id, bucket
+                ON CONFLICT (condition_id, resolution, bucket) DO UPDATE SET
+                    open = CASE WHEN EXCLUDED.first_trade < first_trade THEN EXCLUDED.open ELSE open END,
+                    close = CASE WHEN EXCLUDED.last_trade >= last_trade THEN EXCLUDED.close ELSE close END,
+                    high = greatest(high, EXCLUDED.high),
+                    low = least(low, EXCLUDED.low),
+                    volume = volume + EXCLUDED.volume,
+                    buy_volume = buy_volume + EXCLUDED.buy_volume,
+                    sell_volume = sell_volume + EXCLUDED.sell_volume,
+                    trade_count = trade_count + EXCLUDED.trade_count,
+                    first_trade = least(first_trade, EXCLUDED.first_trade),
+                    last_trade = greatest(last_trade, EXCLUDED.last_trade)
+            """)
+
+
+    @timed("update_features")
+    def _update_features(self, conn: duckdb.DuckDBPyConnection, source: str) -> None:
+        """
+        Fold the trades in `source` into market_features, like `_update_candles`:
+        every stored column is a count, sum or extreme, so new trades merge into
+        their buckets without rereading older ones. Counts, volumes and prices
+        live in candles only. Order flow is signed in outcome 0 terms: buying
+        outcome 0 or selling outcome 1 is positive net_flow.
+        """
+        # A trade counts in the first bin whose bound it is under
+        bins, lower = [], None
+        for column, upper in FEATURE_SIZE_BINS.items():
+            bounds = ([f"size >= {lower}"] if lower is not None else []) + ([f"size < {upper}"] if upper is not None else [])
+            bins.append(f"count(*) FILTER (WHERE {' AND '.join(bounds)}) AS {column}")
+            lower = upper
+        bins = ",\n".join(bins)
+        merge_bins = ",\n".join(f"{column} = {column} + EXCLUDED.{column}" for column in FEATURE_SIZE_BINS)
+        for resolution, width in CANDLE_RESOLUTIONS.items():
+            conn.execute(f"""
+                INSERT INTO market_features BY NAME
+                SELECT
+                    condition_id,
+                    '{resolution}' AS resolution,
+                    time_bucket(INTERVAL '{width}', timestamp) AS bucket,
+                    count(*) FILTER (WHERE side = 'BUY') AS buy_count,
+                    sum(CASE WHEN (side = 'BUY') = (outcome_index = 0) THEN size ELSE -size END) AS net_flow,
+                    sum(size * size) AS size_sum_sq,
+                    max(size) AS size_max,
+                    {bins}
+                FROM (
+                    SELECT condition_id, side, outcome_index, timestamp, size::DOUBLE AS size
+                    FROM {source}
+                )
+                GROUP BY condition_id, bucket
+                ON CONFLICT (condition_id, resolution, bucket) DO UPDATE SET
+                    buy_count = buy_count + EXCLUDED.buy_count,
+                    net_flow = net_flow + EXCLUDED.net_flow,
+                    size_sum_sq = size_sum_sq + EXCLUDED.size_sum_sq,
+                    size_max = greatest(size_max, EXCLUDED.size_max),
+                    {merge_bins}
+            """)
+
+
+def _window_clauses(start: Optional[int], end: Optional[int], column: str = "timestamp") -> tuple[list, list]:
+    """WHERE clauses, and their parameters, keeping `column` within [start, end) (unix seconds)"""
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{column} >= make_timestamp(?::BIGINT * 1000000)")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{column} < make_timestamp(?::BIGINT * 1000000)")
+        params.append(end)
+    return clauses, params
+
+
+def _wallet_markets_sql(resolutions: str, where: str, source: str = "trades") -> str:
+    """
+    Per (wallet, market) volume and realized PnL for the trades matching `where`.
+
+    Each outcome position is valued on its own: in a resolved market all cash
+    flows count and the shares still held pay out 1 if the outcome won; in an
+    open market only the shares sold count, against the average buy price.
+    """
+    return f"""
+        WITH positions AS (
+            SELECT
+                wallet,
+                condition_id,
+                outcome_index,
+                coalesce(sum(size::DOUBLE) FILTER (WHERE side = 'BUY'), 0) AS bought,
+                coalesce(sum(size::DOUBLE * price::DOUBLE) FILTER (WHERE side = 'BUY'), 0) AS cost,
+                coalesce(sum(size::DOUBLE) FILTER (WHERE side = 'SELL'), 0) AS sold,
+                coalesce(sum(size::DOUBLE * price::DOUBLE) FILTER (WHERE side = 'SELL'), 0) AS proceeds,
+                count(*) AS trades,
+                min(timestamp) AS first_trade,
+                max(timestamp) AS last_trade
+            FROM {source}
+            {where}
+            GROUP BY wallet, condition_id, outcome_index
+        )
+        SELECT
+            wallet,
+            condition_id,
+            any_value(r.outcome_index) IS NOT NULL AS resolved,
+            sum(cost + proceeds) AS volume,
+            sum(bought) AS bought,
+            sum(cost) AS cost,
+            sum(CASE
+                WHEN r.outcome_index IS NOT NULL THEN
+                    proceeds - cost + greatest(bought - sold, 0) * (p.outcome_index = r.outcome_index)::INTEGER
+                WHEN sold > 0 AND bought > 0 THEN
+                    least(sold, bought) * (proceeds / sold - cost / bought)
+                ELSE 0
+            END) AS realized_pnl,
+            sum(trades) AS trades,
+            min(first_trade) AS first_trade,
+            max(last_trade) AS last_trade
+        FROM positions p
+        LEFT JOIN {resolutions} r USING (condition_id)
+        GROUP BY wallet, condition_id
+    """
+
+
+def _wallet_stats_sql(resolutions: str, where: str, source: str = "trades") -> str:
+    """wallet_stats rows (without updated_at) for the trades in `source` matching `where`"""
+    return f"""
+        SELECT
+            wallet,
+            sum(trades) AS trades,
+            count(*) AS markets,
+            count(*) FILTER (WHERE resolved) AS resolved_markets,
+            count(*) FILTER (WHERE resolved AND realized_pnl > 0) AS wins,
+            count(*) FILTER (WHERE resolved AND realized_pnl > 0)
+                / nullif(count(*) FILTER (WHERE resolved), 0) AS win_rate,
+            sum(volume) AS volume,
+            sum(realized_pnl) AS realized_pnl,
+            sum(cost) / nullif(sum(bought), 0) AS avg_entry_price,
+            -- Herfindahl index of traded volume across markets: 1 = a single market
+            sum(volume * volume) / nullif(sum(volume) * sum(volume), 0) AS concentration,
+            max(volume) / nullif(sum(volume), 0) AS top_market_share,
+            min(first_trade) AS first_trade,
+            max(last_trade) AS last_trade
+        FROM ({_wallet_markets_sql(resolutions, where, source)})
+        GROUP BY wallet
+    """
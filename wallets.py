@@ -0,0 +1,97 @@
+from typing import Optional
+from cache import TradeCache
+from backfill import user_key
+from catalog import resolutions_sql, CATALOG_PATH
+import asyncio
+import logging
+
+logger = logging.getLogger("polymarket.wallets")
+
+
+class WalletProfiler:
+    """
+    Wallet analytics over stored trades: realized PnL, win rate on resolved
+    markets, average entry price and position concentration.
+
+    Every `interval` seconds the `crawl_top` wallets by traded notional have their
+    full trade history synced through the TradeCache (so every market they traded
+    is counted, not just the ones we track), then wallet_stats is recomputed for
+    every wallet in a single DuckDB statement. Market resolutions come from the
+    settled `outcomePrices` in the catalog.
+    """
+    def __init__(self, cache: TradeCache,
+                 catalog_root: str = CATALOG_PATH,
+                 interval: float = 3600.0,
+                 crawl_top: int = 500,
+                 concurrency: int = 4):
+        self.cache = cache
+        self.storage = cache.storage
+        self.catalog_root = catalog_root
+        self.interval = interval
+        self.crawl_top = crawl_top
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+        self.logger = logger
+
+    def start(self) -> None:
+        if self._task is None:
+            self.logger.info("Starting wallet profiler, crawling the top %s wallets", self.crawl_top)
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def profile(self, address: str, top_n: int = 10) -> Optional[dict]:
+        """Current statistics for one wallet, or None if it has no stored trades"""
+        return self.storage.get_wallet_profile(address.lower(), resolutions_sql(self.catalog_root), top_n=top_n)
+
+    def leaderboard(self, order_by: str = "realized_pnl", limit: int = 100, min_resolved: int = 0) -> list:
+        return self.storage.get_wallet_leaderboard(order_by=order_by, limit=limit, min_resolved=min_resolved)
+
+    async def crawl(self, addresses: list) -> int:
+        """
+        Sync the trade history of every wallet in `addresses` whose history is not fresh.
+
+        Returns:
+            int: The number of trades fetched.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def crawl_one(address: str) -> int:
+            async with semaphore:
+                state = await asyncio.to_thread(self.storage.get_sync_state, user_key(address))
+                if state is not None and self.cache.is_fresh(state):
+                    return 0
+                try:
+                    return await self.cache.refresh_user(address)
+                except Exception as e:
+                    self.logger.error("Error crawling wallet %s: %s", address, e)
+                    return 0
+
+        fetched = sum(await asyncio.gather(*(crawl_one(a) for a in addresses)))
+        self.logger.info("Crawled %s wallets, fetched %s trades", len(addresses), fetched)
+        return fetched
+
+    async def refresh(self, addresses: Optional[list] = None) -> None:
+        """Recompute wallet_stats for `addresses`, or for every wallet if None"""
+        resolutions = resolutions_sql(self.catalog_root)
+        await asyncio.to_thread(self.storage.refresh_wallet_stats, resolutions, addresses)
+        await asyncio.to_thread(self.storage.flush)
+        self.logger.info("Refreshed wallet stats for %s wallets",
+                         "all" if addresses is None else len(addresses))
+
+    async def run_once(self) -> None:
+        wallets = await asyncio.to_thread(self.storage.get_top_wallets, self.crawl_top)
+        await self.crawl(wallets)
+        await self.refresh()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.logger.error("Error profiling wallets: %s", e)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,104 @@
+from typing import Optional, Callable, Awaitable
+from datetime import datetime
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("polymarket.warmup")
+
+
+class Warmup:
+    """
+    Startup work run in the background once the process is serving, so that
+    liveness does not depend on how much data there is to load.
+
+    Each step runs a blocking function in a worker thread and records its state
+    (pending, running, done, failed or cancelled), duration and, if the step
+    reports it, progress. The process is ready once every `required` step is
+    done; the remaining steps only enrich what it serves.
+    """
+    def __init__(self, required: tuple = ()):
+        self.required = required
+        self.started_at = datetime.now()
+        self._steps: dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self.logger = logger
+
+    def start(self, run: Callable[[], Awaitable[None]]) -> None:
+        """Run the `run` coroutine function, which calls `step`, as a background task"""
+        if self._task is None:
+            self._task = asyncio.create_task(run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def step(self, name: str, func: Callable, *args,
+                   progress: Optional[Callable[[], int]] = None,
+                   total: Optional[int] = None,
+                   cancel: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Run `func(*args)` in a worker thread as step `name`.
+
+        Args:
+            progress: Returns the units of work done so far, polled by `status`.
+            total: The units of work expected, if known.
+            cancel: Asks `func` to stop; called if the warmup is cancelled, since
+                a running thread cannot be interrupted.
+
+        Returns:
+            bool: Whether the step succeeded. Failures are logged, not raised.
+        """
+        state = {"state": "running", "started": time.monotonic(), "seconds": None,
+                 "progress": progress, "total": total, "error": None}
+        self._steps[name] = state
+        self.logger.info("Warmup step %s started", name)
+        try:
+            await asyncio.to_thread(func, *args)
+        except asyncio.CancelledError:
+            state["state"] = "cancelled"
+            if cancel is not None:
+                cancel()
+            raise
+        except Exception as e:
+            state["state"] = "failed"
+            state["error"] = str(e)
+            self.logger.error("Warmup step %s failed: %s", name, e)
+            return False
+        else:
+            state["state"] = "done"
+            if self.ready:
+                self._ready.set()
+            return True
+        finally:
+            state["seconds"] = time.monotonic() - state["started"]
+            self.logger.info("Warmup step %s %s in %.2fs", name, state["state"], state["seconds"])
+
+    def is_done(self, name: str) -> bool:
+        return self._steps.get(name, {}).get("state") == "done"
+
+    @property
+    def ready(self) -> bool:
+        return all(self.is_done(name) for name in self.required)
+
+    async def wait(self) -> None:
+        """Return once every required step is done"""
+        await self._ready.wait()
+
+    def status(self) -> dict:
+        steps = {}
+        for name in self.required:
+            steps[name] = {"state": "pending"}
+        for name, state in self._steps.items():
+            steps[name] = {
+                "state": state["state"],
+                "seconds": round(state["seconds"] if state["seconds"] is not None
+                                 else time.monotonic() - state["started"], 3),
+                "progress": state["progress"]() if state["progress"] is not None else None,
+                "total": state["total"],
+                "error": state["error"],
+            }
+        return {"ready": self.ready, "started_at": self.started_at, "steps": steps}